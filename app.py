@@ -28,6 +28,10 @@ limiter = Limiter(
 def create_app(config_name=None):
     app = Flask(__name__)
     
+    # Fast JSON encoding for API responses
+    from services.serialization_service import FastJSONProvider
+    app.json = FastJSONProvider(app)
+    
     # Load configuration
     config_name = config_name or os.environ.get('FLASK_ENV', 'default')
     app.config.from_object(config[config_name])
@@ -46,6 +50,10 @@ def create_app(config_name=None):
         db.create_all()
         logging.info("Database tables created")
     
+    # Derive the API key encryption key once per worker at boot
+    from services.encryption_service import EncryptionService
+    EncryptionService.warm()
+    
     return app
 
 # Create the app instance
@@ -0,0 +1,48 @@
+"""Per-request crypto cost of EncryptionService before and after key caching.
+
+Run from the repository root:
+
+    python benchmarks/bench_encryption.py
+"""
+import os
+import sys
+import time
+import base64
+from cryptography.fernet import Fernet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.encryption_service import EncryptionService
+
+ITERATIONS = 50
+
+def per_request_uncached(token: str):
+    """Baseline: derive the key with PBKDF2 on every request"""
+    key = EncryptionService._derive_key(*EncryptionService._get_key_material())
+    cipher = Fernet(key)
+    cipher.decrypt(token.encode())
+
+def per_request_cached(token: str):
+    """Current: reuse the process-wide derived key and cipher"""
+    service = EncryptionService()
+    service.decrypt(token)
+
+def measure(fn, token: str) -> float:
+    """Average milliseconds per call"""
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn(token)
+    return (time.perf_counter() - start) * 1000 / ITERATIONS
+
+if __name__ == '__main__':
+    EncryptionService.warm()
+    stored = EncryptionService().encrypt('sk-or-v1-benchmark-key')
+    raw_token = base64.urlsafe_b64decode(stored.encode()).decode()
+    
+    uncached = measure(per_request_uncached, raw_token)
+    cached = measure(per_request_cached, stored)
+    
+    print(f"iterations:           {ITERATIONS}")
+    print(f"uncached per request: {uncached:8.3f} ms")
+    print(f"cached per request:   {cached:8.3f} ms")
+    print(f"speedup:              {uncached / cached:8.1f}x")
@@ -0,0 +1,83 @@
+"""Malicious-pattern scan cost on a 10MB upload: whole-file lowercase scan vs windowed scanner.
+
+Run from the repository root:
+
+    python benchmarks/bench_malware_scan.py
+"""
+import os
+import re
+import sys
+import time
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.malware_scanner import PatternScanner, DEFAULT_PATTERNS
+
+SIZE = 10 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+ITERATIONS = 5
+
+def legacy_scan(content: bytes) -> bool:
+    """Baseline: lowercase copy of the whole file, then one search per pattern"""
+    content_lower = content.lower()
+    for pattern in DEFAULT_PATTERNS:
+        if pattern in content_lower:
+            return True
+    return False
+
+def regex_scan(content: bytes) -> bool:
+    """Alternative considered: one combined case-insensitive regex"""
+    return combined_regex.search(content) is not None
+
+def windowed_scan(content: bytes) -> bool:
+    """Current: lowercase and search one cache-sized window at a time"""
+    return scanner.scan(content)
+
+def streaming_scan(content: bytes) -> bool:
+    """Current, as used by the upload inspector: chunked with boundary overlap"""
+    scan = scanner.stream()
+    view = memoryview(content)
+    for offset in range(0, len(content), CHUNK_SIZE):
+        if scan.feed(bytes(view[offset:offset + CHUNK_SIZE])):
+            return True
+    return False
+
+def peak_memory(fn, content: bytes) -> float:
+    """Peak extra megabytes allocated during one call"""
+    tracemalloc.start()
+    fn(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+def measure(fn, content: bytes) -> float:
+    """Average milliseconds per call"""
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn(content)
+    return (time.perf_counter() - start) * 1000 / ITERATIONS
+
+if __name__ == '__main__':
+    scanner = PatternScanner()
+    combined_regex = re.compile(b'|'.join(re.escape(p) for p in DEFAULT_PATTERNS), re.IGNORECASE)
+    
+    # Clean text is the worst case: every byte is examined
+    rng = random.Random(0)
+    words = [b'lorem', b'ipsum', b'Script', b'Document', b'window', b'evaluate', b'onLoad', b'java']
+    clean = b' '.join(rng.choice(words) for _ in range(SIZE // 6))[:SIZE]
+    infected = clean[:-64] + b'<SCRIPT>alert(1)</SCRIPT>'.ljust(64)
+    
+    for fn in (legacy_scan, regex_scan, windowed_scan, streaming_scan):
+        assert fn(clean) is False and fn(infected) is True, fn.__name__
+    
+    print(f"input size:      {len(clean) / (1024 * 1024):8.1f} MB")
+    print(f"iterations:      {ITERATIONS}")
+    for label, content in (('clean', clean), ('match at end', infected)):
+        legacy = measure(legacy_scan, content)
+        print(f"[{label}]")
+        print(f"  legacy:        {legacy:8.1f} ms  peak {peak_memory(legacy_scan, content):6.2f} MB")
+        for name, fn in (('regex', regex_scan), ('windowed', windowed_scan), ('streaming', streaming_scan)):
+            elapsed = measure(fn, content)
+            print(f"  {name + ':':<14} {elapsed:8.1f} ms  peak {peak_memory(fn, content):6.2f} MB  ({legacy / elapsed:.1f}x)")
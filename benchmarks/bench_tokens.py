@@ -0,0 +1,57 @@
+"""Token counting cost per chat request: heuristic estimate vs tiktoken, when installed.
+
+Run from the repository root:
+
+    python benchmarks/bench_tokens.py
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.token_counter import TokenCounter, estimate_tokens, TIKTOKEN_AVAILABLE
+
+ITERATIONS = 200
+
+def measure(fn, *args) -> float:
+    """Average microseconds per call"""
+    fn(*args)  # warm caches (tokenizer load, family lookup)
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn(*args)
+    return (time.perf_counter() - start) * 1_000_000 / ITERATIONS
+
+if __name__ == '__main__':
+    counter = TokenCounter()
+    rng = random.Random(0)
+    words = ['neon', 'grid', 'the', 'runner', 'protocol', 'encrypted', 'signal', 'of', 'city', 'rain']
+    
+    message = ' '.join(rng.choice(words) for _ in range(150))  # ~1000 characters, the message limit
+    history = [
+        {'role': 'user' if i % 2 == 0 else 'assistant', 'content': ' '.join(rng.choice(words) for _ in range(120))}
+        for i in range(40)  # CONTEXT_MAX_MESSAGES rows
+    ]
+    document = ' '.join(rng.choice(words) for _ in range(17000))[:100000]  # file_service text limit
+    cjk = '霓虹城市的雨夜里信号在加密网络中穿行' * 50
+    
+    print(f"tiktoken:        {'installed' if TIKTOKEN_AVAILABLE else 'not installed (heuristic only)'}")
+    print(f"iterations:      {ITERATIONS}")
+    
+    for model in ('anthropic/claude-3-haiku', 'openai/gpt-3.5-turbo'):
+        exact = counter._encoder(model) is not None
+        print(f"[{model}: {'tiktoken' if exact else 'heuristic'}]")
+        cases = (
+            ('message', counter.count, (message, model), counter.count(message, model)),
+            ('40-turn history', counter.count_messages, (history, model), counter.count_messages(history, model)),
+            ('100KB document', counter.count, (document, model), counter.count(document, model)),
+            ('truncate 100KB', counter.truncate, (document, 6000, model), None),
+            ('CJK text', counter.count, (cjk, model), counter.count(cjk, model))
+        )
+        for label, fn, args, tokens in cases:
+            suffix = f"  {tokens:6d} tokens" if tokens is not None else ""
+            print(f"  {label + ':':<17}{measure(fn, *args):10.1f} us{suffix}")
+    
+    print("[estimate_tokens]")
+    print(f"  {'100KB document:':<17}{measure(estimate_tokens, document):10.1f} us")
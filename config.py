@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 
 class Config:
@@ -25,6 +26,105 @@ class Config:
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB
     UPLOAD_FOLDER = 'uploads'
     ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg'}
+    UPLOAD_CHUNK_SIZE = 64 * 1024
+    UPLOAD_SPOOL_MEMORY = 512 * 1024  # larger uploads spool to a temp file
+    
+    # Background upload jobs
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+    JOB_STATUS_TIMEOUT = 3600  # seconds a finished job's status stays readable
+    # Without Redis, job status is kept in files every worker on the host can read
+    JOB_STATUS_DIR = os.environ.get('JOB_STATUS_DIR', os.path.join(tempfile.gettempdir(), 'cyberchat-jobs'))
+    
+    # Parallel PDF text extraction
+    PDF_EXTRACT_WORKERS = int(os.environ.get('PDF_EXTRACT_WORKERS', min(4, os.cpu_count() or 1)))
+    PDF_PAGES_PER_SHARD = 5
+    PDF_PAGE_TIMEOUT = 2  # seconds per page; a shard gets its page count times this
+    PDF_SHARD_ATTEMPTS = 3  # runs of a shard lost to pool restarts before its pages are skipped
+    
+    # Content-addressed cache of extractions and AI summaries
+    CONTENT_STORE_DIR = os.environ.get('CONTENT_STORE_DIR', os.path.join(tempfile.gettempdir(), 'cyberchat-content'))
+    CONTENT_STORE_MAX_BYTES = 256 * 1024 * 1024
+    
+    # Uploaded file bytes, named by content hash
+    BLOB_STORE_BACKEND = os.environ.get('BLOB_STORE_BACKEND', 'local')
+    BLOB_STORE_DIR = os.environ.get('BLOB_STORE_DIR', os.path.join(UPLOAD_FOLDER, 'blobs'))
+    BLOB_CACHE_MAX_AGE = 86400
+    
+    # WebP previews of uploaded images, rendered once per blob and width
+    THUMBNAIL_DIR = os.environ.get('THUMBNAIL_DIR', os.path.join(UPLOAD_FOLDER, 'thumbnails'))
+    THUMBNAIL_WIDTHS = (320, 640)
+    THUMBNAIL_DISPLAY_WIDTH = 320  # chat previews are at most 300px wide
+    THUMBNAIL_QUALITY = 80
+    THUMBNAIL_CACHE_MAX_AGE = 365 * 86400  # content-addressed, so safe to mark immutable
+    
+    # Images sent inline to the vision model are downscaled and re-encoded first
+    AI_IMAGE_MAX_EDGE = 1536  # pixels on the long edge
+    AI_IMAGE_MAX_BYTES = 768 * 1024
+    AI_IMAGE_QUALITY = 85
+    AI_IMAGE_MIN_QUALITY = 55
+    
+    # Conversation context sent with each chat request
+    CONTEXT_TOKEN_BUDGET = 3000  # prompt tokens for models not listed below
+    CONTEXT_MODEL_BUDGETS = {
+        'openai/gpt-3.5-turbo': 3000,
+        'openai/gpt-4': 6000,
+        'openai/gpt-4-turbo': 12000,
+        'anthropic/claude-3-haiku': 12000,
+        'anthropic/claude-3-sonnet': 12000,
+        'anthropic/claude-3-opus': 12000,
+        'google/gemini-pro': 8000,
+        'meta-llama/llama-2-70b-chat': 2500,
+        'mistralai/mixtral-8x7b-instruct': 8000,
+        'perplexity/llama-3-sonar-large-32k-online': 8000
+    }
+    CONTEXT_MAX_MESSAGES = 40  # recent rows considered per request
+    CONTEXT_SUMMARY_BATCH = 6  # overflowed messages that trigger a summary update
+    CONTEXT_SUMMARY_MAX_TOKENS = 400
+    CONTEXT_SUMMARY_MODEL = 'openai/gpt-3.5-turbo'
+    
+    # OpenRouter model catalog, refreshed in the background
+    DEFAULT_MODEL = 'openai/gpt-3.5-turbo'
+    MODEL_CATALOG_URL = 'https://openrouter.ai/api/v1/models'
+    MODEL_CATALOG_TTL = 3600
+    MODEL_CATALOG_RETRY_INTERVAL = 120  # seconds between attempts while fetches fail
+    MODEL_LIST_MAX_AGE = 300  # browser cache for /api/models; revalidated by ETag
+    
+    # Model context windows, in tokens, when the catalog does not report one
+    DEFAULT_CONTEXT_LIMIT = 4096
+    MODEL_CONTEXT_LIMITS = {
+        'openai/gpt-3.5-turbo': 16385,
+        'openai/gpt-4': 8192,
+        'openai/gpt-4-turbo': 128000,
+        'anthropic/claude-3-haiku': 200000,
+        'anthropic/claude-3-sonnet': 200000,
+        'anthropic/claude-3-opus': 200000,
+        'google/gemini-pro': 32768,
+        'meta-llama/llama-2-70b-chat': 4096,
+        'mistralai/mixtral-8x7b-instruct': 32768,
+        'perplexity/llama-3-sonar-large-32k-online': 28000
+    }
+    CHAT_MAX_OUTPUT_TOKENS = 1000
+    CHAT_MIN_OUTPUT_TOKENS = 256
+    FILE_CONTENT_MAX_TOKENS = 6000  # cap on file text sent for a summary, even on large windows
+    
+    # Identical concurrent chat completions share one upstream call
+    COALESCE_ENABLED = os.environ.get('COALESCE_ENABLED', 'true').lower() != 'false'
+    COALESCE_WAIT_TIMEOUT = 40  # seconds a waiter follows the leader before calling upstream itself
+    COALESCE_LOCK_TIMEOUT = 45
+    COALESCE_RESULT_TIMEOUT = 15  # how long a finished result stays readable for waiters in other workers
+    
+    # Near-duplicate prompt cache (MinHash/LSH); off unless enabled
+    SIMILARITY_CACHE_ENABLED = os.environ.get('SIMILARITY_CACHE_ENABLED', 'false').lower() == 'true'
+    SIMILARITY_CACHE_THRESHOLD = 0.8  # Jaccard similarity of prompt shingles needed for a hit
+    SIMILARITY_CACHE_MODEL_THRESHOLDS = {}  # per-model overrides, e.g. {'openai/gpt-4': 0.9}
+    SIMILARITY_CACHE_TIMEOUT = 3600
+    SIMILARITY_CACHE_MAX_ENTRIES = 5000  # per model, per worker
+    SIMILARITY_CACHE_MIN_SHINGLES = 3  # shorter prompts are too ambiguous to match
+    SIMILARITY_CACHE_PERMUTATIONS = 64
+    SIMILARITY_CACHE_BANDS = 16  # 16 bands of 4 rows: candidates from about 0.5 similarity
+    SIMILARITY_CACHE_AUDIT_RATE = 0.02  # share of hits answered upstream and compared
+    SIMILARITY_CACHE_AUDIT_MIN_AGREEMENT = 0.3  # word overlap below which a hit counts as false
+    SIMILARITY_CACHE_SYNC_INTERVAL = 60  # seconds between merges of other workers' entries
     
     # Security config
     WTF_CSRF_ENABLED = True
@@ -38,10 +138,34 @@ class Config:
     RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL', 'memory://')
     RATELIMIT_DEFAULT = "100 per hour"
     
+    # Message quotas for anonymous sessions
+    ANON_MESSAGE_LIMIT = 10
+    ANON_LIMIT_WINDOW = 300  # seconds
+    
     # API timeouts
     API_TIMEOUT = 30
     API_RETRY_ATTEMPTS = 3
+
+    # Pooled HTTP transport (per upstream host)
+    HTTP_CONNECT_TIMEOUT = 5
+    HTTP_POOL_DEFAULT_SIZE = 10
+    HTTP_POOL_SETTINGS = {
+        'openrouter.ai': {'pool_maxsize': 20, 'read_timeout': API_TIMEOUT},
+        'generativelanguage.googleapis.com': {'pool_maxsize': 10, 'read_timeout': API_TIMEOUT},
+        'api.duckduckgo.com': {'pool_maxsize': 10, 'connect_timeout': 3, 'read_timeout': API_TIMEOUT // 3}
+    }
     
+    # Async upstream gateway (one event loop thread per worker)
+    GATEWAY_MAX_IN_FLIGHT = int(os.environ.get('GATEWAY_MAX_IN_FLIGHT', 256))
+
+    # API key health registry
+    KEY_REGISTRY_REFRESH_INTERVAL = 60
+    KEY_PROBE_INTERVAL = 15
+    KEY_FAILURE_THRESHOLD = 3
+    KEY_AUTH_COOLDOWN = 600
+    KEY_RATE_LIMIT_COOLDOWN = 30
+    KEY_MAX_COOLDOWN = 1800
+
     # Logging config
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     
@@ -49,6 +173,21 @@ class Config:
     CACHE_TYPE = "redis" if os.environ.get('REDIS_URL') else "simple"
     CACHE_REDIS_URL = os.environ.get('REDIS_URL')
     CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_MEMORY_MAX_ENTRIES = 10000
+    CACHE_L1_ENABLED = True
+    CACHE_L1_MAX_ENTRIES = 1000
+    CACHE_L1_TIMEOUT = 30
+    CACHE_TAG_TIMEOUT = 86400
+    CACHE_COMPRESS_THRESHOLD = 1024  # bytes
+    CACHE_COMPRESSION = os.environ.get('CACHE_COMPRESSION', 'zlib')  # zlib or zstd
+    CACHE_STALE_TIMEOUT = 60  # serve stale values this long while one worker recomputes
+    CACHE_LOCK_TIMEOUT = 10
+    CACHE_EARLY_REFRESH_BETA = 1.0
+    
+    # Search result cache
+    SEARCH_CACHE_TIMEOUT = 1800
+    SEARCH_STALE_TIMEOUT = 3600  # serve old results this long while refreshing
+    SEARCH_NEGATIVE_TIMEOUT = 300
 
 class DevelopmentConfig(Config):
     DEBUG = True
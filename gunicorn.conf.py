@@ -0,0 +1,11 @@
+import os
+import multiprocessing
+
+# Threaded workers: request threads wait on the upstream gateway's event loop
+# instead of each pinning a whole sync worker for a 30 second AI call
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+keepalive = 5
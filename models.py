@@ -34,6 +34,25 @@ class User(UserMixin, db.Model):
             return self.email.split('@')[0]
         return f"User {self.id[:8]}"
     
+    @property
+    def display_name(self):
+        return self.get_display_name()
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'email': self.email,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'display_name': self.get_display_name(),
+            'profile_image_url': self.profile_image_url,
+            'role': self.role,
+            'is_creator': self.is_creator,
+            'daily_message_limit': self.daily_message_limit,
+            'messages_used_today': self.messages_used_today,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
     def can_send_message(self):
         today = datetime.utcnow().date()
         if self.last_message_date != today:
@@ -68,6 +87,24 @@ class APIKey(db.Model):
     
     def get_masked_key(self):
         return f"{'*' * 20}{self.encrypted_key[-4:]}" if len(self.encrypted_key) > 4 else "*" * 24
+    
+    @property
+    def masked_key(self):
+        return self.get_masked_key()
+    
+    def to_dict(self):
+        # Never include the encrypted key material
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'service': self.service,
+            'key_name': self.key_name,
+            'masked_key': self.get_masked_key(),
+            'is_active': self.is_active,
+            'is_default': self.is_default,
+            'last_used': self.last_used.isoformat() if self.last_used else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
 
 class ChatMessage(db.Model):
     __tablename__ = 'chat_messages'
@@ -78,6 +115,26 @@ class ChatMessage(db.Model):
     content = db.Column(db.Text, nullable=False)
     file_data = db.Column(db.JSON)  # Store file metadata if message includes files
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'type': self.message_type,
+            'content': self.content,
+            'timestamp': self.created_at.isoformat(),
+            'file_data': self.file_data
+        }
+
+class ConversationSummary(db.Model):
+    """Rolling summary of the turns that fell out of a conversation's context window"""
+    __tablename__ = 'conversation_summaries'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=True, unique=True)
+    session_id = db.Column(db.String, nullable=True)  # For anonymous users
+    summary = db.Column(db.Text, nullable=False, default='')
+    summarized_through_id = db.Column(db.Integer, nullable=False, default=0)  # Last chat_messages.id folded in
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class SystemSettings(db.Model):
     __tablename__ = 'system_settings'
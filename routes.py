@@ -1,7 +1,8 @@
 import os
+import json
 import uuid
 from datetime import datetime
-from flask import render_template, request, redirect, url_for, flash, session, jsonify, current_app
+from flask import render_template, request, redirect, url_for, flash, session, jsonify, current_app, Response, stream_with_context, send_file
 from flask_login import current_user
 from flask_wtf.csrf import generate_csrf
 from werkzeug.utils import secure_filename
@@ -11,15 +12,33 @@ from models import User, APIKey, ChatMessage, SystemSettings, UserModelPreferenc
 from auth import require_login, require_creator
 from services.ai_service import AIService
 from services.file_service import FileService
+from services.upload_inspector import upload_inspector
+from services.content_store import content_store
+from services.blob_store import blob_store
+from services.thumbnail_service import thumbnail_service
 from services.search_service import SearchService
 from services.encryption_service import EncryptionService
 from services.validation_service import ValidationService
 from services.cache_service import CacheService
+from services.quota_service import QuotaService
+from services.job_service import JobService, JobFailed
+from services.context_builder import ContextBuilder
+from services.http_service import http_service
+from services.upstream_gateway import upstream_gateway
+from services.key_registry import key_registry
+from services.model_catalog import model_catalog
+from services.request_coalescer import request_coalescer
+from services.similarity_cache import similarity_cache
 from middleware.security_middleware import validate_csrf_token, sanitize_input, log_security_event
 
 # Initialize services
 validation_service = ValidationService()
-cache_service = CacheService()
+with app.app_context():
+    cache_service = CacheService()
+    quota_service = QuotaService(cache_service)
+    search_service = SearchService(cache_service)
+    job_service = JobService(cache_service)
+    context_builder = ContextBuilder(job_service)
 
 # Make session permanent
 @app.before_request
@@ -41,24 +60,8 @@ def chat():
         if 'session_id' not in session:
             session['session_id'] = str(uuid.uuid4())
         
-        # Check anonymous message limit with caching
-        cache_key = f"anon_limit:{session['session_id']}"
-        cached_count = cache_service.get(cache_key)
-        
-        if cached_count is None:
-            try:
-                anonymous_messages = ChatMessage.query.filter_by(
-                    session_id=session['session_id'],
-                    user_id=None
-                ).count()
-                cache_service.set(cache_key, anonymous_messages, 300)  # Cache for 5 minutes
-            except Exception as e:
-                current_app.logger.error(f"Error checking anonymous message limit: {e}")
-                anonymous_messages = 0
-        else:
-            anonymous_messages = cached_count
-            
-        if anonymous_messages >= 10:  # Anonymous limit
+        # Check anonymous message limit
+        if quota_service.remaining(current_user, session['session_id']) == 0:
             flash('You have reached the message limit. Please sign in to continue.', 'warning')
             return redirect(url_for('index'))
     
@@ -76,9 +79,10 @@ def settings():
         if cached_data:
             api_keys, users = cached_data['api_keys'], cached_data['users']
         else:
-            api_keys = APIKey.query.filter_by(user_id=current_user.id).all()
-            users = User.query.all()
-            cache_service.set(cache_key, {'api_keys': api_keys, 'users': users}, 300)
+            # Cache plain DTOs, ORM rows cannot be serialized
+            api_keys = [key.to_dict() for key in APIKey.query.filter_by(user_id=current_user.id).all()]
+            users = [user.to_dict() for user in User.query.all()]
+            cache_service.set(cache_key, {'api_keys': api_keys, 'users': users}, 300, tags=[owner_tag(current_user.id, None)])
         
         return render_template('settings.html', api_keys=api_keys, users=users)
     except Exception as e:
@@ -102,7 +106,9 @@ def send_message():
             return jsonify({'error': validation_result['errors'][0]}), 400
         
         message = data.get('message', '').strip()
-        model = data.get('model', 'openai/gpt-3.5-turbo')
+        model = data.get('model', current_app.config['DEFAULT_MODEL'])
+        if not model_catalog.is_valid(model):
+            return jsonify({'error': f'Unknown model: {str(model)[:100]}'}), 400
         
         # Validate message content
         message_validation = validation_service.validate_string_input(message, 1000)
@@ -113,19 +119,9 @@ def send_message():
         user_id = current_user.id if current_user.is_authenticated else None
         session_id = session.get('session_id', str(uuid.uuid4()))
         
-        if current_user.is_authenticated:
-            if not current_user.can_send_message():
-                return jsonify({'error': 'Daily message limit reached'}), 429
-            current_user.increment_message_count()
-        else:
-            # Check anonymous limit with caching
-            cache_key = f"anon_limit:{session_id}"
-            anonymous_messages = cache_service.get(cache_key) or 0
-            
-            if anonymous_messages >= 10:
-                return jsonify({'error': 'Message limit reached. Please sign in to continue.'}), 429
-            
-            cache_service.set(cache_key, anonymous_messages + 1, 300)
+        allowed, _ = quota_service.consume(current_user, session_id)
+        if not allowed:
+            return jsonify({'error': quota_service.limit_error(current_user)}), 429
         
         # Save user message
         try:
@@ -142,10 +138,14 @@ def send_message():
             db.session.rollback()
             return jsonify({'error': 'Database error'}), 500
         
+        # Earlier turns, fitted to the model's token budget
+        history = context_builder.build(user_id, session_id, model, message, before_id=user_message.id)
+        
         # Get AI response
         try:
             ai_service = AIService()
-            response = ai_service.get_chat_response(message, user_id or session_id, model)
+            response = ai_service.get_chat_response(message, user_id or session_id, model, history=history,
+                                                   allow_similar=not history)
         except Exception as e:
             current_app.logger.error(f"Error getting AI response: {e}")
             response = "❌ Error getting AI response. Please try again."
@@ -164,6 +164,8 @@ def send_message():
             current_app.logger.error(f"Error saving AI message: {e}")
             db.session.rollback()
         
+        cache_service.delete(f"chat_history:{user_id or session_id}")
+        
         return jsonify({
             'response': response,
             'messages_remaining': get_messages_remaining()
@@ -173,91 +175,232 @@ def send_message():
         current_app.logger.error(f"Unexpected error in send_message: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/upload_file', methods=['POST'])
-@limiter.limit("10 per minute")
+@app.route('/api/send_message_stream', methods=['POST'])
+@limiter.limit("30 per minute")
 @validate_csrf_token()
-def upload_file():
+@sanitize_input()
+def send_message_stream():
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file uploaded'}), 400
-        
-        file = request.files['file']
+        data = request.get_json()
         
-        # Validate file upload
-        validation_result = validation_service.validate_file_upload(
-            file, current_app.config['ALLOWED_EXTENSIONS'], current_app.config['MAX_CONTENT_LENGTH']
+        # Validate request data
+        validation_result = validation_service.validate_api_request(
+            data, ['message']
         )
         if not validation_result['valid']:
             return jsonify({'error': validation_result['errors'][0]}), 400
         
+        message = data.get('message', '').strip()
+        model = data.get('model', current_app.config['DEFAULT_MODEL'])
+        if not model_catalog.is_valid(model):
+            return jsonify({'error': f'Unknown model: {str(model)[:100]}'}), 400
+        
+        # Validate message content
+        message_validation = validation_service.validate_string_input(message, 1000)
+        if not message_validation['valid']:
+            return jsonify({'error': message_validation['errors'][0]}), 400
+        
         # Check message limits
         user_id = current_user.id if current_user.is_authenticated else None
         session_id = session.get('session_id', str(uuid.uuid4()))
         
-        if current_user.is_authenticated:
-            if not current_user.can_send_message():
-                return jsonify({'error': 'Daily message limit reached'}), 429
-        else:
-            cache_key = f"anon_limit:{session_id}"
-            anonymous_messages = cache_service.get(cache_key) or 0
-            
-            if anonymous_messages >= 10:
-                return jsonify({'error': 'Message limit reached. Please sign in to continue.'}), 429
-        
-        file_service = FileService()
-        result = file_service.process_file(file)
-        
-        if 'error' in result:
-            return jsonify(result), 400
-        
-        # Get AI response for file
-        try:
-            ai_service = AIService()
-            response = ai_service.process_file_content(result, user_id or session_id)
-        except Exception as e:
-            current_app.logger.error(f"Error processing file with AI: {e}")
-            response = f"✅ File uploaded: {result['filename']}. Error processing with AI."
+        allowed, _ = quota_service.consume(current_user, session_id)
+        if not allowed:
+            return jsonify({'error': quota_service.limit_error(current_user)}), 429
         
-        # Save file message and AI response
+        # Save user message
         try:
-            file_message = ChatMessage(
+            user_message = ChatMessage(
                 user_id=user_id,
                 session_id=session_id,
                 message_type='user',
-                content=f"Uploaded file: {result['filename']}",
-                file_data=result
-            )
-            db.session.add(file_message)
-            
-            ai_message = ChatMessage(
-                user_id=user_id,
-                session_id=session_id,
-                message_type='assistant',
-                content=response
+                content=message
             )
-            db.session.add(ai_message)
+            db.session.add(user_message)
             db.session.commit()
         except Exception as e:
-            current_app.logger.error(f"Error saving file messages: {e}")
+            current_app.logger.error(f"Error saving user message: {e}")
             db.session.rollback()
+            return jsonify({'error': 'Database error'}), 500
         
-        if current_user.is_authenticated:
-            current_user.increment_message_count()
-        else:
-            cache_key = f"anon_limit:{session_id}"
-            count = cache_service.get(cache_key) or 0
-            cache_service.set(cache_key, count + 1, 300)
+        history = context_builder.build(user_id, session_id, model, message, before_id=user_message.id)
+        ai_service = AIService()
+        
+        def generate():
+            chunks = []
+            
+            # Forward deltas to the client as they arrive from upstream
+            try:
+                for delta in ai_service.stream_chat_response(message, user_id or session_id, model, history=history):
+                    chunks.append(delta)
+                    yield format_sse({'delta': delta})
+            except Exception as e:
+                current_app.logger.error(f"Error streaming AI response: {e}")
+                error_message = "❌ Error getting AI response. Please try again."
+                chunks.append(error_message)
+                yield format_sse({'delta': error_message})
+            
+            # Persist the full response once the stream completes
+            try:
+                ai_message = ChatMessage(
+                    user_id=user_id,
+                    session_id=session_id,
+                    message_type='assistant',
+                    content=''.join(chunks)
+                )
+                db.session.add(ai_message)
+                db.session.commit()
+            except Exception as e:
+                current_app.logger.error(f"Error saving AI message: {e}")
+                db.session.rollback()
+            
+            cache_service.delete(f"chat_history:{user_id or session_id}")
+            
+            yield format_sse({'messages_remaining': get_messages_remaining()}, event='done')
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+        
+    except Exception as e:
+        current_app.logger.error(f"Unexpected error in send_message_stream: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/upload_file', methods=['POST'])
+@limiter.limit("10 per minute")
+@validate_csrf_token()
+def upload_file():
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file uploaded'}), 400
+        
+        file = request.files['file']
+        
+        # Size, sniff, hash and scan in one pass; the bytes are spooled for the job
+        inspection = upload_inspector.inspect(
+            file, current_app.config['ALLOWED_EXTENSIONS'], current_app.config['MAX_CONTENT_LENGTH']
+        )
+        if not inspection.ok:
+            return jsonify({'error': inspection.error}), 400
+        
+        # Check message limits
+        user_id = current_user.id if current_user.is_authenticated else None
+        session_id = session.get('session_id', str(uuid.uuid4()))
+        
+        allowed, _ = quota_service.consume(current_user, session_id)
+        if not allowed:
+            inspection.close()
+            return jsonify({'error': quota_service.limit_error(current_user)}), 429
+        
+        messages_remaining = get_messages_remaining()
+        file_urls = {'url': url_for('download_file', digest=inspection.sha256)}
+        if inspection.extension in ('png', 'jpg', 'jpeg'):
+            file_urls['thumbnail_url'] = url_for(
+                'file_thumbnail', digest=inspection.sha256, width=current_app.config['THUMBNAIL_DISPLAY_WIDTH']
+            )
+        job_id = job_service.submit(
+            user_id or session_id, process_upload_job, inspection, file_urls, user_id, session_id,
+            filename=inspection.filename, messages_remaining=messages_remaining
+        )
         
         return jsonify({
-            'file_info': result,
-            'response': response,
-            'messages_remaining': get_messages_remaining()
-        })
+            'job_id': job_id,
+            'status_url': url_for('upload_status', job_id=job_id),
+            'messages_remaining': messages_remaining
+        }), 202
         
     except Exception as e:
         current_app.logger.error(f"Unexpected error in upload_file: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/upload_status/<job_id>')
+@limiter.limit("120 per minute")
+def upload_status(job_id):
+    try:
+        user_id = current_user.id if current_user.is_authenticated else None
+        owner = user_id or session.get('session_id')
+        # owner=None would skip the ownership check, so callers without one see nothing
+        job = job_service.get(job_id, owner=owner) if owner else None
+        if not job:
+            return jsonify({'error': 'Upload not found'}), 404
+        
+        return jsonify({k: v for k, v in job.items() if k != 'owner'})
+        
+    except Exception as e:
+        current_app.logger.error(f"Error getting upload status: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/files/<digest>')
+@limiter.limit("300 per minute")
+def download_file(digest):
+    try:
+        message = find_owned_file(digest)
+        if not message:
+            return jsonify({'error': 'File not found'}), 404
+        
+        file_data = message.file_data
+        path = blob_store.local_path(digest)
+        source = path if path else blob_store.open(digest)
+        
+        # conditional=True answers Range and If-None-Match requests
+        response = send_file(
+            source,
+            mimetype=file_data.get('content_type') or 'application/octet-stream',
+            download_name=file_data.get('filename'),
+            conditional=True,
+            etag=digest,
+            max_age=current_app.config['BLOB_CACHE_MAX_AGE']
+        )
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
+        
+    except (FileNotFoundError, ValueError):
+        return jsonify({'error': 'File not found'}), 404
+    except Exception as e:
+        current_app.logger.error(f"Error downloading file: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/files/<digest>/thumbnail/<int:width>')
+@limiter.limit("600 per minute")
+def file_thumbnail(digest, width):
+    try:
+        if width not in current_app.config['THUMBNAIL_WIDTHS']:
+            return jsonify({'error': 'Thumbnail not found'}), 404
+        
+        message = find_owned_file(digest)
+        if not message or message.file_data.get('type') != 'image':
+            return jsonify({'error': 'File not found'}), 404
+        
+        # Normally rendered at upload; older uploads get theirs on first request
+        path = thumbnail_service.ensure(digest, width, blob_store)
+        if not path:
+            return jsonify({'error': 'Thumbnail not found'}), 404
+        
+        # The URL names the content and the size, so the bytes behind it never change
+        response = send_file(
+            path,
+            mimetype='image/webp',
+            conditional=True,
+            etag=f"{digest}-{width}",
+            max_age=current_app.config['THUMBNAIL_CACHE_MAX_AGE']
+        )
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.immutable = True
+        return response
+        
+    except ValueError:
+        return jsonify({'error': 'Thumbnail not found'}), 404
+    except Exception as e:
+        current_app.logger.error(f"Error serving thumbnail: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/search', methods=['POST'])
 @limiter.limit("20 per minute")
 @validate_csrf_token()
@@ -281,33 +424,16 @@ def search():
         user_id = current_user.id if current_user.is_authenticated else None
         session_id = session.get('session_id', str(uuid.uuid4()))
         
-        if current_user.is_authenticated:
-            if not current_user.can_send_message():
-                return jsonify({'error': 'Daily message limit reached'}), 429
-            current_user.increment_message_count()
-        else:
-            cache_key = f"anon_limit:{session_id}"
-            anonymous_messages = cache_service.get(cache_key) or 0
-            
-            if anonymous_messages >= 10:
-                return jsonify({'error': 'Message limit reached. Please sign in to continue.'}), 429
-            
-            cache_service.set(cache_key, anonymous_messages + 1, 300)
-        
-        # Check cache for search results
-        search_cache_key = f"search:{hash(query)}"
-        cached_results = cache_service.get(search_cache_key)
+        allowed, _ = quota_service.consume(current_user, session_id)
+        if not allowed:
+            return jsonify({'error': quota_service.limit_error(current_user)}), 429
         
-        if cached_results:
-            results = cached_results
-        else:
-            try:
-                search_service = SearchService()
-                results = search_service.search(query)
-                cache_service.set(search_cache_key, results, 1800)  # Cache for 30 minutes
-            except Exception as e:
-                current_app.logger.error(f"Error performing search: {e}")
-                results = f"❌ Search error: Service temporarily unavailable"
+        # Results are cached inside SearchService
+        try:
+            results = search_service.search(query)
+        except Exception as e:
+            current_app.logger.error(f"Error performing search: {e}")
+            results = f"❌ Search error: Service temporarily unavailable"
         
         # Save search message and results
         try:
@@ -331,6 +457,8 @@ def search():
             current_app.logger.error(f"Error saving search messages: {e}")
             db.session.rollback()
         
+        cache_service.delete(f"chat_history:{user_id or session_id}")
+        
         return jsonify({
             'results': results,
             'messages_remaining': get_messages_remaining()
@@ -392,8 +520,9 @@ def save_api_key():
         
         db.session.commit()
         
-        # Clear settings cache
+        # Clear settings cache and reload keys into the registry
         cache_service.delete(f"settings:{current_user.id}")
+        key_registry.invalidate()
         
         return jsonify({'success': True})
         
@@ -424,8 +553,9 @@ def delete_api_key():
         db.session.delete(api_key)
         db.session.commit()
         
-        # Clear settings cache
+        # Clear settings cache and reload keys into the registry
         cache_service.delete(f"settings:{current_user.id}")
+        key_registry.invalidate()
         
         return jsonify({'success': True})
         
@@ -446,7 +576,9 @@ def save_model_preference():
         if not validation_result['valid']:
             return jsonify({'error': validation_result['errors'][0]}), 400
         
-        model = data.get('model', 'openai/gpt-3.5-turbo')
+        model = data.get('model', current_app.config['DEFAULT_MODEL'])
+        if not model_catalog.is_valid(model):
+            return jsonify({'error': f'Unknown model: {str(model)[:100]}'}), 400
         
         user_id = current_user.id if current_user.is_authenticated else None
         session_id = session.get('session_id') if not current_user.is_authenticated else None
@@ -469,6 +601,7 @@ def save_model_preference():
                 db.session.add(preference)
         
         db.session.commit()
+        cache_service.delete(f"model_pref:{user_id or session_id}")
         return jsonify({'success': True})
         
     except Exception as e:
@@ -476,6 +609,22 @@ def save_model_preference():
         db.session.rollback()
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/models')
+@limiter.limit("60 per minute")
+def list_models():
+    try:
+        # Pre-serialized on each catalog refresh; unchanged lists revalidate with a 304
+        body, etag = model_catalog.listing()
+        response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['MODEL_LIST_MAX_AGE']
+        return response.make_conditional(request)
+        
+    except Exception as e:
+        current_app.logger.error(f"Error listing models: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/get_model_preference')
 @limiter.limit("60 per minute")
 def get_model_preference():
@@ -497,8 +646,8 @@ def get_model_preference():
             else:
                 preference = None
             
-            model = preference.preferred_model if preference else 'openai/gpt-3.5-turbo'
-            cache_service.set(cache_key, model, 3600)  # Cache for 1 hour
+            model = preference.preferred_model if preference else current_app.config['DEFAULT_MODEL']
+            cache_service.set(cache_key, model, 3600, tags=[owner_tag(user_id, session_id)])  # Cache for 1 hour
         
         return jsonify({'model': model})
         
@@ -557,8 +706,10 @@ def manage_user():
             db.session.delete(user)
             db.session.commit()
             
-            # Clear settings cache
+            # Clear settings cache, the user's cached data and their keys in the registry
             cache_service.delete(f"settings:{current_user.id}")
+            cache_service.invalidate_tag(owner_tag(user_id, None))
+            key_registry.invalidate()
             
             return jsonify({'success': True})
         
@@ -577,13 +728,7 @@ def get_chat_history():
         user_id = current_user.id if current_user.is_authenticated else None
         session_id = session.get('session_id')
         
-        # Use caching for chat history
-        cache_key = f"chat_history:{user_id or session_id}"
-        cached_history = cache_service.get(cache_key)
-        
-        if cached_history:
-            message_data = cached_history
-        else:
+        def load_history():
             if user_id:
                 messages = ChatMessage.query.filter_by(user_id=user_id).order_by(ChatMessage.created_at.desc()).limit(50).all()
             elif session_id:
@@ -591,16 +736,15 @@ def get_chat_history():
             else:
                 messages = []
             
-            message_data = []
-            for msg in reversed(messages):
-                message_data.append({
-                    'type': msg.message_type,
-                    'content': msg.content,
-                    'timestamp': msg.created_at.isoformat(),
-                    'file_data': msg.file_data
-                })
-            
-            cache_service.set(cache_key, message_data, 300)  # Cache for 5 minutes
+            return [msg.to_dict() for msg in reversed(messages)]
+        
+        # Use caching for chat history, recomputed once per expiry
+        message_data = cache_service.get_or_compute(
+            f"chat_history:{user_id or session_id}",
+            load_history,
+            300,  # Cache for 5 minutes
+            tags=[owner_tag(user_id, session_id)]
+        )
         
         return jsonify({
             'messages': message_data,
@@ -623,15 +767,16 @@ def clear_chat():
             ChatMessage.query.filter_by(user_id=user_id).delete()
         elif session_id:
             ChatMessage.query.filter_by(session_id=session_id, user_id=None).delete()
+        if user_id or session_id:
+            context_builder.clear(user_id, session_id)
         
         db.session.commit()
         
-        # Clear related caches
-        cache_key = f"chat_history:{user_id or session_id}"
-        cache_service.delete(cache_key)
+        # Clear related caches and the anonymous session's quota
+        cache_service.invalidate_tag(owner_tag(user_id, session_id))
         
         if not user_id and session_id:
-            cache_service.delete(f"anon_limit:{session_id}")
+            quota_service.reset(session_id)
         
         return jsonify({'success': True})
         
@@ -640,19 +785,123 @@ def clear_chat():
         db.session.rollback()
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/admin/stats')
+@require_login
+@require_creator
+def admin_stats():
+    try:
+        return jsonify({
+            'cache': cache_service.get_stats(),
+            'http_pools': http_service.get_pool_stats(),
+            'upstream_gateway': upstream_gateway.get_stats(),
+            'content_store': content_store.get_stats(),
+            'model_catalog': model_catalog.get_stats(),
+            'request_coalescing': request_coalescer.get_stats(),
+            'similarity_cache': similarity_cache.get_stats(),
+            'api_keys': key_registry.get_stats()
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f"Error getting runtime stats: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def process_upload_job(job_id, inspection, file_urls, user_id, session_id):
+    """Extract, analyze and save an inspected upload (runs on the job pool)"""
+    job_service.update(job_id, status='processing', progress=10)
+    
+    file_service = FileService()
+    blob_stored = False
+    try:
+        result = file_service.process_inspection(inspection)
+        if 'error' not in result:
+            try:
+                blob_store.put(inspection.sha256, inspection.stream())
+                blob_stored = True
+            except Exception as e:
+                current_app.logger.error(f"Error storing upload blob: {e}")
+            if blob_stored and result.get('type') == 'image':
+                try:
+                    thumbnail_service.generate(inspection.sha256, inspection.stream())
+                except Exception as e:
+                    # Not fatal: the thumbnail endpoint renders missing sizes from the blob
+                    current_app.logger.error(f"Error generating thumbnails: {e}")
+    finally:
+        inspection.close()
+    
+    if 'error' in result:
+        # Rejected uploads do not count against the quota
+        quota_service.refund_owner(user_id, session_id)
+        remaining = (job_service.get(job_id) or {}).get('messages_remaining', 0)
+        raise JobFailed(result['error'], messages_remaining=remaining + 1 if remaining != -1 else -1)
+    
+    # Get AI response for file
+    job_service.update(job_id, status='analyzing', progress=50)
+    try:
+        ai_service = AIService()
+        response = ai_service.process_file_content(result, user_id or session_id)
+    except Exception as e:
+        current_app.logger.error(f"Error processing file with AI: {e}")
+        response = f"✅ File uploaded: {result['filename']}. Error processing with AI."
+    
+    # Save file message and AI response; file_data only references the blob
+    job_service.update(job_id, status='saving', progress=90)
+    file_data = file_service.file_reference(result)
+    if blob_stored:
+        file_data.update(file_urls)
+    else:
+        # Never point a message at a blob that was not written
+        file_data.pop('blob', None)
+    try:
+        file_message = ChatMessage(
+            user_id=user_id,
+            session_id=session_id,
+            message_type='user',
+            content=f"Uploaded file: {result['filename']}",
+            file_data=file_data
+        )
+        db.session.add(file_message)
+        
+        ai_message = ChatMessage(
+            user_id=user_id,
+            session_id=session_id,
+            message_type='assistant',
+            content=response
+        )
+        db.session.add(ai_message)
+        db.session.commit()
+    except Exception as e:
+        current_app.logger.error(f"Error saving file messages: {e}")
+        db.session.rollback()
+    
+    cache_service.delete(f"chat_history:{user_id or session_id}")
+    
+    return {
+        'file_info': file_data,
+        'response': response
+    }
+
+def find_owned_file(digest):
+    """A message referencing a blob, if it belongs to the current user or session"""
+    user_id = current_user.id if current_user.is_authenticated else None
+    query = ChatMessage.query.filter(ChatMessage.file_data['blob'].as_string() == digest)
+    if user_id:
+        query = query.filter(ChatMessage.user_id == user_id)
+    else:
+        query = query.filter(ChatMessage.session_id == session.get('session_id'), ChatMessage.user_id.is_(None))
+    return query.first()
+
+def owner_tag(user_id, session_id):
+    """Cache tag grouping every entry that belongs to a user or anonymous session"""
+    return f"user:{user_id}" if user_id else f"session:{session_id}"
+
+def format_sse(data, event=None):
+    """Format a payload as a Server-Sent Events frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
 def get_messages_remaining():
     try:
-        if current_user.is_authenticated:
-            if current_user.role == 'vip' or current_user.is_creator:
-                return -1  # Unlimited
-            return max(0, current_user.daily_message_limit - current_user.messages_used_today)
-        else:
-            session_id = session.get('session_id')
-            if session_id:
-                cache_key = f"anon_limit:{session_id}"
-                used = cache_service.get(cache_key) or 0
-                return max(0, 10 - used)
-            return 10
+        return quota_service.remaining(current_user, session.get('session_id'))
     except Exception as e:
         current_app.logger.error(f"Error getting messages remaining: {e}")
         return 0
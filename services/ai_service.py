@@ -1,75 +1,45 @@
-import os
+import base64
 import logging
 import requests
 import json
-import time
-from typing import Optional, Dict, Any
-from models import APIKey, User
-from services.encryption_service import EncryptionService
-from app import db
+from typing import Optional, Dict, Any, Iterator, List
+from config import Config
+from services.http_service import http_service
+from services.upstream_gateway import upstream_gateway
+from services.content_store import content_store
+from services.key_registry import key_registry
+from services.image_preprocessor import image_preprocessor
+from services.token_counter import token_counter, MESSAGE_OVERHEAD
+from services.request_coalescer import request_coalescer
+from services.similarity_cache import similarity_cache
+
+# Responses starting with these are errors and must never be cached
+ERROR_PREFIXES = ('❌', '⏳', 'Error describing image', 'Could not generate image description', 'No Google AI API key')
+
+SYSTEM_PROMPT = "You are CyberChat AI, a cyberpunk-themed AI assistant. You're helpful, knowledgeable, and have a slight edge with cyberpunk flair. Keep responses concise but informative."
 
 class AIService:
     def __init__(self):
-        self.encryption_service = EncryptionService()
         self.openrouter_base_url = "https://openrouter.ai/api/v1"
         self.google_ai_base_url = "https://generativelanguage.googleapis.com/v1beta"
     
     def get_active_openrouter_key(self, user_id: Optional[str] = None) -> Optional[str]:
         """Get an active OpenRouter API key, with rotation on failure"""
-        try:
-            # Get all active OpenRouter keys
-            keys = APIKey.query.filter_by(service='openrouter', is_active=True).all()
-            
-            if not keys:
-                return None
-            
-            # Try each key with rotation
-            for key in keys:
-                try:
-                    decrypted_key = self.encryption_service.decrypt(key.encrypted_key)
-                    # Test the key with a simple request
-                    if self._test_openrouter_key(decrypted_key):
-                        key.last_used = db.func.now()
-                        db.session.commit()
-                        return decrypted_key
-                except Exception as e:
-                    logging.warning(f"OpenRouter key {key.key_name} failed: {e}")
-                    continue
-            
-            return None
-        except Exception as e:
-            logging.error(f"Error getting OpenRouter key: {e}")
-            return None
+        key = key_registry.acquire('openrouter')
+        return key.api_key if key else None
     
     def get_active_google_ai_key(self) -> Optional[str]:
         """Get an active Google AI API key"""
-        try:
-            key = APIKey.query.filter_by(service='google_ai', is_active=True).first()
-            if key:
-                return self.encryption_service.decrypt(key.encrypted_key)
-            return None
-        except Exception as e:
-            logging.error(f"Error getting Google AI key: {e}")
-            return None
+        key = key_registry.acquire('google_ai')
+        return key.api_key if key else None
     
-    def _test_openrouter_key(self, api_key: str) -> bool:
-        """Test if an OpenRouter API key is valid"""
-        try:
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.get(
-                f"{self.openrouter_base_url}/models",
-                headers=headers,
-                timeout=10
-            )
-            
-            return response.status_code == 200
-        except Exception as e:
-            logging.warning(f"Error testing OpenRouter key: {e}")
-            return False
+    def _no_key_message(self, service: str) -> str:
+        """Explain why no key could be selected for a service"""
+        if key_registry.has_keys(service):
+            return "⏳ All API keys are cooling down after upstream errors. Please try again in a moment."
+        if service == 'google_ai':
+            return "No Google AI API key configured for image description."
+        return "❌ No active OpenRouter API key found. Please configure API keys in settings."
     
     def get_user_preferred_model(self, user_id: Optional[str] = None, session_id: Optional[str] = None) -> str:
         """Get user's preferred model or default"""
@@ -83,58 +53,127 @@ class AIService:
             else:
                 preference = None
                 
-            return preference.preferred_model if preference else "openai/gpt-3.5-turbo"
+            return preference.preferred_model if preference else Config.DEFAULT_MODEL
         except Exception as e:
             logging.error(f"Error getting user preferred model: {e}")
-            return "openai/gpt-3.5-turbo"
+            return Config.DEFAULT_MODEL
     
-    def get_chat_response(self, message: str, user_context: str, model: Optional[str] = None) -> str:
-        """Get AI chat response using OpenRouter"""
-        api_key = self.get_active_openrouter_key()
-        if not api_key:
-            return "❌ No active OpenRouter API key found. Please configure API keys in settings."
+    def _resolve_model(self, user_context: str, model: Optional[str] = None) -> str:
+        """Resolve the model to use from the request or the user's preference"""
+        if model:
+            return model
         
-        # Use provided model or get user preference
-        if not model:
-            # Extract user_id or session_id from user_context for model preference
-            if user_context and user_context.replace('-', '').replace('_', '').isalnum():
-                if len(user_context) < 20:  # Likely a user ID
-                    model = self.get_user_preferred_model(user_id=user_context)
-                else:  # Likely a session ID
-                    model = self.get_user_preferred_model(session_id=user_context)
-            else:
-                model = self.get_user_preferred_model()
+        # Extract user_id or session_id from user_context for model preference
+        if user_context and user_context.replace('-', '').replace('_', '').isalnum():
+            if len(user_context) < 20:  # Likely a user ID
+                return self.get_user_preferred_model(user_id=user_context)
+            else:  # Likely a session ID
+                return self.get_user_preferred_model(session_id=user_context)
+        return self.get_user_preferred_model()
+    
+    def _chat_headers(self, api_key: str) -> Dict[str, str]:
+        """Headers for an OpenRouter request made with api_key"""
+        return {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://cyberchat-ai.replit.app",
+            "X-Title": "CyberChat AI"
+        }
+    
+    def _build_chat_payload(self, message: str, model: str, stream: bool = False,
+                            history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """Build the payload for an OpenRouter chat completion
         
-        try:
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://cyberchat-ai.replit.app",
-                "X-Title": "CyberChat AI"
-            }
-            
-            data = {
-                "model": model,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are CyberChat AI, a cyberpunk-themed AI assistant. You're helpful, knowledgeable, and have a slight edge with cyberpunk flair. Keep responses concise but informative."
-                    },
-                    {
-                        "role": "user",
-                        "content": message
-                    }
-                ],
-                "max_tokens": 1000,
-                "temperature": 0.7
+        history is the earlier conversation from the context builder, already
+        fitted to the model's token budget; it goes between the system prompt
+        and the new message.
+        """
+        messages = [
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            },
+            *(history or []),
+            {
+                "role": "user",
+                "content": message
             }
+        ]
+        
+        data = {
+            "model": model,
+            "messages": messages,
+            # Full-size reply unless the prompt leaves less of the model's window
+            "max_tokens": token_counter.output_budget(model, token_counter.count_messages(messages, model)),
+            "temperature": 0.7
+        }
+        
+        if stream:
+            data["stream"] = True
+        
+        return data
+    
+    def _error_for_status(self, response: Any) -> str:
+        """Map a non-200 OpenRouter response to a user-facing message"""
+        if response.status_code == 401:
+            return "❌ API key authentication failed. Please check your OpenRouter API key."
+        elif response.status_code == 429:
+            # The key registry cools this key down; never sleep in the request
+            return "⏳ Rate limit reached. Please try again in a moment."
+        else:
+            error_text = response.text[:200] if response.text else "Unknown error"
+            return f"❌ AI service error: {response.status_code} - {error_text}"
+    
+    def get_chat_response(self, message: str, user_context: str, model: Optional[str] = None,
+                          history: Optional[List[Dict[str, str]]] = None, allow_similar: bool = False) -> str:
+        """Get AI chat response using OpenRouter
+        
+        Identical requests in flight at the same moment (same model, messages,
+        temperature and max_tokens) share a single upstream completion. With
+        allow_similar, a paraphrase of an earlier prompt to the same model may be
+        answered from the similarity cache; only pass it for self-contained
+        prompts, since the cache does not see history.
+        """
+        model = self._resolve_model(user_context, model)
+        
+        cached = similarity_cache.lookup(model, message) if allow_similar else None
+        if cached is not None and not similarity_cache.should_audit():
+            return cached.response
+        
+        try:
+            data = self._build_chat_payload(message, model, history=history)
+            coalesce_key = request_coalescer.key(model, data['messages'], data['temperature'], data['max_tokens'])
             
-            response = requests.post(
+            # Only the caller that goes upstream takes a key: a follower handed the
+            # shared result would never report it, leaving a half-open key blocked
+            response = request_coalescer.run(
+                coalesce_key,
+                lambda: self._send_chat_request(data),
+                shareable=lambda response: not self._is_error_response(response)
+            )
+            if allow_similar and not self._is_error_response(response):
+                if cached is not None:
+                    similarity_cache.audit(model, cached, response)
+                else:
+                    similarity_cache.store(model, message, response)
+            return response
+        except Exception as e:
+            logging.error(f"OpenRouter API error: {e}")
+            return f"❌ An error occurred: {str(e)}"
+    
+    def _send_chat_request(self, data: Dict[str, Any]) -> str:
+        """POST one chat completion on a fresh key and map the outcome to response text"""
+        key = key_registry.acquire('openrouter')
+        if not key:
+            return self._no_key_message('openrouter')
+        
+        try:
+            response = upstream_gateway.post(
                 f"{self.openrouter_base_url}/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=30
+                headers=self._chat_headers(key.api_key),
+                json=data
             )
+            key_registry.report(key, response.status_code, response.headers.get('Retry-After'))
             
             if response.status_code == 200:
                 result = response.json()
@@ -142,40 +181,91 @@ class AIService:
                     return result['choices'][0]['message']['content']
                 else:
                     return "❌ Unexpected response format from AI service."
-            elif response.status_code == 401:
-                return "❌ API key authentication failed. Please check your OpenRouter API key."
-            elif response.status_code == 429:
-                # Rate limited, try with delay
-                time.sleep(0.75)
-                return "⏳ Rate limit reached. Please try again in a moment."
             else:
-                error_text = response.text[:200] if response.text else "Unknown error"
-                return f"❌ AI service error: {response.status_code} - {error_text}"
+                return self._error_for_status(response)
                 
         except requests.exceptions.Timeout:
+            key_registry.report(key, None)
             return "⏳ Request timed out. Please try again."
         except Exception as e:
+            key_registry.report(key, None)
             logging.error(f"OpenRouter API error: {e}")
             return f"❌ An error occurred: {str(e)}"
     
-    def describe_image(self, image_data: bytes, filename: str) -> str:
-        """Describe an image using Google AI"""
-        api_key = self.get_active_google_ai_key()
-        if not api_key:
-            return "No Google AI API key configured for image description."
+    def stream_chat_response(self, message: str, user_context: str, model: Optional[str] = None,
+                             history: Optional[List[Dict[str, str]]] = None) -> Iterator[str]:
+        """Stream AI chat response deltas from OpenRouter as they arrive"""
+        key = key_registry.acquire('openrouter')
+        if not key:
+            yield self._no_key_message('openrouter')
+            return
+        
+        model = self._resolve_model(user_context, model)
         
         try:
-            import base64
+            data = self._build_chat_payload(message, model, stream=True, history=history)
             
-            # Convert image to base64
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            
-            # Determine mime type
-            mime_type = "image/jpeg"
-            if filename.lower().endswith('.png'):
-                mime_type = "image/png"
+            with http_service.post(
+                f"{self.openrouter_base_url}/chat/completions",
+                headers=self._chat_headers(key.api_key),
+                json=data,
+                stream=True
+            ) as response:
+                key_registry.report(key, response.status_code, response.headers.get('Retry-After'))
+                if response.status_code != 200:
+                    yield self._error_for_status(response)
+                    return
+                
+                response.encoding = 'utf-8'
+                for line in response.iter_lines(decode_unicode=True):
+                    # Skip keep-alive comments and blank separators
+                    if not line or not line.startswith('data:'):
+                        continue
+                    
+                    payload = line[len('data:'):].strip()
+                    if payload == '[DONE]':
+                        break
+                    
+                    try:
+                        chunk = json.loads(payload)
+                    except ValueError:
+                        logging.warning(f"Skipping malformed stream chunk: {payload[:100]}")
+                        continue
+                    
+                    if 'error' in chunk:
+                        yield f"❌ AI service error: {chunk['error'].get('message', 'Unknown error')}"
+                        return
+                    
+                    choices = chunk.get('choices') or []
+                    if choices:
+                        delta = choices[0].get('delta', {}).get('content')
+                        if delta:
+                            yield delta
+                
+        except requests.exceptions.Timeout:
+            key_registry.report(key, None)
+            yield "⏳ Request timed out. Please try again."
+        except Exception as e:
+            key_registry.report(key, None)
+            logging.error(f"OpenRouter streaming error: {e}")
+            yield f"❌ An error occurred: {str(e)}"
+    
+    def describe_image(self, image_data: bytes, filename: str, digest: Optional[str] = None) -> str:
+        """Describe an image using Google AI"""
+        key = key_registry.acquire('google_ai')
+        if not key:
+            return self._no_key_message('google_ai')
+        
+        try:
+            # Downscaled, metadata-free JPEG instead of the raw upload
+            try:
+                mime_type, image_base64 = image_preprocessor.prepare(image_data, digest)
+            except Exception as e:
+                logging.warning(f"Image preprocessing failed for {filename}, sending original: {e}")
+                image_base64 = base64.b64encode(image_data).decode('utf-8')
+                mime_type = "image/png" if filename.lower().endswith('.png') else "image/jpeg"
             
-            url = f"{self.google_ai_base_url}/models/gemini-1.5-flash:generateContent?key={api_key}"
+            url = f"{self.google_ai_base_url}/models/gemini-1.5-flash:generateContent?key={key.api_key}"
             
             data = {
                 "contents": [{
@@ -193,7 +283,8 @@ class AIService:
             
             headers = {"Content-Type": "application/json"}
             
-            response = requests.post(url, headers=headers, json=data, timeout=30)
+            response = upstream_gateway.post(url, headers=headers, json=data)
+            key_registry.report(key, response.status_code, response.headers.get('Retry-After'))
             
             if response.status_code == 200:
                 result = response.json()
@@ -206,32 +297,61 @@ class AIService:
                 return "Error describing image."
                 
         except Exception as e:
+            key_registry.report(key, None)
             logging.error(f"Image description error: {e}")
             return f"Error describing image: {str(e)}"
     
+    def _is_error_response(self, text: str) -> bool:
+        """Whether a response string is one of our error/cooldown messages"""
+        return not text or text.startswith(ERROR_PREFIXES)
+    
+    def _fit_file_content(self, content: str, framing: str, model: str) -> str:
+        """Truncate file text to what the model's window leaves after the prompt and reply"""
+        overhead = token_counter.count(SYSTEM_PROMPT, model) + token_counter.count(framing, model) + 3 * MESSAGE_OVERHEAD
+        budget = min(Config.FILE_CONTENT_MAX_TOKENS, token_counter.prompt_budget(model) - overhead)
+        return token_counter.truncate(content, budget, model)
+    
     def process_file_content(self, file_data: Dict[str, Any], user_context: str) -> str:
-        """Process file content and get AI response"""
+        """Process file content and get AI response, reusing results for identical uploads"""
         try:
+            if file_data['type'] not in ('image', 'text', 'pdf'):
+                return f"✅ File uploaded: {file_data['filename']}. File type processing not yet supported."
+            
+            digest = file_data.get('sha256')
+            model = self._resolve_model(user_context)
+            cached = content_store.get(f"summary:{model}", digest)
+            if cached is not None:
+                return cached
+            
+            cacheable = True
             if file_data['type'] == 'image':
-                # First describe the image
-                description = self.describe_image(file_data['content'], file_data['filename'])
+                # First describe the image (the description does not depend on the chat model)
+                description = content_store.get('describe', digest)
+                if description is None:
+                    description = self.describe_image(file_data['content'], file_data['filename'], digest)
+                    if self._is_error_response(description):
+                        # A summary built on a failed description must be retried next time
+                        cacheable = False
+                    else:
+                        content_store.set('describe', digest, description)
                 
                 # Then get AI response about the image
                 prompt = f"I've uploaded an image: {file_data['filename']}\n\nImage description: {description}\n\nCan you tell me more about this image and what you observe?"
-                return self.get_chat_response(prompt, user_context)
             
             elif file_data['type'] == 'text':
-                content = file_data['content'][:4000]  # Limit content length
-                prompt = f"I've uploaded a text file: {file_data['filename']}\n\nContent:\n{content}\n\nCan you summarize this content and provide insights?"
-                return self.get_chat_response(prompt, user_context)
-            
-            elif file_data['type'] == 'pdf':
-                content = file_data['content'][:4000]  # Limit content length
-                prompt = f"I've uploaded a PDF file: {file_data['filename']}\n\nExtracted content:\n{content}\n\nCan you summarize this document and provide key insights?"
-                return self.get_chat_response(prompt, user_context)
+                prefix = f"I've uploaded a text file: {file_data['filename']}\n\nContent:\n"
+                suffix = "\n\nCan you summarize this content and provide insights?"
+                prompt = prefix + self._fit_file_content(file_data['content'], prefix + suffix, model) + suffix
             
             else:
-                return f"✅ File uploaded: {file_data['filename']}. File type processing not yet supported."
+                prefix = f"I've uploaded a PDF file: {file_data['filename']}\n\nExtracted content:\n"
+                suffix = "\n\nCan you summarize this document and provide key insights?"
+                prompt = prefix + self._fit_file_content(file_data['content'], prefix + suffix, model) + suffix
+            
+            response = self.get_chat_response(prompt, user_context, model)
+            if cacheable and not self._is_error_response(response):
+                content_store.set(f"summary:{model}", digest, response)
+            return response
         except Exception as e:
             logging.error(f"Error processing file content: {e}")
             return f"❌ Error processing file: {str(e)}"
\ No newline at end of file
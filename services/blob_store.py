@@ -0,0 +1,93 @@
+import os
+import shutil
+import logging
+import tempfile
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Optional
+from config import Config
+
+class BlobStore(ABC):
+    """Content-addressed storage for uploaded file bytes
+    
+    Blobs are named by the SHA-256 of their content, so storing the same upload
+    twice is a no-op. Subclasses provide the backend; only the local filesystem
+    exists today, and an S3 backend only needs to implement these methods.
+    """
+    
+    @abstractmethod
+    def put(self, digest: str, stream: BinaryIO) -> str:
+        """Store the stream's bytes under their digest and return the key"""
+    
+    @abstractmethod
+    def exists(self, digest: str) -> bool:
+        """Check whether a blob is stored"""
+    
+    @abstractmethod
+    def open(self, digest: str) -> BinaryIO:
+        """Open a stored blob for reading"""
+    
+    def local_path(self, digest: str) -> Optional[str]:
+        """Filesystem path for zero-copy serving, when the backend has one"""
+        return None
+    
+    @abstractmethod
+    def delete(self, digest: str) -> bool:
+        """Remove a blob"""
+
+class LocalBlobStore(BlobStore):
+    """Blobs as files under a root directory, fanned out by digest prefix"""
+    
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+    
+    def _path(self, digest: str) -> str:
+        if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+            raise ValueError(f"Invalid blob digest: {digest[:80]}")
+        return os.path.join(self.root, digest[:2], digest)
+    
+    def put(self, digest: str, stream: BinaryIO) -> str:
+        path = self._path(digest)
+        if os.path.exists(path):
+            return digest
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(stream, f)
+            # Rename into place so concurrent readers never see a partial blob
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+    
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self._path(digest))
+    
+    def open(self, digest: str) -> BinaryIO:
+        return open(self._path(digest), 'rb')
+    
+    def local_path(self, digest: str) -> Optional[str]:
+        path = self._path(digest)
+        return path if os.path.exists(path) else None
+    
+    def delete(self, digest: str) -> bool:
+        try:
+            os.remove(self._path(digest))
+            return True
+        except FileNotFoundError:
+            return False
+
+def create_blob_store() -> BlobStore:
+    """Build the configured blob store backend"""
+    backend = Config.BLOB_STORE_BACKEND
+    if backend == 'local':
+        return LocalBlobStore(Config.BLOB_STORE_DIR)
+    
+    logging.error(f"Unknown blob store backend '{backend}', using local storage")
+    return LocalBlobStore(Config.BLOB_STORE_DIR)
+
+# Process-wide blob store
+blob_store = create_blob_store()
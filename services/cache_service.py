@@ -1,8 +1,17 @@
+import os
 import json
+import math
+import uuid
+import time
+import random
 import hashlib
-from typing import Any, Optional
-from flask import current_app
+import fnmatch
+import threading
+from typing import Any, Optional, List, Iterable, Callable
+from flask import current_app, has_app_context
 import logging
+from services.memory_cache import MemoryCache
+from services.serialization_service import SerializationService
 
 try:
     import redis
@@ -13,17 +22,56 @@ except ImportError:
 class CacheService:
     def __init__(self):
         self.redis_client = None
-        self.memory_cache = {}
+        self.serializer = SerializationService(
+            compress_threshold=current_app.config.get('CACHE_COMPRESS_THRESHOLD', 1024),
+            compression=current_app.config.get('CACHE_COMPRESSION', 'zlib')
+        )
+        self.memory_cache = MemoryCache(
+            max_entries=current_app.config.get('CACHE_MEMORY_MAX_ENTRIES', 10000),
+            default_timeout=current_app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+        )
+        
+        # Per-worker L1 in front of Redis, kept coherent over pub/sub
+        self.l1_cache = None
+        self.l1_timeout = current_app.config.get('CACHE_L1_TIMEOUT', 30)
+        self.invalidation_channel = "cyberchat:invalidate"
+        self.tag_timeout = current_app.config.get('CACHE_TAG_TIMEOUT', 86400)
+        self.delete_batch_size = 500
+        
+        # Single-flight recomputation state for get_or_compute
+        self.stale_timeout = current_app.config.get('CACHE_STALE_TIMEOUT', 60)
+        self.lock_timeout = current_app.config.get('CACHE_LOCK_TIMEOUT', 10)
+        self.early_refresh_beta = current_app.config.get('CACHE_EARLY_REFRESH_BETA', 1.0)
+        self._local_locks = {}
+        self._local_locks_lock = threading.Lock()
+        self.stampede_stats = {'fresh': 0, 'stale': 0, 'early_refresh': 0, 'recomputes': 0, 'waits': 0, 'discarded': 0}
+        self._stats_lock = threading.Lock()
+        
+        # Deletes bump a per-key generation so an older recompute cannot write back
+        self.generation_timeout = 3600
+        self._generations = MemoryCache(max_entries=100000, default_timeout=self.generation_timeout)
+        self._generation_counter = 0
+        self._generation_lock = threading.Lock()
+        self._instance_id = uuid.uuid4().hex
+        self._subscriber = None
+        self._subscriber_pid = None
+        self._subscriber_lock = threading.Lock()
         
         if REDIS_AVAILABLE and current_app.config.get('CACHE_REDIS_URL'):
             try:
                 self.redis_client = redis.from_url(
                     current_app.config['CACHE_REDIS_URL'],
-                    decode_responses=True
+                    decode_responses=False
                 )
                 # Test connection
                 self.redis_client.ping()
                 logging.info("Redis cache initialized")
+                
+                if current_app.config.get('CACHE_L1_ENABLED', True):
+                    self.l1_cache = MemoryCache(
+                        max_entries=current_app.config.get('CACHE_L1_MAX_ENTRIES', 1000),
+                        default_timeout=self.l1_timeout
+                    )
             except Exception as e:
                 logging.warning(f"Redis connection failed, using memory cache: {e}")
                 self.redis_client = None
@@ -38,9 +86,21 @@ class CacheService:
             cache_key = self._get_key(key)
             
             if self.redis_client:
-                value = self.redis_client.get(cache_key)
-                if value:
-                    return json.loads(value)
+                if self.l1_cache is not None:
+                    value = self.l1_cache.get(cache_key)
+                    if value is not None:
+                        return value
+                
+                # Fetch the value and its remaining TTL in one round trip
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.get(cache_key)
+                pipe.pttl(cache_key)
+                raw_value, ttl_ms = pipe.execute()
+                
+                if raw_value:
+                    value = self.serializer.loads(raw_value)
+                    self._fill_l1(cache_key, value, ttl_ms / 1000 if ttl_ms and ttl_ms > 0 else None)
+                    return value
             else:
                 return self.memory_cache.get(cache_key)
             
@@ -49,20 +109,29 @@ class CacheService:
             logging.error(f"Cache get error: {e}")
             return None
     
-    def set(self, key: str, value: Any, timeout: int = 300) -> bool:
-        """Set value in cache"""
+    def _get_tag_key(self, tag: str) -> str:
+        """Generate the Redis set key that indexes a tag's entries"""
+        return f"cyberchat:tag:{tag}"
+    
+    def set(self, key: str, value: Any, timeout: int = 300, tags: Optional[Iterable[str]] = None) -> bool:
+        """Set value in cache, optionally indexed under invalidation tags"""
         try:
             cache_key = self._get_key(key)
             
             if self.redis_client:
-                return self.redis_client.setex(
-                    cache_key, 
-                    timeout, 
-                    json.dumps(value)
-                )
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.setex(cache_key, timeout, self.serializer.dumps(value))
+                for tag in tags or ():
+                    tag_key = self._get_tag_key(tag)
+                    pipe.sadd(tag_key, cache_key)
+                    # Tag sets outlive their members; stale members are harmless
+                    pipe.expire(tag_key, max(timeout, self.tag_timeout))
+                result = pipe.execute()[0]
+                self._fill_l1(cache_key, value, timeout)
+                self._publish_invalidation(keys=[cache_key])
+                return result
             else:
-                self.memory_cache[cache_key] = value
-                return True
+                return self.memory_cache.set(cache_key, value, timeout, tags=tags)
         except Exception as e:
             logging.error(f"Cache set error: {e}")
             return False
@@ -73,27 +142,388 @@ class CacheService:
             cache_key = self._get_key(key)
             
             if self.redis_client:
-                return bool(self.redis_client.delete(cache_key))
+                if self.l1_cache is not None:
+                    self.l1_cache.delete(cache_key)
+                pipe = self.redis_client.pipeline(transaction=False)
+                self._bump_generations(pipe, [cache_key])
+                pipe.delete(cache_key)
+                result = bool(pipe.execute()[-1])
+                self._publish_invalidation(keys=[cache_key])
+                return result
             else:
-                return bool(self.memory_cache.pop(cache_key, None))
+                with self._generation_lock:
+                    self._bump_generations(None, [cache_key])
+                    return self.memory_cache.delete(cache_key)
         except Exception as e:
             logging.error(f"Cache delete error: {e}")
             return False
     
-    def clear_pattern(self, pattern: str) -> bool:
-        """Clear all keys matching pattern"""
+    def invalidate_tag(self, tag: str) -> int:
+        """Delete every entry stored under a tag, e.g. all of one user's data"""
         try:
             if self.redis_client:
-                keys = self.redis_client.keys(self._get_key(pattern))
+                tag_key = self._get_tag_key(tag)
+                keys = [key.decode() for key in self.redis_client.smembers(tag_key)]
+                
+                pipe = self.redis_client.pipeline(transaction=False)
+                self._bump_generations(pipe, keys + [tag_key])
+                for start in range(0, len(keys), self.delete_batch_size):
+                    pipe.unlink(*keys[start:start + self.delete_batch_size])
+                pipe.unlink(tag_key)
+                pipe.execute()
+                
+                if self.l1_cache is not None:
+                    for key in keys:
+                        self.l1_cache.delete(key)
                 if keys:
-                    return bool(self.redis_client.delete(*keys))
+                    self._publish_invalidation(keys=keys)
+                return len(keys)
             else:
-                # For memory cache, clear all keys containing pattern
-                keys_to_delete = [k for k in self.memory_cache.keys() if pattern in k]
-                for key in keys_to_delete:
-                    del self.memory_cache[key]
+                with self._generation_lock:
+                    keys = self.memory_cache.delete_tag(tag)
+                    self._bump_generations(None, keys + [self._get_tag_key(tag)])
+                    return len(keys)
+        except Exception as e:
+            logging.error(f"Cache invalidate tag error: {e}")
+            return 0
+    
+    def clear_pattern(self, pattern: str) -> bool:
+        """Clear all keys matching pattern (prefer invalidate_tag)"""
+        try:
+            if self.redis_client:
+                # SCAN in batches instead of KEYS so Redis is never blocked
+                batch = []
+                for key in self.redis_client.scan_iter(match=self._get_key(pattern), count=self.delete_batch_size):
+                    batch.append(key)
+                    if len(batch) >= self.delete_batch_size:
+                        self._unlink_batch(batch)
+                        batch = []
+                if batch:
+                    self._unlink_batch(batch)
+                
+                if self.l1_cache is not None:
+                    self._evict_l1_pattern(pattern)
+                self._publish_invalidation(pattern=pattern)
+            else:
+                # For memory cache, clear all keys matching the glob pattern
+                match = self._get_key(pattern)
+                keys_to_delete = [k for k in self.memory_cache.keys() if fnmatch.fnmatchcase(k, match)]
+                with self._generation_lock:
+                    self._bump_generations(None, keys_to_delete)
+                    for key in keys_to_delete:
+                        self.memory_cache.delete(key)
             
             return True
         except Exception as e:
             logging.error(f"Cache clear pattern error: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def _unlink_batch(self, keys: List[bytes]):
+        """Delete a batch of scanned Redis keys, bumping their generations"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        self._bump_generations(pipe, [key.decode() for key in keys])
+        pipe.unlink(*keys)
+        pipe.execute()
+    
+    def _generation_key(self, name: str) -> str:
+        """Redis key holding the delete generation of a cache key or tag set"""
+        return f"cyberchat:gen:{name}"
+    
+    def _bump_generations(self, pipe, names: Iterable[str]):
+        """Mark keys or tag sets as deleted (queued on a pipeline, or under _generation_lock)"""
+        for name in names:
+            if pipe is not None:
+                gen_key = self._generation_key(name)
+                pipe.incr(gen_key)
+                pipe.expire(gen_key, self.generation_timeout)
+            else:
+                self._generation_counter += 1
+                self._generations.set(name, self._generation_counter)
+    
+    def _generation_names(self, key: str, tags: Optional[Iterable[str]]) -> List[str]:
+        """Names whose generations guard a recompute: the key and its tag sets"""
+        return [self._get_key(key)] + [self._get_tag_key(tag) for tag in tags or ()]
+    
+    def _current_generation(self, key: str, tags: Optional[Iterable[str]] = None) -> Optional[List[Any]]:
+        """Read the delete generations of a key and its tags before recomputing it"""
+        names = self._generation_names(key, tags)
+        if self.redis_client:
+            try:
+                values = self.redis_client.mget([self._generation_key(name) for name in names])
+                return [value or b'' for value in values]
+            except Exception as e:
+                logging.warning(f"Cache generation read error: {e}")
+                return None
+        with self._generation_lock:
+            return [self._generations.get(name) or 0 for name in names]
+    
+    def _set_if_generation(self, key: str, value: Any, timeout: int,
+                           tags: Optional[Iterable[str]], generation: Optional[List[Any]]) -> bool:
+        """Store a recomputed value unless the key or a tag was deleted since generation was read"""
+        cache_key = self._get_key(key)
+        tags = list(tags or ())
+        names = self._generation_names(key, tags)
+        
+        if not self.redis_client:
+            with self._generation_lock:
+                if [self._generations.get(name) or 0 for name in names] != generation:
+                    return False
+                return self.memory_cache.set(cache_key, value, timeout, tags=tags)
+        
+        if generation is None:
+            return False
+        try:
+            written = self.redis_client.eval(
+                "for i = 2, #KEYS do "
+                "if (redis.call('get', KEYS[i]) or '') ~= ARGV[i + 1] then return 0 end end "
+                "redis.call('setex', KEYS[1], ARGV[1], ARGV[2]) return 1",
+                len(names) + 1, cache_key, *[self._generation_key(name) for name in names],
+                timeout, self.serializer.dumps(value), *generation
+            )
+            if not written:
+                return False
+            
+            if tags:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for tag in tags:
+                    tag_key = self._get_tag_key(tag)
+                    pipe.sadd(tag_key, cache_key)
+                    pipe.expire(tag_key, max(timeout, self.tag_timeout))
+                pipe.execute()
+            self._fill_l1(cache_key, value, timeout)
+            self._publish_invalidation(keys=[cache_key])
+            return True
+        except Exception as e:
+            logging.error(f"Cache set error: {e}")
+            return False
+    
+    def _count(self, stat: str):
+        """Increment a stampede counter"""
+        with self._stats_lock:
+            self.stampede_stats[stat] += 1
+    
+    def _fill_l1(self, cache_key: str, value: Any, ttl: Optional[float]):
+        """Store a Redis value in L1, never outliving the Redis TTL"""
+        if self.l1_cache is None:
+            return
+        self._ensure_subscriber()
+        timeout = self.l1_timeout if ttl is None else max(1, min(self.l1_timeout, int(ttl)))
+        self.l1_cache.set(cache_key, value, timeout)
+    
+    def _evict_l1_pattern(self, pattern: str):
+        """Drop L1 entries matching a clear_pattern pattern"""
+        match = self._get_key(pattern)
+        for key in self.l1_cache.keys():
+            if fnmatch.fnmatchcase(key, match):
+                self.l1_cache.delete(key)
+    
+    def _publish_invalidation(self, keys: Optional[List[str]] = None, pattern: Optional[str] = None):
+        """Tell other workers to drop their L1 copies"""
+        if self.l1_cache is None:
+            return
+        try:
+            message = json.dumps({'origin': self._instance_id, 'keys': keys or [], 'pattern': pattern})
+            self.redis_client.publish(self.invalidation_channel, message)
+        except Exception as e:
+            logging.warning(f"Cache invalidation publish failed: {e}")
+    
+    def _ensure_subscriber(self):
+        """Start the invalidation listener in this worker process"""
+        if self._subscriber_pid == os.getpid():
+            return
+        
+        with self._subscriber_lock:
+            if self._subscriber_pid == os.getpid():
+                return
+            # L1 contents inherited across a fork may already be stale
+            self.l1_cache.clear()
+            self._instance_id = uuid.uuid4().hex
+            self._subscriber = threading.Thread(target=self._listen, name='cache-invalidation', daemon=True)
+            self._subscriber.start()
+            self._subscriber_pid = os.getpid()
+    
+    def _listen(self):
+        """Evict L1 entries announced on the invalidation channel"""
+        while True:
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.invalidation_channel)
+                # Anything cached before (re)subscribing may have missed messages
+                self.l1_cache.clear()
+                
+                for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    payload = json.loads(message['data'])
+                    if payload.get('origin') == self._instance_id:
+                        continue
+                    for key in payload.get('keys', []):
+                        self.l1_cache.delete(key)
+                    if payload.get('pattern'):
+                        self._evict_l1_pattern(payload['pattern'])
+            except Exception as e:
+                logging.warning(f"Cache invalidation listener error, reconnecting: {e}")
+                self.l1_cache.clear()
+                time.sleep(1)
+    
+    def get_or_compute(self, key: str, compute: Callable[[], Any], timeout: int = 300,
+                       stale_timeout: Optional[int] = None, tags: Optional[Iterable[str]] = None,
+                       background: bool = False) -> Any:
+        """Get a cached value, recomputing it at most once per expiry across workers
+        
+        Entries carry a soft expiry. Past it, one caller (holding a short-lived lock)
+        recomputes while everyone else keeps getting the stale value for up to
+        stale_timeout seconds. Shortly before expiry, callers probabilistically
+        refresh early (XFetch) so hot keys rarely expire at all.
+        """
+        stale_timeout = self.stale_timeout if stale_timeout is None else stale_timeout
+        entry = self.get(key)
+        
+        if self._is_envelope(entry):
+            now = time.time()
+            if now < entry['exp']:
+                # XFetch: refresh early with probability rising towards expiry
+                gap = entry['delta'] * self.early_refresh_beta * -math.log(1.0 - random.random())
+                if now + gap < entry['exp']:
+                    self._count('fresh')
+                    return entry['v']
+                self._count('early_refresh')
+            
+            token = self._acquire_lock(key)
+            if token is None:
+                # Someone else is refreshing, keep serving what we have
+                self._count('stale')
+                return entry['v']
+            
+            if background:
+                self._refresh_in_background(key, compute, timeout, stale_timeout, tags, token)
+                self._count('stale')
+                return entry['v']
+            
+            try:
+                return self._recompute(key, compute, timeout, stale_timeout, tags)
+            except Exception as e:
+                logging.error(f"Cache recompute error for {key}, serving stale value: {e}")
+                return entry['v']
+            finally:
+                self._release_lock(key, token)
+        
+        # Cold miss: one caller computes, the others wait briefly for its result
+        token = self._acquire_lock(key)
+        if token is None:
+            self._count('waits')
+            deadline = time.time() + self.lock_timeout
+            while time.time() < deadline:
+                time.sleep(0.05)
+                entry = self.get(key)
+                if self._is_envelope(entry):
+                    return entry['v']
+                if not self._is_locked(key):
+                    break
+            return self._recompute(key, compute, timeout, stale_timeout, tags)
+        
+        try:
+            return self._recompute(key, compute, timeout, stale_timeout, tags)
+        finally:
+            self._release_lock(key, token)
+    
+    def _is_envelope(self, entry: Any) -> bool:
+        """Check whether a cached value was written by get_or_compute"""
+        return isinstance(entry, dict) and entry.get('__swr__') == 1
+    
+    def _recompute(self, key: str, compute: Callable[[], Any], timeout: int,
+                   stale_timeout: int, tags: Optional[Iterable[str]]) -> Any:
+        """Run compute and store its value with a soft expiry"""
+        tags = list(tags or ())
+        generation = self._current_generation(key, tags)
+        started = time.time()
+        value = compute()
+        delta = time.time() - started
+        self._count('recomputes')
+        
+        envelope = {'__swr__': 1, 'v': value, 'exp': time.time() + timeout, 'delta': delta}
+        if not self._set_if_generation(key, envelope, timeout + stale_timeout, tags, generation):
+            # Deleted while computing; the value is still fine for this caller
+            self._count('discarded')
+        return value
+    
+    def _refresh_in_background(self, key: str, compute: Callable[[], Any], timeout: int,
+                               stale_timeout: int, tags: Optional[Iterable[str]], token: str):
+        """Recompute in a daemon thread, inside an app context when one is active"""
+        app = current_app._get_current_object() if has_app_context() else None
+        
+        def refresh():
+            try:
+                if app is not None:
+                    with app.app_context():
+                        self._recompute(key, compute, timeout, stale_timeout, tags)
+                else:
+                    self._recompute(key, compute, timeout, stale_timeout, tags)
+            except Exception as e:
+                logging.error(f"Background cache refresh error for {key}: {e}")
+            finally:
+                self._release_lock(key, token)
+        
+        threading.Thread(target=refresh, name='cache-refresh', daemon=True).start()
+    
+    def _acquire_lock(self, key: str) -> Optional[str]:
+        """Take the short-lived recompute lock for a key"""
+        token = uuid.uuid4().hex
+        
+        if self.redis_client:
+            try:
+                if self.redis_client.set(self._get_key(f"lock:{key}"), token, nx=True, px=self.lock_timeout * 1000):
+                    return token
+                return None
+            except Exception as e:
+                logging.warning(f"Cache lock error, computing without lock: {e}")
+                return token
+        
+        with self._local_locks_lock:
+            now = time.time()
+            holder = self._local_locks.get(key)
+            if holder and holder[1] > now:
+                return None
+            self._local_locks[key] = (token, now + self.lock_timeout)
+            return token
+    
+    def _release_lock(self, key: str, token: str):
+        """Release the recompute lock if we still own it"""
+        if self.redis_client:
+            try:
+                self.redis_client.eval(
+                    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0",
+                    1, self._get_key(f"lock:{key}"), token
+                )
+            except Exception as e:
+                logging.warning(f"Cache unlock error: {e}")
+            return
+        
+        with self._local_locks_lock:
+            holder = self._local_locks.get(key)
+            if holder and holder[0] == token:
+                del self._local_locks[key]
+    
+    def _is_locked(self, key: str) -> bool:
+        """Check whether a recompute is in flight for a key"""
+        if self.redis_client:
+            try:
+                return bool(self.redis_client.exists(self._get_key(f"lock:{key}")))
+            except Exception:
+                return False
+        
+        with self._local_locks_lock:
+            holder = self._local_locks.get(key)
+            return bool(holder and holder[1] > time.time())
+    
+    def get_stats(self) -> dict:
+        """Get cache backend and in-process counters"""
+        stats = {
+            'backend': 'redis' if self.redis_client else 'memory',
+            'memory': self.memory_cache.get_stats()
+        }
+        if self.l1_cache is not None:
+            stats['l1'] = self.l1_cache.get_stats()
+        with self._stats_lock:
+            stats['stampede'] = dict(self.stampede_stats)
+        return stats
@@ -0,0 +1,119 @@
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+from config import Config
+from services.serialization_service import json_dumps, json_loads
+
+class ContentStore:
+    """Size-bounded on-disk cache of derived data, keyed by upload content hash
+    
+    Entries are small JSON files shared by every worker on the host. Reads bump
+    the file's mtime, and eviction drops the least recently used files once the
+    directory grows past max_bytes.
+    """
+    
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or Config.CONTENT_STORE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else Config.CONTENT_STORE_MAX_BYTES
+        self._lock = threading.Lock()
+        self._bytes = None
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+    
+    def _path(self, namespace: str, digest: str) -> str:
+        """Fan entries out over 256 directories; namespaces may contain '/' (model ids)"""
+        name = hashlib.sha256(f"{namespace}:{digest}".encode()).hexdigest()
+        return os.path.join(self.root, name[:2], f"{name}.json")
+    
+    def get(self, namespace: str, digest: Optional[str]) -> Optional[Any]:
+        """Get a stored value, or None"""
+        if not digest:
+            return None
+        
+        path = self._path(namespace, digest)
+        try:
+            with open(path, 'rb') as f:
+                value = json_loads(f.read())
+            os.utime(path)
+            self.stats['hits'] += 1
+            return value
+        except FileNotFoundError:
+            self.stats['misses'] += 1
+            return None
+        except Exception as e:
+            logging.error(f"Content store read error: {e}")
+            self.stats['misses'] += 1
+            return None
+    
+    def set(self, namespace: str, digest: Optional[str], value: Any) -> bool:
+        """Store a value; written to a temp file and renamed so readers never see partial data"""
+        if not digest:
+            return False
+        
+        path = self._path(namespace, digest)
+        try:
+            body = json_dumps(value)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.error(f"Content store write error: {e}")
+            return False
+        
+        self.stats['writes'] += 1
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self._scan_size()
+            else:
+                self._bytes += len(body)
+            over = self._bytes > self.max_bytes
+        
+        if over:
+            self._evict()
+        return True
+    
+    def _entries(self):
+        """(mtime, size, path) for every stored file"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+    
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+    
+    def _evict(self):
+        """Delete least recently used entries until the store is back under 90% of its bound"""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+            
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    self.stats['evictions'] += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+            
+            self._bytes = total
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss/eviction counters and the tracked size"""
+        return {**self.stats, 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+# Host-wide store shared by all workers through the filesystem
+content_store = ContentStore()
@@ -0,0 +1,182 @@
+import logging
+import threading
+from typing import Dict, List, Optional
+from flask import current_app
+from sqlalchemy import String, exists, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import ChatMessage, ConversationSummary
+from services.ai_service import AIService, ERROR_PREFIXES, SYSTEM_PROMPT
+from services.token_counter import token_counter, MESSAGE_OVERHEAD
+
+class ContextBuilder:
+    """Fit a conversation's history into a per-model prompt token budget
+    
+    The newest turns are sent verbatim. Turns that no longer fit are folded
+    into a ConversationSummary in the background, in batches, and each fold
+    only sends the previous summary plus the new turns, so the summary is
+    never rebuilt from the whole history. Prompt size is bounded by the
+    budget however long the conversation runs.
+    """
+    
+    def __init__(self, job_service):
+        self.job_service = job_service
+        self.default_budget = current_app.config.get('CONTEXT_TOKEN_BUDGET', 3000)
+        self.model_budgets = current_app.config.get('CONTEXT_MODEL_BUDGETS', {})
+        self.max_messages = current_app.config.get('CONTEXT_MAX_MESSAGES', 40)
+        self.summary_batch = current_app.config.get('CONTEXT_SUMMARY_BATCH', 6)
+        self.summary_max_tokens = current_app.config.get('CONTEXT_SUMMARY_MAX_TOKENS', 400)
+        self.summary_model = current_app.config.get('CONTEXT_SUMMARY_MODEL', 'openai/gpt-3.5-turbo')
+        self._lock = threading.Lock()
+        self._folding = set()
+    
+    def budget_for(self, model: Optional[str]) -> int:
+        """Prompt token budget for a model, never more than its window leaves room for"""
+        return min(self.model_budgets.get(model, self.default_budget), token_counter.prompt_budget(model))
+    
+    def _owner_query(self, model_class, user_id: Optional[str], session_id: Optional[str]):
+        if user_id:
+            return model_class.query.filter(model_class.user_id == user_id)
+        return model_class.query.filter(model_class.session_id == session_id, model_class.user_id.is_(None))
+    
+    def build(self, user_id: Optional[str], session_id: Optional[str], model: Optional[str],
+              message: str, before_id: Optional[int] = None) -> List[Dict[str, str]]:
+        """History messages to send ahead of `message`, oldest first
+        
+        before_id excludes the row just saved for the message itself.
+        """
+        try:
+            summary = self._owner_query(ConversationSummary, user_id, session_id).first()
+            through = summary.summarized_through_id if summary else 0
+            
+            query = self._owner_query(ChatMessage, user_id, session_id).filter(ChatMessage.id > through)
+            if before_id is not None:
+                query = query.filter(ChatMessage.id < before_id)
+            rows = query.order_by(ChatMessage.id.desc()).limit(self.max_messages + 1).all()
+            # Unsummarized turns beyond the row limit still need folding
+            has_older = len(rows) > self.max_messages
+            rows = rows[:self.max_messages]
+            
+            remaining = self.budget_for(model)
+            remaining -= token_counter.count(SYSTEM_PROMPT, model) + token_counter.count(message, model) + 2 * MESSAGE_OVERHEAD
+            
+            summary_message = None
+            if summary and summary.summary:
+                summary_text = token_counter.truncate(summary.summary, self.summary_max_tokens, model)
+                summary_message = {
+                    'role': 'system',
+                    'content': f"Summary of the earlier conversation:\n{summary_text}"
+                }
+                remaining -= token_counter.count(summary_message['content'], model) + MESSAGE_OVERHEAD
+            
+            # Newest first until the budget runs out; everything older overflows
+            turns = []
+            kept = 0
+            for row in rows:
+                if row.message_type == 'assistant' and row.content.startswith(ERROR_PREFIXES):
+                    kept += 1
+                    continue
+                cost = token_counter.count(row.content, model) + MESSAGE_OVERHEAD
+                if cost > remaining:
+                    break
+                remaining -= cost
+                kept += 1
+                turns.append({'role': 'assistant' if row.message_type == 'assistant' else 'user', 'content': row.content})
+            
+            overflow = len(rows) - kept
+            if overflow >= self.summary_batch or has_older:
+                oldest_kept = rows[kept - 1].id if kept else (before_id or rows[0].id + 1)
+                self._schedule_fold(user_id, session_id, oldest_kept)
+            
+            turns.reverse()
+            return ([summary_message] if summary_message else []) + turns
+        
+        except Exception as e:
+            logging.error(f"Error building conversation context: {e}")
+            return []
+    
+    def _schedule_fold(self, user_id: Optional[str], session_id: Optional[str], up_to_id: int):
+        """Queue one summary update per conversation at a time"""
+        owner = user_id or session_id
+        with self._lock:
+            if owner in self._folding:
+                return
+            self._folding.add(owner)
+        
+        try:
+            self.job_service.submit(owner, self._fold_job, user_id, session_id, up_to_id, kind='summary')
+        except Exception as e:
+            logging.error(f"Error scheduling conversation summary: {e}")
+            with self._lock:
+                self._folding.discard(owner)
+    
+    def _fold_job(self, job_id: str, user_id: Optional[str], session_id: Optional[str], up_to_id: int):
+        try:
+            return self.fold(user_id, session_id, up_to_id)
+        finally:
+            with self._lock:
+                self._folding.discard(user_id or session_id)
+    
+    def fold(self, user_id: Optional[str], session_id: Optional[str], up_to_id: int) -> Dict[str, int]:
+        """Fold turns older than up_to_id into the stored summary"""
+        summary = self._owner_query(ConversationSummary, user_id, session_id).first()
+        through = summary.summarized_through_id if summary else 0
+        
+        rows = self._owner_query(ChatMessage, user_id, session_id).filter(
+            ChatMessage.id > through, ChatMessage.id < up_to_id
+        ).order_by(ChatMessage.id).limit(self.max_messages).all()
+        if not rows:
+            return {'summarized_through_id': through}
+        
+        transcript = "\n".join(
+            f"{'Assistant' if row.message_type == 'assistant' else 'User'}: {row.content[:1500]}"
+            for row in rows
+        )
+        words = self.summary_max_tokens * 3 // 4
+        prompt = (
+            "Update the running summary of this conversation with the new messages below. "
+            "Keep facts, names, decisions and open questions the user may refer back to; drop small talk. "
+            f"Reply with only the updated summary, under {words} words.\n\n"
+            f"Current summary:\n{summary.summary if summary and summary.summary else '(none)'}\n\n"
+            f"New messages:\n{transcript}"
+        )
+        
+        ai_service = AIService()
+        updated = ai_service.get_chat_response(prompt, user_id or session_id, self.summary_model)
+        if ai_service._is_error_response(updated):
+            # Leave the watermark alone; the next overflow retries these turns
+            logging.warning(f"Conversation summary update failed: {updated[:100]}")
+            return {'summarized_through_id': through}
+        
+        try:
+            if summary is None:
+                # Insert only while the folded turns still exist, so a fold racing
+                # clear_chat does not bring back a summary of the cleared conversation
+                changed = db.session.execute(
+                    insert(ConversationSummary).from_select(
+                        ['user_id', 'session_id', 'summary', 'summarized_through_id', 'message_count'],
+                        select(
+                            literal(user_id, String), literal(session_id, String), literal(updated.strip()),
+                            literal(rows[-1].id), literal(len(rows))
+                        ).where(exists().where(ChatMessage.id == rows[-1].id))
+                    )
+                ).rowcount
+            else:
+                # Only advance from the watermark we read, in case another worker got there first
+                changed = ConversationSummary.query.filter_by(
+                    id=summary.id, summarized_through_id=through
+                ).update({
+                    'summary': updated.strip(),
+                    'summarized_through_id': rows[-1].id,
+                    'message_count': ConversationSummary.message_count + len(rows)
+                }, synchronize_session=False)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return {'summarized_through_id': through}
+        
+        return {'summarized_through_id': rows[-1].id if changed else through}
+    
+    def clear(self, user_id: Optional[str], session_id: Optional[str]):
+        """Drop a conversation's summary; the caller commits"""
+        self._owner_query(ConversationSummary, user_id, session_id).delete(synchronize_session=False)
@@ -1,17 +1,42 @@
 import os
 import base64
 import secrets
+import threading
+from typing import Dict, Tuple
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+# Derived keys and ciphers per (secret, salt), shared by the whole process
+_key_cache: Dict[Tuple[bytes, bytes], Tuple[bytes, Fernet]] = {}
+_key_cache_lock = threading.Lock()
+
 class EncryptionService:
     def __init__(self):
-        self.key = self._get_encryption_key()
-        self.cipher = Fernet(self.key)
+        self.key, self.cipher = self._get_cached_cipher()
+    
+    @classmethod
+    def warm(cls):
+        """Derive the encryption key ahead of the first request"""
+        cls._get_cached_cipher()
+    
+    @classmethod
+    def _get_cached_cipher(cls) -> Tuple[bytes, Fernet]:
+        """Get the derived key and cipher, running PBKDF2 once per secret and salt"""
+        password, salt = cls._get_key_material()
+        
+        with _key_cache_lock:
+            cached = _key_cache.get((password, salt))
+            if cached is None:
+                key = cls._derive_key(password, salt)
+                cached = (key, Fernet(key))
+                _key_cache[(password, salt)] = cached
+        
+        return cached
     
-    def _get_encryption_key(self) -> bytes:
-        """Generate or retrieve encryption key with proper random salt"""
+    @staticmethod
+    def _get_key_material() -> Tuple[bytes, bytes]:
+        """Get the secret and salt, generating a salt for development if unset"""
         password = os.environ.get("SESSION_SECRET", "fallback_key_for_dev").encode()
         
         # Use a random salt stored in environment or generate one
@@ -24,6 +49,11 @@ class EncryptionService:
             # In production, this should be stored securely
             os.environ["ENCRYPTION_SALT"] = base64.urlsafe_b64encode(salt).decode()
         
+        return password, salt
+    
+    @staticmethod
+    def _derive_key(password: bytes, salt: bytes) -> bytes:
+        """Derive a Fernet key from the secret with PBKDF2-HMAC-SHA256"""
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
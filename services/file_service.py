@@ -8,6 +8,15 @@ from PIL import Image
 import io
 from services.security_service import SecurityService
 from services.validation_service import ValidationService
+from services.pdf_extractor import pdf_extractor
+from services.upload_inspector import upload_inspector, UploadInspection
+from services.content_store import content_store
+
+# Fields kept in chat_messages.file_data; content and thumbnails are served by URL
+REFERENCE_FIELDS = (
+    'filename', 'size', 'extension', 'content_type', 'type',
+    'width', 'height', 'format', 'page_count', 'line_count', 'character_count'
+)
 
 class FileService:
     def __init__(self):
@@ -23,75 +32,90 @@ class FileService:
     
     def process_file(self, file: FileStorage) -> Dict[str, Any]:
         """Process uploaded file and return content with security checks"""
+        inspection = upload_inspector.inspect(file, self.allowed_extensions, self.max_file_size)
         try:
-            if not file or file.filename == '':
-                return {'error': 'No file provided'}
-            
-            # Validate file upload
-            validation_result = self.validation_service.validate_file_upload(
-                file, self.allowed_extensions, self.max_file_size
-            )
-            if not validation_result['valid']:
-                return {'error': validation_result['errors'][0]}
-            
-            # Validate file signature
-            if not self.security_service.validate_file_signature(file):
-                logging.warning(f"File signature validation failed for {file.filename}")
-                return {'error': 'File signature does not match extension'}
-            
-            filename = self.validation_service.sanitize_filename(file.filename)
-            file_extension = filename.rsplit('.', 1)[1].lower()
-            
-            # Read file content
-            file_content = file.read()
-            
-            # Scan for malicious content
-            if self.security_service.scan_for_malicious_content(file_content):
-                logging.warning(f"Malicious content detected in {filename}")
-                return {'error': 'File contains potentially malicious content'}
+            return self.process_inspection(inspection)
+        finally:
+            inspection.close()
+    
+    def process_inspection(self, inspection: UploadInspection) -> Dict[str, Any]:
+        """Process an upload already sized, sniffed, hashed and scanned by the inspector"""
+        try:
+            if not inspection.ok:
+                return {'error': inspection.error}
             
+            file_extension = inspection.extension
             result = {
-                'filename': filename,
-                'size': len(file_content),
-                'extension': file_extension
+                'filename': inspection.filename,
+                'size': inspection.size,
+                'extension': file_extension,
+                'sha256': inspection.sha256,
+                'content_type': inspection.mime_type
             }
             
+            # Same bytes were processed before: reuse the extraction
+            cached = content_store.get('extract', inspection.sha256)
+            if cached is not None:
+                result.update(cached)
+                if result.get('type') == 'image':
+                    # Raw bytes for the AI request; browsers fetch thumbnails instead
+                    result['content'] = inspection.read()
+                return result
+            
+            file_content = inspection.read()
             if file_extension in ['jpg', 'jpeg', 'png']:
-                result.update(self._process_image(file_content, filename))
+                extracted = self._process_image(file_content, inspection.filename)
             elif file_extension == 'txt':
-                result.update(self._process_text(file_content))
+                extracted = self._process_text(file_content)
             elif file_extension == 'pdf':
-                result.update(self._process_pdf(file_content))
-            
+                extracted = self._process_pdf(file_content)
+            else:
+                extracted = {}
+            
+            if extracted and 'error' not in extracted:
+                cacheable = dict(extracted)
+                if cacheable.get('type') == 'image':
+                    # Raw bytes are re-read from the upload on a hit
+                    cacheable.pop('content', None)
+                content_store.set('extract', inspection.sha256, cacheable)
+            
+            result.update(extracted)
             return result
             
         except Exception as e:
             logging.error(f"File processing error: {e}")
             return {'error': f'Error processing file: {str(e)}'}
     
+    def file_reference(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Small, JSON-safe description of a processed file; the bytes live in the blob store"""
+        reference = {field: result[field] for field in REFERENCE_FIELDS if field in result}
+        reference['blob'] = result.get('sha256')
+        return reference
+    
     def _process_image(self, content: bytes, filename: str) -> Dict[str, Any]:
         """Process image file with security checks"""
         try:
             # Validate and process image
             image = Image.open(io.BytesIO(content))
             
-            # Remove EXIF data for privacy
-            if hasattr(image, '_getexif'):
-                image = image.copy()
-            
+            # Read these from the header: copies lose the format, and decoding comes later
+            image_format = image.format
             width, height = image.size
             
             # Validate image dimensions (prevent zip bombs)
             if width * height > 50000000:  # 50MP limit
                 return {'error': 'Image too large (dimensions)'}
             
+            # Remove EXIF data for privacy
+            if hasattr(image, '_getexif'):
+                image = image.copy()
+            
             return {
                 'type': 'image',
                 'width': width,
                 'height': height,
-                'format': image.format,
-                'content': content,  # Store raw bytes for AI processing
-                'preview_url': f'data:image/{image.format.lower()};base64,{self._to_base64(content)}'
+                'format': image_format,
+                'content': content  # Store raw bytes for AI processing
             }
         except Exception as e:
             logging.error(f"Image processing error: {e}")
@@ -144,20 +168,8 @@ class FileService:
             if len(pdf_reader.pages) > 100:
                 return {'error': 'PDF has too many pages (max 100)'}
             
-            text_content = ""
-            for i, page in enumerate(pdf_reader.pages):
-                try:
-                    page_text = page.extract_text()
-                    text_content += page_text + "\n"
-                    
-                    # Limit total text length
-                    if len(text_content) > 100000:  # 100KB limit
-                        text_content += "\n... (content truncated)"
-                        break
-                        
-                except Exception as e:
-                    logging.warning(f"Error extracting text from PDF page {i}: {e}")
-                    continue
+            # Page shards are extracted in parallel and joined in page order
+            text_content = pdf_extractor.extract_text(content, len(pdf_reader.pages), 100000)  # 100KB limit
             
             # Sanitize extracted text
             text_content = self.security_service.sanitize_html(text_content)
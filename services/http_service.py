@@ -0,0 +1,99 @@
+import os
+import logging
+import threading
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+
+class HTTPService:
+    """Pooled keep-alive HTTP transport shared by all services in a worker"""
+    
+    def __init__(self, host_settings: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.host_settings = host_settings if host_settings is not None else Config.HTTP_POOL_SETTINGS
+        self.default_pool_size = Config.HTTP_POOL_DEFAULT_SIZE
+        self.default_timeout = (Config.HTTP_CONNECT_TIMEOUT, Config.API_TIMEOUT)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._sessions = {}
+    
+    def _settings_for(self, host: str) -> Dict[str, Any]:
+        """Get pool settings for a host, falling back to defaults"""
+        return self.host_settings.get(host, {})
+    
+    def _timeout_for(self, host: str) -> Tuple[float, float]:
+        """Get (connect, read) timeout for a host"""
+        settings = self._settings_for(host)
+        return (
+            settings.get('connect_timeout', self.default_timeout[0]),
+            settings.get('read_timeout', self.default_timeout[1])
+        )
+    
+    def _session_for(self, host: str) -> requests.Session:
+        """Get or create the pooled session for a host"""
+        with self._lock:
+            # Sockets must not be shared with the parent after a gunicorn fork
+            pid = os.getpid()
+            if self._pid != pid:
+                self._sessions = {}
+                self._pid = pid
+            
+            session = self._sessions.get(host)
+            if session is None:
+                pool_size = self._settings_for(host).get('pool_maxsize', self.default_pool_size)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[host] = session
+                logging.info(f"HTTP pool created for {host} (maxsize={pool_size})")
+            
+            return session
+    
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request through the pooled session for the URL's host"""
+        host = urlsplit(url).hostname or ''
+        kwargs.setdefault('timeout', self._timeout_for(host))
+        return self._session_for(host).request(method, url, **kwargs)
+    
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Send a pooled GET request"""
+        return self.request('GET', url, **kwargs)
+    
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """Send a pooled POST request"""
+        return self.request('POST', url, **kwargs)
+    
+    def get_pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """Get open, idle and reused connection counts per host"""
+        stats = {}
+        with self._lock:
+            sessions = dict(self._sessions) if self._pid == os.getpid() else {}
+        
+        for host, session in sessions.items():
+            host_stats = {'open': 0, 'idle': 0, 'in_use': 0, 'created': 0, 'requests': 0, 'reused': 0}
+            
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for pool_key in list(pools.keys()):
+                    pool = pools.get(pool_key)
+                    if pool is None or pool.pool is None:
+                        continue
+                    
+                    # The pool queue holds idle connections plus None placeholders
+                    idle = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+                    in_use = pool.pool.maxsize - pool.pool.qsize()
+                    host_stats['idle'] += idle
+                    host_stats['in_use'] += in_use
+                    host_stats['open'] += idle + in_use
+                    host_stats['created'] += pool.num_connections
+                    host_stats['requests'] += pool.num_requests
+                    host_stats['reused'] += max(0, pool.num_requests - pool.num_connections)
+            
+            stats[host] = host_stats
+        
+        return stats
+
+# Process-wide transport, rebuilt lazily in each forked worker
+http_service = HTTPService()
@@ -0,0 +1,71 @@
+import io
+import base64
+import logging
+from typing import Optional, Tuple
+from PIL import Image, ImageOps
+from config import Config
+from services.content_store import content_store
+
+class ImagePreprocessor:
+    """Shrink uploaded images to what a vision model needs before they are sent inline
+    
+    Images are bounded on the long edge and re-encoded as JPEG, stepping the
+    quality down (and then the size) until the encoded bytes fit the budget.
+    Nothing from the original container is copied, so EXIF, GPS and ICC data
+    never leave the server. Results are cached by upload hash.
+    """
+    
+    def __init__(self, max_edge: Optional[int] = None, max_bytes: Optional[int] = None,
+                 quality: Optional[int] = None, min_quality: Optional[int] = None):
+        self.max_edge = max_edge or Config.AI_IMAGE_MAX_EDGE
+        self.max_bytes = max_bytes or Config.AI_IMAGE_MAX_BYTES
+        self.quality = quality or Config.AI_IMAGE_QUALITY
+        self.min_quality = min_quality or Config.AI_IMAGE_MIN_QUALITY
+    
+    def prepare(self, content: bytes, digest: Optional[str] = None) -> Tuple[str, str]:
+        """Return (mime_type, base64 data) ready for an inline_data part"""
+        cached = content_store.get('ai_image', digest)
+        if cached is not None:
+            return cached['mime_type'], cached['data']
+        
+        encoded = self.encode(content)
+        data = base64.b64encode(encoded).decode('ascii')
+        content_store.set('ai_image', digest, {'mime_type': 'image/jpeg', 'data': data})
+        return 'image/jpeg', data
+    
+    def encode(self, content: bytes) -> bytes:
+        """Downscale and re-encode an image as metadata-free JPEG within the byte budget"""
+        with Image.open(io.BytesIO(content)) as image:
+            # JPEG sources decode straight at a reduced scale when they are much larger
+            image.draft('RGB', (self.max_edge, self.max_edge))
+            image = ImageOps.exif_transpose(image)
+            image = self._flatten(image)
+        
+        edge = self.max_edge
+        while True:
+            if max(image.size) > edge:
+                image.thumbnail((edge, edge), Image.LANCZOS)
+            
+            for quality in range(self.quality, self.min_quality - 1, -10):
+                buffer = io.BytesIO()
+                image.save(buffer, 'JPEG', quality=quality, optimize=True)
+                if buffer.tell() <= self.max_bytes:
+                    return buffer.getvalue()
+            
+            # Still over budget at the lowest quality: shrink and try again
+            if edge <= 256:
+                logging.warning(f"Image still {buffer.tell()} bytes at {image.size}, sending anyway")
+                return buffer.getvalue()
+            edge = int(edge * 0.75)
+    
+    def _flatten(self, image: Image.Image) -> Image.Image:
+        """RGB copy of the image, with transparency composited onto white"""
+        if image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+            rgba = image.convert('RGBA')
+            background = Image.new('RGB', rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            return background
+        return image.convert('RGB')
+
+# Shared preprocessor; holds no per-image state
+image_preprocessor = ImagePreprocessor()
@@ -0,0 +1,158 @@
+import os
+import re
+import time
+import uuid
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable
+from flask import current_app
+from services.serialization_service import json_dumps, json_loads
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+class JobFailed(Exception):
+    """Raised by a job to fail with a user-facing error and extra status fields"""
+    
+    def __init__(self, error: str, **fields):
+        super().__init__(error)
+        self.error = error
+        self.fields = fields
+
+class JobService:
+    """Run slow request work on a worker pool and track its status where every worker can read it
+    
+    Status lives in Redis when it is configured. Otherwise the cache is a
+    per-worker MemoryCache, so status goes to small JSON files in a directory
+    shared by all workers on the host instead; any worker can then answer a
+    status poll for a job another worker is running.
+    """
+    
+    def __init__(self, cache_service):
+        self.cache_service = cache_service
+        self.max_workers = current_app.config.get('JOB_WORKERS', 4)
+        self.status_timeout = current_app.config.get('JOB_STATUS_TIMEOUT', 3600)
+        self.status_dir = current_app.config.get('JOB_STATUS_DIR', os.path.join(tempfile.gettempdir(), 'cyberchat-jobs'))
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._swept_at = 0.0
+    
+    def _executor_for_process(self) -> ThreadPoolExecutor:
+        """Get the worker pool, rebuilt after a gunicorn fork"""
+        with self._lock:
+            pid = os.getpid()
+            if self._pid != pid or self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+                self._pid = pid
+            return self._executor
+    
+    def _status_key(self, job_id: str) -> str:
+        return f"job:{job_id}"
+    
+    def _status_path(self, job_id: str) -> str:
+        return os.path.join(self.status_dir, f"{job_id}.json")
+    
+    def _uses_files(self) -> bool:
+        """Whether status must go to the shared directory (no Redis)"""
+        return self.cache_service.redis_client is None
+    
+    def submit(self, owner: str, fn: Callable[..., Dict[str, Any]], *args, **fields) -> str:
+        """Queue fn(job_id, *args) and return the job id; extra fields seed the status"""
+        job_id = uuid.uuid4().hex
+        self._write(job_id, {
+            'id': job_id,
+            'owner': owner,
+            'status': 'queued',
+            'progress': 0,
+            'created_at': time.time(),
+            **fields
+        })
+        
+        app = current_app._get_current_object()
+        
+        def run():
+            with app.app_context():
+                try:
+                    result = fn(job_id, *args)
+                    self.update(job_id, status='done', progress=100, result=result)
+                except JobFailed as e:
+                    self.update(job_id, status='failed', error=e.error, **e.fields)
+                except Exception as e:
+                    logging.error(f"Job {job_id} failed: {e}")
+                    self.update(job_id, status='failed', error='Internal server error')
+        
+        self._executor_for_process().submit(run)
+        return job_id
+    
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Get a job's status, or None when unknown or owned by someone else"""
+        job = self._read(job_id)
+        if not job or (owner is not None and job.get('owner') != owner):
+            return None
+        return job
+    
+    def update(self, job_id: str, **fields):
+        """Merge fields into a job's status"""
+        # Copy, since the in-memory backend hands out the stored dict itself
+        job = dict(self._read(job_id) or {'id': job_id})
+        job.update(fields)
+        job['updated_at'] = time.time()
+        self._write(job_id, job)
+    
+    def _read(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not self._uses_files():
+            return self.cache_service.get(self._status_key(job_id))
+        
+        # Job ids come from the URL; only ids we could have issued map to a file
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(self._status_path(job_id), 'rb') as f:
+                job = json_loads(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f"Job status read error: {e}")
+            return None
+        
+        if time.time() - job.get('updated_at', job.get('created_at', 0)) > self.status_timeout:
+            return None
+        return job
+    
+    def _write(self, job_id: str, job: Dict[str, Any]):
+        if not self._uses_files():
+            self.cache_service.set(self._status_key(job_id), job, self.status_timeout)
+            return
+        
+        # Temp file and rename, so a poll from another worker never sees partial JSON
+        try:
+            os.makedirs(self.status_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.status_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json_dumps(job))
+            os.replace(tmp_path, self._status_path(job_id))
+        except Exception as e:
+            logging.error(f"Job status write error: {e}")
+        
+        self._sweep()
+    
+    def _sweep(self):
+        """Remove status files past their timeout, at most once a minute per worker"""
+        now = time.time()
+        with self._lock:
+            if now - self._swept_at < 60:
+                return
+            self._swept_at = now
+        
+        try:
+            with os.scandir(self.status_dir) as entries:
+                for entry in entries:
+                    try:
+                        if now - entry.stat().st_mtime > self.status_timeout:
+                            os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+        except Exception as e:
+            logging.warning(f"Job status cleanup error: {e}")
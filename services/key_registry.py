@@ -0,0 +1,301 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from config import Config
+from services.http_service import http_service
+
+class KeyState:
+    """In-memory health and circuit breaker state for one API key"""
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, key_id: int, service: str, name: str, api_key: str):
+        self.key_id = key_id
+        self.service = service
+        self.name = name
+        self.api_key = api_key
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = 0
+        self.open_until = 0.0
+        self.last_status = None
+        self.last_used = None
+        self.used_since_flush = False
+        self.trial_started = 0.0
+    
+    def is_available(self, now: float, trial_timeout: float) -> bool:
+        """Check whether requests may be sent with this key
+        
+        A half-open key admits a single trial request at a time; another is
+        allowed only if the outstanding trial never reported back.
+        """
+        if self.state == self.OPEN and now >= self.open_until:
+            self.state = self.HALF_OPEN
+            self.trial_started = 0.0
+        if self.state == self.HALF_OPEN:
+            return now - self.trial_started >= trial_timeout
+        return self.state != self.OPEN
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Describe the key state without exposing key material"""
+        return {
+            'id': self.key_id,
+            'service': self.service,
+            'name': self.name,
+            'state': self.state,
+            'failures': self.failures,
+            'retry_in': max(0, round(self.open_until - time.time())) if self.state == self.OPEN else 0,
+            'last_status': self.last_status
+        }
+
+class KeyHealthRegistry:
+    """Process-wide registry of decrypted API keys with per-key circuit breakers"""
+    
+    def __init__(self):
+        self.refresh_interval = Config.KEY_REGISTRY_REFRESH_INTERVAL
+        self.probe_interval = Config.KEY_PROBE_INTERVAL
+        self.failure_threshold = Config.KEY_FAILURE_THRESHOLD
+        self.auth_cooldown = Config.KEY_AUTH_COOLDOWN
+        self.rate_limit_cooldown = Config.KEY_RATE_LIMIT_COOLDOWN
+        self.max_cooldown = Config.KEY_MAX_COOLDOWN
+        self.trial_timeout = Config.API_TIMEOUT
+        self._lock = threading.RLock()
+        self._keys: Dict[str, List[KeyState]] = {}
+        self._cursors: Dict[str, int] = {}
+        self._loaded_at = 0.0
+        self._app = None
+        self._pid = None
+        self._worker = None
+        self._wakeup = threading.Event()
+    
+    def acquire(self, service: str) -> Optional[KeyState]:
+        """Pick the next healthy key for a service using round-robin"""
+        self._ensure_loaded()
+        
+        with self._lock:
+            keys = self._keys.get(service, [])
+            if not keys:
+                return None
+            
+            now = time.time()
+            start = self._cursors.get(service, 0)
+            for offset in range(len(keys)):
+                index = (start + offset) % len(keys)
+                key = keys[index]
+                if key.is_available(now, self.trial_timeout):
+                    if key.state == KeyState.HALF_OPEN:
+                        key.trial_started = now
+                    self._cursors[service] = index + 1
+                    key.last_used = datetime.utcnow()
+                    key.used_since_flush = True
+                    return key
+            
+            return None
+    
+    def has_keys(self, service: str) -> bool:
+        """Check whether any key is configured for a service"""
+        self._ensure_loaded()
+        with self._lock:
+            return bool(self._keys.get(service))
+    
+    def report(self, key: KeyState, status_code: Optional[int], retry_after: Optional[str] = None):
+        """Update key health from a real upstream response status"""
+        with self._lock:
+            previous_state = key.state
+            key.last_status = status_code
+            key.trial_started = 0.0
+            
+            if status_code is not None and status_code < 400:
+                key.state = KeyState.CLOSED
+                key.failures = 0
+                key.cooldown = 0
+                return
+            
+            if status_code in (401, 403):
+                # Rejected credentials will not recover on their own
+                self._open(key, self.auth_cooldown)
+                logging.warning(f"API key {key.name} rejected ({status_code}), disabled for {self.auth_cooldown}s")
+            elif status_code == 429:
+                cooldown = self.rate_limit_cooldown
+                if retry_after and retry_after.isdigit():
+                    cooldown = int(retry_after)
+                self._open(key, cooldown)
+                logging.warning(f"API key {key.name} rate limited, cooling down for {cooldown}s")
+            elif status_code is None or status_code >= 500:
+                key.failures += 1
+                if key.state == KeyState.HALF_OPEN or key.failures >= self.failure_threshold:
+                    self._open(key, min(self.max_cooldown, max(self.rate_limit_cooldown, key.cooldown * 2)))
+                    logging.warning(f"API key {key.name} failing ({status_code}), circuit opened")
+            
+            changed = key.state != previous_state
+        
+        # Only a breaker transition gives the maintenance loop new work
+        if changed:
+            self._wakeup.set()
+    
+    def _open(self, key: KeyState, cooldown: int):
+        """Open the circuit breaker for a key"""
+        key.state = KeyState.OPEN
+        key.cooldown = cooldown
+        key.open_until = time.time() + cooldown
+    
+    def invalidate(self):
+        """Force keys to be reloaded from the database on next use"""
+        with self._lock:
+            self._loaded_at = 0.0
+    
+    def get_stats(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Get health state of all registered keys"""
+        with self._lock:
+            return {
+                service: [key.to_dict() for key in keys]
+                for service, keys in self._keys.items()
+            }
+    
+    def _ensure_loaded(self):
+        """Load keys on first use and start the background worker"""
+        from flask import current_app
+        
+        with self._lock:
+            if self._pid != os.getpid():
+                # Fresh state in each forked worker
+                self._pid = os.getpid()
+                self._keys = {}
+                self._loaded_at = 0.0
+                self._worker = None
+            
+            if self._app is None:
+                self._app = current_app._get_current_object()
+            
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='key-registry', daemon=True)
+                self._worker.start()
+            
+            if self._loaded_at != 0.0:
+                return
+            if not self._keys:
+                # Nothing to serve yet, so callers wait for the first load
+                self._load()
+                return
+            # Reload after invalidate() while other threads keep the current keys
+            self._loaded_at = time.time()
+        
+        self._load()
+    
+    def _load(self):
+        """Load and decrypt active keys, keeping breaker state of known keys
+        
+        The database is read without holding the registry lock; only the swap
+        of the finished key lists happens under it.
+        """
+        with self._lock:
+            previous = {key.key_id: key for keys in self._keys.values() for key in keys}
+        
+        loaded = self._fetch(previous)
+        
+        with self._lock:
+            self._keys = loaded
+            self._loaded_at = time.time()
+    
+    def _fetch(self, previous: Dict[int, KeyState]) -> Dict[str, List[KeyState]]:
+        """Read and decrypt active keys from the database"""
+        from models import APIKey
+        from services.encryption_service import EncryptionService
+        
+        encryption_service = EncryptionService()
+        loaded: Dict[str, List[KeyState]] = {}
+        
+        for record in APIKey.query.filter_by(is_active=True).order_by(APIKey.id).all():
+            try:
+                api_key = encryption_service.decrypt(record.encrypted_key)
+            except Exception as e:
+                logging.warning(f"Skipping API key {record.key_name}: {e}")
+                continue
+            
+            key = previous.get(record.id)
+            if key is None or key.api_key != api_key:
+                key = KeyState(record.id, record.service, record.key_name, api_key)
+            loaded.setdefault(record.service, []).append(key)
+        
+        return loaded
+    
+    def _run(self):
+        """Background loop: refresh keys, re-probe open breakers, flush last_used"""
+        while True:
+            self._wakeup.wait(self.probe_interval)
+            self._wakeup.clear()
+            
+            try:
+                with self._app.app_context():
+                    if time.time() - self._loaded_at >= self.refresh_interval:
+                        self._flush_last_used()
+                        self._load()
+                    
+                    # The probe is the half-open trial for each due key
+                    now = time.time()
+                    with self._lock:
+                        candidates = [
+                            key for keys in self._keys.values() for key in keys
+                            if key.is_available(now, self.trial_timeout) and key.state == KeyState.HALF_OPEN
+                        ]
+                        for key in candidates:
+                            key.trial_started = now
+                    
+                    for key in candidates:
+                        self._probe(key)
+            except Exception as e:
+                logging.error(f"Key registry maintenance error: {e}")
+    
+    def _probe(self, key: KeyState):
+        """Re-probe a key whose breaker cooldown has elapsed"""
+        try:
+            if key.service == 'openrouter':
+                response = http_service.get(
+                    "https://openrouter.ai/api/v1/auth/key",
+                    headers={"Authorization": f"Bearer {key.api_key}"},
+                    timeout=10
+                )
+            elif key.service == 'google_ai':
+                response = http_service.get(
+                    "https://generativelanguage.googleapis.com/v1beta/models",
+                    params={"key": key.api_key, "pageSize": 1},
+                    timeout=10
+                )
+            else:
+                return
+            
+            self.report(key, response.status_code, response.headers.get('Retry-After'))
+        except Exception as e:
+            logging.warning(f"Error probing API key {key.name}: {e}")
+            self.report(key, None)
+    
+    def _flush_last_used(self):
+        """Persist last_used timestamps in one batch, off the request path"""
+        from models import APIKey
+        from app import db
+        
+        with self._lock:
+            used = [key for keys in self._keys.values() for key in keys if key.used_since_flush]
+            for key in used:
+                key.used_since_flush = False
+        if not used:
+            return
+        
+        try:
+            for key in used:
+                APIKey.query.filter_by(id=key.key_id).update({'last_used': key.last_used})
+            db.session.commit()
+        except Exception as e:
+            logging.warning(f"Error flushing API key usage: {e}")
+            db.session.rollback()
+            with self._lock:
+                for key in used:
+                    key.used_since_flush = True
+
+# Process-wide registry shared by all AIService instances
+key_registry = KeyHealthRegistry()
@@ -0,0 +1,90 @@
+from typing import Iterable, Optional
+
+# Common malicious patterns, matched case-insensitively
+DEFAULT_PATTERNS = [
+    b'<script',
+    b'javascript:',
+    b'vbscript:',
+    b'onload=',
+    b'onerror=',
+    b'eval(',
+    b'document.cookie',
+    b'window.location'
+]
+
+# Scan window: small enough to stay in CPU cache while every pattern is searched
+WINDOW_SIZE = 64 * 1024
+
+class ScanStream:
+    """Incremental scan over consecutive chunks of one input"""
+    
+    def __init__(self, scanner: "PatternScanner"):
+        self.scanner = scanner
+        self.tail = b''
+        self.matched = None
+    
+    def feed(self, chunk: bytes) -> bool:
+        """Scan the next chunk; returns True once any pattern has matched"""
+        if self.matched is not None:
+            return True
+        
+        overlap = self.scanner.overlap
+        for offset in range(0, len(chunk), WINDOW_SIZE):
+            window = (chunk if len(chunk) <= WINDOW_SIZE else chunk[offset:offset + WINDOW_SIZE]).lower()
+            
+            # Patterns spanning the previous window's end only need a short seam check
+            if self.tail:
+                self.matched = self.scanner.find_lowered(self.tail + window[:overlap])
+            if self.matched is None:
+                self.matched = self.scanner.find_lowered(window)
+            if self.matched is not None:
+                return True
+            
+            # Windows shorter than the overlap keep earlier tail bytes too
+            self.tail = (self.tail + window)[-overlap:] if overlap else b''
+        return False
+
+class PatternScanner:
+    """Case-insensitive multi-pattern search over bounded windows
+    
+    Each window is lowercased once and searched for every pattern with the C
+    substring search while it is still cache-hot, so the input is never copied
+    whole. A combined case-insensitive re alternation measured over 10x slower
+    in CPython; see benchmarks/bench_malware_scan.py.
+    """
+    
+    def __init__(self, patterns: Optional[Iterable[bytes]] = None):
+        patterns = DEFAULT_PATTERNS if patterns is None else patterns
+        # Lowercase once up front and drop duplicates, keeping order
+        self.patterns = list(dict.fromkeys(p.lower() for p in patterns))
+        if not self.patterns:
+            raise ValueError("PatternScanner needs at least one pattern")
+        self.overlap = max(len(p) for p in self.patterns) - 1
+    
+    def find_lowered(self, window: bytes) -> Optional[bytes]:
+        """Return the first pattern present in already-lowercased bytes, or None"""
+        for pattern in self.patterns:
+            if pattern in window:
+                return pattern
+        return None
+    
+    def find(self, data: bytes) -> Optional[bytes]:
+        """Return a matching pattern, or None"""
+        scan = self.stream()
+        scan.feed(data)
+        return scan.matched
+    
+    def scan(self, data: bytes) -> bool:
+        """Check a whole buffer using bounded window copies"""
+        return self.find(data) is not None
+    
+    def stream(self) -> ScanStream:
+        """Start an incremental scan for chunked input"""
+        return ScanStream(self)
+    
+    def with_patterns(self, extra: Iterable[bytes]) -> "PatternScanner":
+        """New scanner with additional patterns"""
+        return PatternScanner(self.patterns + list(extra))
+
+# Shared scanner for the default pattern set
+default_scanner = PatternScanner()
@@ -0,0 +1,130 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Dict, List, Iterable, Set
+
+class MemoryCache:
+    """Thread-safe in-process cache with per-entry TTL and LRU eviction"""
+    
+    def __init__(self, max_entries: int = 10000, default_timeout: int = 300):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def _expires_at(self, timeout: Optional[int]) -> float:
+        """Convert a timeout in seconds to a monotonic deadline (0 = never)"""
+        if timeout is None:
+            timeout = self.default_timeout
+        return time.monotonic() + timeout if timeout and timeout > 0 else 0.0
+    
+    def _is_expired(self, expires_at: float, now: float) -> bool:
+        """Check whether an entry deadline has passed"""
+        return bool(expires_at) and expires_at <= now
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Get a live value and mark it most recently used"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            
+            expires_at, value, _ = item
+            if self._is_expired(expires_at, time.monotonic()):
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key: str, value: Any, timeout: Optional[int] = None, tags: Optional[Iterable[str]] = None) -> bool:
+        """Store a value, evicting least recently used entries when full"""
+        expires_at = self._expires_at(timeout)
+        tags = tuple(tags or ())
+        
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (expires_at, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            self._evict()
+        return True
+    
+    def delete(self, key: str) -> bool:
+        """Remove a value"""
+        with self._lock:
+            return self._remove(key)
+    
+    def delete_tag(self, tag: str) -> List[str]:
+        """Remove every value stored under a tag and return their keys"""
+        with self._lock:
+            keys = list(self._tags.pop(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return keys
+    
+    def _remove(self, key: str) -> bool:
+        """Remove a key and its tag index entries (lock must be held)"""
+        item = self._data.pop(key, None)
+        if item is None:
+            return False
+        
+        for tag in item[2]:
+            members = self._tags.get(tag)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self._tags[tag]
+        return True
+    
+    def keys(self) -> List[str]:
+        """Snapshot of stored keys, including not yet purged expired ones"""
+        with self._lock:
+            return list(self._data.keys())
+    
+    def clear(self):
+        """Remove all values"""
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+    
+    def _evict(self):
+        """Drop expired entries at the LRU end, then enforce the size bound"""
+        now = time.monotonic()
+        while self._data:
+            oldest_key, (expires_at, _, _) = next(iter(self._data.items()))
+            if not self._is_expired(expires_at, now):
+                break
+            self._remove(oldest_key)
+            self.expirations += 1
+        
+        while len(self._data) > self.max_entries:
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Get size and hit/miss/eviction counters"""
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'tags': len(self._tags),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,162 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+from config import Config
+from services.http_service import http_service
+from services.serialization_service import json_dumps
+
+# Served until the first successful fetch, and whenever OpenRouter is unreachable
+FALLBACK_MODELS = (
+    ('openai/gpt-3.5-turbo', 'GPT-3.5 Turbo'),
+    ('openai/gpt-4', 'GPT-4'),
+    ('openai/gpt-4-turbo', 'GPT-4 Turbo'),
+    ('anthropic/claude-3-haiku', 'Claude 3 Haiku'),
+    ('anthropic/claude-3-sonnet', 'Claude 3 Sonnet'),
+    ('anthropic/claude-3-opus', 'Claude 3 Opus'),
+    ('google/gemini-pro', 'Gemini Pro'),
+    ('meta-llama/llama-2-70b-chat', 'Llama 2 70B'),
+    ('mistralai/mixtral-8x7b-instruct', 'Mixtral 8x7B'),
+    ('perplexity/llama-3-sonar-large-32k-online', 'Perplexity Sonar')
+)
+
+class ModelInfo:
+    """One entry of the model catalog"""
+    
+    __slots__ = ('id', 'name', 'context_length', 'pricing')
+    
+    def __init__(self, model_id: str, name: str, context_length: Optional[int], pricing: Dict[str, str]):
+        self.id = model_id
+        self.name = name
+        self.context_length = context_length
+        self.pricing = pricing
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'context_length': self.context_length,
+            'pricing': self.pricing
+        }
+
+class ModelCatalog:
+    """OpenRouter's model list, refreshed in the background and indexed by id
+    
+    Requests never wait on OpenRouter: a daemon thread in each worker fetches
+    /models on a TTL, and lookups read an immutable snapshot (a dict for O(1)
+    validation plus the pre-serialized /api/models body and its ETag) that is
+    swapped in whole after each successful fetch.
+    """
+    
+    def __init__(self):
+        self.url = Config.MODEL_CATALOG_URL
+        self.ttl = Config.MODEL_CATALOG_TTL
+        self.retry_interval = Config.MODEL_CATALOG_RETRY_INTERVAL
+        self.default_model = Config.DEFAULT_MODEL
+        self._lock = threading.Lock()
+        self._pid = None
+        self._worker = None
+        self._wakeup = threading.Event()
+        self._snapshot = self._build_snapshot(self._fallback_models(), source='fallback')
+        self.stats = {'refreshes': 0, 'failures': 0, 'fetched_at': None}
+    
+    def _fallback_models(self) -> Dict[str, ModelInfo]:
+        return {
+            model_id: ModelInfo(model_id, name, Config.MODEL_CONTEXT_LIMITS.get(model_id), {})
+            for model_id, name in FALLBACK_MODELS
+        }
+    
+    def _build_snapshot(self, models: Dict[str, ModelInfo], source: str) -> Dict[str, Any]:
+        """Index plus the serialized listing, computed once per refresh"""
+        listing = sorted((model.to_dict() for model in models.values()), key=lambda m: (m['name'] or m['id']).lower())
+        body = json_dumps({'models': listing, 'default': self.default_model, 'source': source})
+        return {
+            'models': models,
+            'body': body,
+            'etag': hashlib.sha256(body).hexdigest()[:32],
+            'source': source
+        }
+    
+    def _ensure_started(self):
+        """Start the refresh thread once per worker process"""
+        if self._pid == os.getpid() and self._worker is not None:
+            return
+        
+        with self._lock:
+            if self._pid != os.getpid() or self._worker is None:
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name='model-catalog', daemon=True)
+                self._worker.start()
+    
+    def _run(self):
+        """Background loop: fetch now, then again every TTL (sooner after a failure)"""
+        while True:
+            interval = self.ttl if self.refresh() else self.retry_interval
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+    
+    def refresh(self) -> bool:
+        """Fetch /models and swap in a new snapshot; keeps the old one on failure"""
+        try:
+            response = http_service.get(self.url, timeout=15)
+            if response.status_code != 200:
+                raise ValueError(f"HTTP {response.status_code}")
+            
+            models = {}
+            for entry in response.json().get('data', []):
+                model_id = entry.get('id')
+                if not model_id:
+                    continue
+                pricing = entry.get('pricing') or {}
+                models[model_id] = ModelInfo(
+                    model_id,
+                    entry.get('name') or model_id,
+                    entry.get('context_length'),
+                    {'prompt': pricing.get('prompt'), 'completion': pricing.get('completion')}
+                )
+            if not models:
+                raise ValueError("empty model list")
+            
+            self._snapshot = self._build_snapshot(models, source='openrouter')
+            self.stats['refreshes'] += 1
+            self.stats['fetched_at'] = time.time()
+            return True
+        except Exception as e:
+            self.stats['failures'] += 1
+            logging.warning(f"Model catalog refresh failed: {e}")
+            return False
+    
+    def get(self, model_id: Optional[str]) -> Optional[ModelInfo]:
+        """Catalog entry for a model id, or None"""
+        self._ensure_started()
+        if not model_id:
+            return None
+        return self._snapshot['models'].get(model_id)
+    
+    def is_valid(self, model_id: Optional[str]) -> bool:
+        """Whether a model id exists, checked locally; the configured default is always accepted"""
+        # The id comes straight from request JSON and may be a list or object
+        if not isinstance(model_id, str):
+            return False
+        return model_id == self.default_model or self.get(model_id) is not None
+    
+    def context_length(self, model_id: Optional[str]) -> Optional[int]:
+        """Context window reported by the catalog, if known"""
+        model = self.get(model_id)
+        return model.context_length if model else None
+    
+    def listing(self) -> Tuple[bytes, str]:
+        """Serialized /api/models body and its ETag"""
+        self._ensure_started()
+        snapshot = self._snapshot
+        return snapshot['body'], snapshot['etag']
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Refresh counters and the size of the current snapshot"""
+        snapshot = self._snapshot
+        return {**self.stats, 'source': snapshot['source'], 'models': len(snapshot['models'])}
+
+# Process-wide catalog; the refresh thread starts on first use in each worker
+model_catalog = ModelCatalog()
@@ -0,0 +1,206 @@
+import io
+import os
+import time
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Tuple, Union
+import PyPDF2
+from config import Config
+
+TRUNCATION_MARKER = "\n... (content truncated)"
+
+def extract_page_range(source: Union[str, bytes], start: int, stop: int) -> List[str]:
+    """Extract text for pages [start, stop) from a file path or bytes; runs inside a pool process"""
+    reader = PyPDF2.PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+    texts = []
+    for i in range(start, stop):
+        try:
+            texts.append(reader.pages[i].extract_text())
+        except Exception as e:
+            logging.warning(f"Error extracting text from PDF page {i}: {e}")
+            texts.append(None)
+    return texts
+
+class ShardTask:
+    """Pages [start, stop) and the pool run currently extracting them
+    
+    attempts counts runs lost to pool restarts, not page failures.
+    """
+    
+    __slots__ = ('start', 'stop', 'pool', 'future', 'deadline', 'attempts')
+    
+    def __init__(self, start: int, stop: int):
+        self.start = start
+        self.stop = stop
+        self.pool = None
+        self.future = None
+        self.deadline = 0.0
+        self.attempts = 0
+    
+    @property
+    def pages(self) -> int:
+        return self.stop - self.start
+    
+    def needs_run(self) -> bool:
+        """No run yet, or the last one was cancelled or failed with its pool"""
+        future = self.future
+        if future is None:
+            return True
+        if not future.done():
+            return False
+        return future.cancelled() or isinstance(future.exception(), BrokenProcessPool)
+
+class PDFExtractor:
+    """Page-sharded PDF text extraction on a spawn-context process pool"""
+    
+    def __init__(self):
+        self.max_workers = Config.PDF_EXTRACT_WORKERS
+        self.pages_per_shard = Config.PDF_PAGES_PER_SHARD
+        self.page_timeout = Config.PDF_PAGE_TIMEOUT
+        self.max_attempts = Config.PDF_SHARD_ATTEMPTS
+        self.extract_fn: Callable[..., List[Optional[str]]] = extract_page_range
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pool = None
+    
+    def _pool_for_process(self) -> ProcessPoolExecutor:
+        """Get the process pool, rebuilt after a fork or a hung shard"""
+        with self._lock:
+            pid = os.getpid()
+            if self._pid != pid or self._pool is None:
+                # spawn: never fork a threaded gunicorn worker
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pid = pid
+            return self._pool
+    
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        """Drop a pool whose worker is stuck so later uploads get fresh processes"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        # shutdown() forgets the processes, so take them first
+        processes = list((getattr(pool, '_processes', None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+    
+    def _shards(self, page_count: int) -> List[Tuple[int, int]]:
+        return [
+            (start, min(start + self.pages_per_shard, page_count))
+            for start in range(0, page_count, self.pages_per_shard)
+        ]
+    
+    def extract_text(self, content: bytes, page_count: int, text_limit: int) -> str:
+        """Extract page text in order, stopping once text_limit characters are collected"""
+        shards = self._shards(page_count)
+        if len(shards) <= 1 or self.max_workers <= 1:
+            return self._assemble((extract_page_range(content, start, stop) for start, stop in shards), text_limit)
+        
+        # Shards get a path, not a pickled copy of the whole document each
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            return self._extract_sharded(path, shards, text_limit)
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def _submit(self, tasks: List[ShardTask], path: str):
+        """(Re)submit tasks that have no live run, with deadlines counted from now
+        
+        Each wave of max_workers tasks gets the page timeout of its largest task,
+        so tasks queued behind others are not charged for the wait.
+        """
+        tasks = [task for task in tasks if task.needs_run()]
+        if not tasks:
+            return
+        budget = self.page_timeout * max(task.pages for task in tasks)
+        now = time.monotonic()
+        
+        for position, task in enumerate(tasks):
+            pool = self._pool_for_process()
+            try:
+                task.future = pool.submit(self.extract_fn, path, task.start, task.stop)
+            except (BrokenProcessPool, RuntimeError):
+                # Another upload recycled the shared pool between lookup and submit
+                self._discard_pool(pool)
+                pool = self._pool_for_process()
+                task.future = pool.submit(self.extract_fn, path, task.start, task.stop)
+            task.pool = pool
+            task.deadline = now + budget * (position // self.max_workers + 1)
+    
+    def _extract_sharded(self, path: str, shards: List[Tuple[int, int]], text_limit: int) -> str:
+        tasks = [ShardTask(start, stop) for start, stop in shards]
+        self._submit(tasks, path)
+        
+        def results():
+            i = 0
+            while i < len(tasks):
+                task = tasks[i]
+                try:
+                    texts = task.future.result(timeout=max(0, task.deadline - time.monotonic()))
+                except FutureTimeoutError:
+                    # The stuck worker can only be stopped by recycling the pool
+                    self._discard_pool(task.pool)
+                    if task.pages > 1:
+                        # Retry page by page so only the page that hangs is lost
+                        logging.warning(f"PDF pages {task.start}-{task.stop - 1} timed out, retrying page by page")
+                        tasks[i:i + 1] = [ShardTask(page, page + 1) for page in range(task.start, task.stop)]
+                    else:
+                        logging.warning(f"PDF page {task.start} timed out after {self.page_timeout}s, skipping")
+                        i += 1
+                        yield [None]
+                    self._submit(tasks[i:], path)
+                except (CancelledError, BrokenProcessPool) as e:
+                    # Lost to a pool restart caused by this or another upload, not to the page itself
+                    task.attempts += 1
+                    if task.attempts >= self.max_attempts:
+                        logging.warning(f"PDF pages {task.start}-{task.stop - 1} lost to pool restarts, skipping: {e!r}")
+                        i += 1
+                        yield [None] * task.pages
+                    self._submit(tasks[i:], path)
+                except Exception as e:
+                    logging.warning(f"Error extracting text from PDF pages {task.start}-{task.stop - 1}: {e}")
+                    i += 1
+                    yield [None] * task.pages
+                else:
+                    i += 1
+                    yield texts
+        
+        try:
+            return self._assemble(results(), text_limit)
+        finally:
+            # Pages past the budget are not needed
+            for task in tasks:
+                if task.future is not None:
+                    task.future.cancel()
+    
+    def _assemble(self, shard_results, text_limit: int) -> str:
+        """Join page texts in order, with one newline per page, up to the budget"""
+        parts = []
+        length = 0
+        for texts in shard_results:
+            for text in texts:
+                if text is None:
+                    continue
+                parts.append(text)
+                parts.append("\n")
+                length += len(text) + 1
+                
+                if length > text_limit:
+                    parts.append(TRUNCATION_MARKER)
+                    return "".join(parts)
+        return "".join(parts)
+
+# Process-wide extractor, pool started lazily in each worker
+pdf_extractor = PDFExtractor()
@@ -0,0 +1,187 @@
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Optional, Tuple
+from flask import current_app, g
+from sqlalchemy import update, case, or_
+from app import db
+from models import User
+
+# Atomically check and consume an anonymous quota in Redis.
+# KEYS[1] = counter, ARGV = amount, limit, window seconds. Returns {allowed, used}.
+CONSUME_SCRIPT = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local amount = tonumber(ARGV[1])
+if used + amount > tonumber(ARGV[2]) then
+    return {0, used}
+end
+used = redis.call('INCRBY', KEYS[1], amount)
+if used == amount then
+    redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+end
+return {1, used}
+"""
+
+# Give quota back without resurrecting an expired counter
+REFUND_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('DECRBY', KEYS[1], tonumber(ARGV[1]))
+end
+return 0
+"""
+
+class QuotaService:
+    """Check-and-consume message quotas in one atomic step"""
+    
+    def __init__(self, cache_service):
+        self.cache_service = cache_service
+        self.anonymous_limit = current_app.config.get('ANON_MESSAGE_LIMIT', 10)
+        self.anonymous_window = current_app.config.get('ANON_LIMIT_WINDOW', 300)
+        self._consume_script = None
+        self._refund_script = None
+        self._local_lock = threading.Lock()
+        
+        if cache_service.redis_client:
+            self._consume_script = cache_service.redis_client.register_script(CONSUME_SCRIPT)
+            self._refund_script = cache_service.redis_client.register_script(REFUND_SCRIPT)
+    
+    def _anonymous_key(self, session_id: str) -> str:
+        return f"quota:anon:{session_id}"
+    
+    def limit_error(self, user: Any) -> str:
+        """Message returned when a quota is exhausted"""
+        if user.is_authenticated:
+            return 'Daily message limit reached'
+        return 'Message limit reached. Please sign in to continue.'
+    
+    def consume(self, user: Any, session_id: Optional[str], amount: int = 1) -> Tuple[bool, int]:
+        """Consume quota if available; returns (allowed, messages remaining)
+        
+        When the quota backend is unreachable the request is let through: an
+        outage must not look like every user running out of messages.
+        """
+        try:
+            if user.is_authenticated:
+                allowed, remaining = self._consume_user(user.id, amount)
+            else:
+                allowed, remaining = self._consume_anonymous(session_id, amount)
+        except Exception as e:
+            logging.error(f"Quota backend unavailable, allowing request: {e}")
+            return True, self.remaining(user, session_id)
+        
+        # Answer get_messages_remaining for this request without another lookup
+        g.messages_remaining = remaining
+        return allowed, remaining
+    
+    def refund(self, user: Any, session_id: Optional[str], amount: int = 1):
+        """Give back quota consumed for a request that did not complete"""
+        self.refund_owner(user.id if user.is_authenticated else None, session_id, amount)
+    
+    def refund_owner(self, user_id: Optional[str], session_id: Optional[str], amount: int = 1):
+        """Refund by owner ids, for work that finishes outside the request"""
+        try:
+            if user_id:
+                today = datetime.utcnow().date()
+                db.session.execute(
+                    update(User)
+                    .where(User.id == user_id, User.last_message_date == today, User.messages_used_today >= amount)
+                    .values(messages_used_today=User.messages_used_today - amount)
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+            elif self._refund_script is not None:
+                key = self.cache_service._get_key(self._anonymous_key(session_id))
+                self._refund_script(keys=[key], args=[amount])
+            else:
+                key = self.cache_service._get_key(self._anonymous_key(session_id))
+                with self._local_lock:
+                    used = self.cache_service.memory_cache.get(key)
+                    if used:
+                        self.cache_service.memory_cache.set(key, max(0, used - amount), self.anonymous_window)
+            
+            if 'messages_remaining' in g and g.messages_remaining != -1:
+                g.messages_remaining += amount
+        except Exception as e:
+            logging.error(f"Quota refund error: {e}")
+            db.session.rollback()
+    
+    def reset(self, session_id: str):
+        """Reset an anonymous session's quota"""
+        key = self.cache_service._get_key(self._anonymous_key(session_id))
+        if self.cache_service.redis_client:
+            self.cache_service.redis_client.delete(key)
+        else:
+            self.cache_service.memory_cache.delete(key)
+        g.pop('messages_remaining', None)
+    
+    def remaining(self, user: Any, session_id: Optional[str]) -> int:
+        """Messages remaining, -1 for unlimited"""
+        if 'messages_remaining' in g:
+            return g.messages_remaining
+        
+        if user.is_authenticated:
+            if user.role == 'vip' or user.is_creator:
+                return -1
+            if user.last_message_date != datetime.utcnow().date():
+                return user.daily_message_limit
+            return max(0, user.daily_message_limit - user.messages_used_today)
+        
+        if not session_id:
+            return self.anonymous_limit
+        return max(0, self.anonymous_limit - self._anonymous_used(session_id))
+    
+    def _consume_user(self, user_id: str, amount: int) -> Tuple[bool, int]:
+        """Conditional UPDATE ... RETURNING: resets on a new day, increments under the limit"""
+        today = datetime.utcnow().date()
+        used_today = case((User.last_message_date == today, User.messages_used_today), else_=0)
+        unlimited = or_(User.role == 'vip', User.is_creator.is_(True))
+        
+        try:
+            row = db.session.execute(
+                update(User)
+                .where(User.id == user_id, or_(unlimited, used_today + amount <= User.daily_message_limit))
+                .values(messages_used_today=used_today + amount, last_message_date=today)
+                .returning(User.messages_used_today, User.daily_message_limit, User.role, User.is_creator)
+                .execution_options(synchronize_session=False)
+            ).first()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        
+        if row is None:
+            return False, 0
+        
+        used, limit, role, is_creator = row
+        if role == 'vip' or is_creator:
+            return True, -1
+        return True, max(0, limit - used)
+    
+    def _consume_anonymous(self, session_id: str, amount: int) -> Tuple[bool, int]:
+        """Redis Lua check-and-increment, or a locked in-process counter"""
+        key = self.cache_service._get_key(self._anonymous_key(session_id))
+        
+        if self._consume_script is not None:
+            allowed, used = self._consume_script(
+                keys=[key], args=[amount, self.anonymous_limit, self.anonymous_window]
+            )
+            return bool(allowed), max(0, self.anonymous_limit - int(used))
+        
+        with self._local_lock:
+            used = self.cache_service.memory_cache.get(key) or 0
+            if used + amount > self.anonymous_limit:
+                return False, max(0, self.anonymous_limit - used)
+            used += amount
+            self.cache_service.memory_cache.set(key, used, self.anonymous_window)
+            return True, max(0, self.anonymous_limit - used)
+    
+    def _anonymous_used(self, session_id: str) -> int:
+        """Messages used by an anonymous session in the current window"""
+        key = self.cache_service._get_key(self._anonymous_key(session_id))
+        try:
+            if self.cache_service.redis_client:
+                return int(self.cache_service.redis_client.get(key) or 0)
+            return self.cache_service.memory_cache.get(key) or 0
+        except Exception as e:
+            logging.error(f"Quota lookup error: {e}")
+            return 0
@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional
+from config import Config
+from services.serialization_service import json_dumps, json_loads
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+_WHITESPACE = re.compile(r'\s+')
+
+# Release the cross-worker lock only if we still own it
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Handed to in-worker waiters when the leader's result must not be reused
+_NOT_SHARED = object()
+
+class RequestCoalescer:
+    """Single-flight for identical completion requests
+    
+    The first caller for a key (the leader) makes the upstream call; callers
+    that arrive while it is in flight wait and get the same result. Within a
+    worker the waiters share a Future. Across workers, when Redis is
+    configured, the leader holds a short SET NX lock and publishes its result
+    under a short-lived key that waiters in other workers poll for.
+    
+    Only requests that overlap in time are merged; once the leader finishes,
+    the next identical request makes a fresh call. Results the caller marks as
+    not shareable (errors) and leader exceptions are never handed on: waiters
+    in this worker and in other workers make their own call instead, as do
+    waiters still waiting after wait_timeout.
+    """
+    
+    def __init__(self):
+        self.enabled = Config.COALESCE_ENABLED
+        self.wait_timeout = Config.COALESCE_WAIT_TIMEOUT
+        self.lock_timeout = Config.COALESCE_LOCK_TIMEOUT
+        self.result_timeout = Config.COALESCE_RESULT_TIMEOUT
+        self.redis_url = Config.CACHE_REDIS_URL
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._pid = None
+        self._redis = None
+        self._release = None
+        self.stats = {'leaders': 0, 'coalesced': 0, 'fallbacks': 0, 'remote_coalesced': 0, 'remote_fallbacks': 0}
+    
+    def key(self, model: str, messages: List[Dict[str, str]], temperature: Any, max_tokens: Any) -> str:
+        """Stable key for a request; whitespace differences in messages do not matter"""
+        normalized = [
+            [str(message.get('role', '')).lower(), _WHITESPACE.sub(' ', str(message.get('content') or '')).strip()]
+            for message in messages
+        ]
+        payload = json_dumps([model, normalized, temperature, max_tokens])
+        return hashlib.sha256(payload).hexdigest()
+    
+    def _redis_client(self):
+        """Redis client for this process, or None when cross-worker coalescing is off"""
+        if not (REDIS_AVAILABLE and self.redis_url):
+            return None
+        
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                try:
+                    self._redis = redis.from_url(self.redis_url, decode_responses=False)
+                    self._release = self._redis.register_script(_RELEASE_SCRIPT)
+                except Exception as e:
+                    logging.warning(f"Request coalescing limited to this worker: {e}")
+                    self._redis = None
+            return self._redis
+    
+    def run(self, key: str, compute: Callable[[], Any], shareable: Callable[[Any], bool] = lambda result: True) -> Any:
+        """Return compute()'s result, sharing one call among concurrent callers with the same key"""
+        if not self.enabled:
+            return compute()
+        
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+        
+        if not leader:
+            try:
+                result = future.result(timeout=self.wait_timeout)
+            except FutureTimeoutError:
+                # The leader is slow; stop following it rather than fail the request
+                self.stats['fallbacks'] += 1
+                return compute()
+            if result is _NOT_SHARED:
+                # The leader got an error, e.g. a 429 on its key; ours may still work
+                self.stats['fallbacks'] += 1
+                return compute()
+            self.stats['coalesced'] += 1
+            return result
+        
+        try:
+            result = self._run_across_workers(key, compute, shareable)
+            future.set_result(result if shareable(result) else _NOT_SHARED)
+            return result
+        except BaseException:
+            if not future.done():
+                future.set_result(_NOT_SHARED)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+    
+    def _run_across_workers(self, key: str, compute: Callable[[], Any], shareable: Callable[[Any], bool]) -> Any:
+        client = self._redis_client()
+        if client is None:
+            self.stats['leaders'] += 1
+            return compute()
+        
+        lock_key = f"cyberchat:coalesce:lock:{key}"
+        token = uuid.uuid4().hex
+        
+        try:
+            leader_token = None
+            for _ in range(2):
+                if client.set(lock_key, token, nx=True, ex=self.lock_timeout):
+                    break
+                leader_token = client.get(lock_key)
+                if leader_token is not None:
+                    break
+                # Lock released between the two calls; try to take it again
+        except Exception as e:
+            logging.warning(f"Coalescing lock error: {e}")
+            self.stats['leaders'] += 1
+            return compute()
+        
+        if leader_token is not None:
+            result = self._wait_for_result(client, lock_key, leader_token)
+            if result is not None:
+                self.stats['remote_coalesced'] += 1
+                return result['v']
+            # Leader failed or its result was not shareable: make our own call
+            self.stats['remote_fallbacks'] += 1
+            self.stats['leaders'] += 1
+            return compute()
+        
+        self.stats['leaders'] += 1
+        try:
+            result = compute()
+            if shareable(result):
+                try:
+                    client.set(self._result_key(lock_key, token), json_dumps({'v': result}), ex=self.result_timeout)
+                except Exception as e:
+                    logging.warning(f"Coalescing publish error: {e}")
+            return result
+        finally:
+            try:
+                self._release(keys=[lock_key], args=[token])
+            except Exception as e:
+                logging.warning(f"Coalescing unlock error: {e}")
+    
+    def _result_key(self, lock_key: str, token) -> str:
+        """Results are per flight, so a late waiter never picks up an earlier flight's answer"""
+        if isinstance(token, bytes):
+            token = token.decode()
+        return f"{lock_key}:result:{token}"
+    
+    def _wait_for_result(self, client, lock_key: str, leader_token: bytes) -> Optional[Dict[str, Any]]:
+        """Poll for the leader's result until it appears or the leader's lock goes away"""
+        result_key = self._result_key(lock_key, leader_token)
+        deadline = time.time() + self.wait_timeout
+        delay = 0.05
+        while time.time() < deadline:
+            try:
+                raw = client.get(result_key)
+                if raw is not None:
+                    return json_loads(raw)
+                if client.get(lock_key) != leader_token:
+                    # One last look: the result is written just before the lock is released
+                    raw = client.get(result_key)
+                    return json_loads(raw) if raw is not None else None
+            except Exception as e:
+                logging.warning(f"Coalescing wait error: {e}")
+                return None
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+        return None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Leader/follower counters and the number of keys in flight"""
+        with self._lock:
+            inflight = len(self._inflight)
+        return {**self.stats, 'inflight': inflight, 'redis': self._redis is not None}
+
+# Process-wide coalescer shared by all AIService instances
+request_coalescer = RequestCoalescer()
@@ -1,68 +1,57 @@
+import hashlib
 import requests
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from urllib.parse import quote_plus
+from flask import current_app
+from services.upstream_gateway import upstream_gateway
+
+class NoSearchResults(Exception):
+    """Raised when the search API has nothing for a query"""
+
+class SearchUnavailable(Exception):
+    """Raised when the search API answers with an error status"""
 
 class SearchService:
-    def __init__(self):
+    def __init__(self, cache_service=None):
         self.duckduckgo_api = "https://api.duckduckgo.com/"
+        self.cache_service = cache_service
+        self.cache_timeout = current_app.config.get('SEARCH_CACHE_TIMEOUT', 1800)
+        self.stale_timeout = current_app.config.get('SEARCH_STALE_TIMEOUT', 3600)
+        self.negative_timeout = current_app.config.get('SEARCH_NEGATIVE_TIMEOUT', 300)
+    
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Case-fold and collapse whitespace so equivalent queries share a cache entry"""
+        return " ".join(query.casefold().split())
+    
+    def cache_key(self, query: str) -> str:
+        """Stable cache key for a query, identical across workers and restarts"""
+        digest = hashlib.sha256(self.normalize_query(query).encode()).hexdigest()
+        return f"search:results:{digest}"
     
     def search(self, query: str) -> str:
         """Search using DuckDuckGo and return formatted results"""
         try:
-            # Use DuckDuckGo Instant Answer API
-            params = {
-                'q': query,
-                'format': 'json',
-                'no_redirect': '1',
-                'no_html': '1',
-                'skip_disambig': '1'
-            }
-            
-            response = requests.get(self.duckduckgo_api, params=params, timeout=10)
-            
-            if response.status_code != 200:
-                return f"❌ Search service unavailable (Status: {response.status_code})"
-            
-            data = response.json()
-            
-            # Format search results
-            results = []
-            
-            # Abstract (main answer)
-            if data.get('Abstract'):
-                results.append(f"## 🔍 Search Results for: {query}\n")
-                results.append(f"**{data.get('AbstractText', '')}**\n")
-                if data.get('AbstractURL'):
-                    results.append(f"[Read more]({data.get('AbstractURL')})\n")
-            
-            # Related topics
-            if data.get('RelatedTopics'):
-                results.append("### Related Topics:\n")
-                for i, topic in enumerate(data['RelatedTopics'][:5]):  # Limit to 5
-                    if isinstance(topic, dict) and topic.get('Text'):
-                        results.append(f"{i+1}. {topic['Text']}")
-                        if topic.get('FirstURL'):
-                            results.append(f"   [Link]({topic['FirstURL']})")
-                        results.append("")
+            if self.cache_service is None:
+                return self._format(query, self._fetch(query))
             
-            # Answer (direct answer)
-            if data.get('Answer'):
-                results.append(f"### Quick Answer:\n{data['Answer']}\n")
-            
-            # Definition
-            if data.get('Definition'):
-                results.append(f"### Definition:\n{data['Definition']}")
-                if data.get('DefinitionURL'):
-                    results.append(f"[Source]({data['DefinitionURL']})")
-                results.append("")
-            
-            if not results:
-                # Fallback: try web search with limited results
-                return self._fallback_search(query)
-            
-            return "\n".join(results)
+            # Only the result fields are cached; each caller sees their own query text.
+            # Stale results are served while one worker refreshes in the background.
+            key = self.cache_key(query)
+            results = self.cache_service.get_or_compute(
+                key,
+                lambda: self._compute(key, query),
+                self.cache_timeout,
+                stale_timeout=self.stale_timeout,
+                background=True
+            )
+            return self._format(query, results)
             
+        except NoSearchResults:
+            return self._fallback_search(query)
+        except SearchUnavailable as e:
+            return f"❌ Search service unavailable (Status: {e})"
         except requests.exceptions.Timeout:
             return "⏳ Search request timed out. Please try again."
         except requests.exceptions.RequestException as e:
@@ -72,6 +61,89 @@ class SearchService:
             logging.error(f"Search error: {e}")
             return f"❌ An error occurred during search: {str(e)}"
     
+    def _compute(self, key: str, query: str) -> Dict[str, Any]:
+        """Fetch results for get_or_compute, remembering queries that found nothing
+        
+        Checked here rather than before get_or_compute so callers that waited on
+        a leader whose query found nothing reuse its answer instead of refetching.
+        """
+        if self.cache_service.get(f"{key}:none"):
+            raise NoSearchResults(query)
+        try:
+            return self._fetch(query)
+        except NoSearchResults:
+            self.cache_service.set(f"{key}:none", True, self.negative_timeout)
+            raise
+    
+    def _fetch(self, query: str) -> Dict[str, Any]:
+        """Query DuckDuckGo and keep the result fields; errors raise so they are never cached"""
+        # Use DuckDuckGo Instant Answer API
+        params = {
+            'q': query,
+            'format': 'json',
+            'no_redirect': '1',
+            'no_html': '1',
+            'skip_disambig': '1'
+        }
+        
+        response = upstream_gateway.get(self.duckduckgo_api, params=params)
+        
+        if response.status_code != 200:
+            raise SearchUnavailable(response.status_code)
+        
+        data = response.json()
+        
+        results = {
+            field: data[field]
+            for field in ('Abstract', 'AbstractText', 'AbstractURL', 'Answer', 'Definition', 'DefinitionURL')
+            if data.get(field)
+        }
+        if data.get('RelatedTopics'):
+            results['RelatedTopics'] = [
+                {'Text': topic['Text'], 'FirstURL': topic.get('FirstURL')}
+                for topic in data['RelatedTopics'][:5]  # Limit to 5
+                if isinstance(topic, dict) and topic.get('Text')
+            ]
+        
+        if not self._format(query, results):
+            # Negative-cached by _compute; search() answers with the fallback page
+            raise NoSearchResults(query)
+        
+        return results
+    
+    def _format(self, query: str, data: Dict[str, Any]) -> str:
+        """Format cached result fields for the caller's own query"""
+        results = []
+        
+        # Abstract (main answer)
+        if data.get('Abstract'):
+            results.append(f"## 🔍 Search Results for: {query}\n")
+            results.append(f"**{data.get('AbstractText', '')}**\n")
+            if data.get('AbstractURL'):
+                results.append(f"[Read more]({data.get('AbstractURL')})\n")
+        
+        # Related topics
+        if data.get('RelatedTopics'):
+            results.append("### Related Topics:\n")
+            for i, topic in enumerate(data['RelatedTopics']):
+                results.append(f"{i+1}. {topic['Text']}")
+                if topic.get('FirstURL'):
+                    results.append(f"   [Link]({topic['FirstURL']})")
+                results.append("")
+        
+        # Answer (direct answer)
+        if data.get('Answer'):
+            results.append(f"### Quick Answer:\n{data['Answer']}\n")
+        
+        # Definition
+        if data.get('Definition'):
+            results.append(f"### Definition:\n{data['Definition']}")
+            if data.get('DefinitionURL'):
+                results.append(f"[Source]({data['DefinitionURL']})")
+            results.append("")
+        
+        return "\n".join(results)
+    
     def _fallback_search(self, query: str) -> str:
         """Fallback search method when main search returns no results"""
         return f"""## 🔍 Search Results for: {query}
@@ -10,9 +10,20 @@ from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import base64
+from services.malware_scanner import PatternScanner, default_scanner, DEFAULT_PATTERNS as MALICIOUS_PATTERNS
+
+# Expected MIME types for each allowed file extension
+EXPECTED_MIME_TYPES = {
+    '.txt': ['text/plain'],
+    '.pdf': ['application/pdf'],
+    '.jpg': ['image/jpeg'],
+    '.jpeg': ['image/jpeg'],
+    '.png': ['image/png']
+}
 
 class SecurityService:
-    def __init__(self):
+    def __init__(self, scanner: Optional[PatternScanner] = None):
+        self.scanner = scanner or default_scanner
         self.allowed_tags = ['p', 'br', 'strong', 'em', 'u', 'ol', 'ul', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']
         self.allowed_attributes = {}
         
@@ -31,45 +42,24 @@ class SecurityService:
             # Get MIME type from file content
             mime_type = magic.from_buffer(header, mime=True)
             
-            # Get expected MIME types for file extension
-            filename = file.filename.lower()
-            expected_types = {
-                '.txt': ['text/plain'],
-                '.pdf': ['application/pdf'],
-                '.jpg': ['image/jpeg'],
-                '.jpeg': ['image/jpeg'],
-                '.png': ['image/png']
-            }
-            
-            for ext, types in expected_types.items():
-                if filename.endswith(ext):
-                    return mime_type in types
-            
-            return False
+            return self.signature_matches(file.filename, mime_type)
         except Exception:
             return False
     
+    def signature_matches(self, filename: str, mime_type: str) -> bool:
+        """Check a sniffed MIME type against the types expected for the file extension"""
+        filename = filename.lower()
+        for ext, types in EXPECTED_MIME_TYPES.items():
+            if filename.endswith(ext):
+                return mime_type in types
+        
+        return False
+    
     def scan_for_malicious_content(self, file_content: bytes) -> bool:
         """Basic malicious content detection"""
         try:
-            # Check for common malicious patterns
-            malicious_patterns = [
-                b'<script',
-                b'javascript:',
-                b'vbscript:',
-                b'onload=',
-                b'onerror=',
-                b'eval(',
-                b'document.cookie',
-                b'window.location'
-            ]
-            
-            content_lower = file_content.lower()
-            for pattern in malicious_patterns:
-                if pattern in content_lower:
-                    return True
-            
-            return False
+            # One case-insensitive pass over the bytes, no lowercase copy
+            return self.scanner.scan(file_content)
         except Exception:
             return True  # Err on the side of caution
     
@@ -0,0 +1,105 @@
+import json
+import zlib
+import logging
+from datetime import datetime, date
+from typing import Any
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# One-byte frame header; JSON text never starts with these bytes
+RAW_HEADER = b'\x01'
+ZLIB_HEADER = b'\x02'
+ZSTD_HEADER = b'\x03'
+
+def encode_default(obj: Any) -> Any:
+    """Encode types JSON does not know, including model rows via to_dict()"""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def json_dumps(value: Any) -> bytes:
+    """Encode a value to JSON bytes with the fastest available encoder"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(value, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=encode_default, separators=(',', ':')).encode()
+
+def json_loads(data: Any) -> Any:
+    """Decode JSON bytes or text"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class SerializationService:
+    """Cache value codec: fast JSON plus compression above a size threshold"""
+    
+    def __init__(self, compress_threshold: int = 1024, compression: str = 'zlib', level: int = 6):
+        self.compress_threshold = compress_threshold
+        self.compression = compression
+        self.level = level
+        
+        if compression == 'zstd' and not ZSTD_AVAILABLE:
+            logging.warning("zstandard not installed, falling back to zlib cache compression")
+            self.compression = 'zlib'
+    
+    def dumps(self, value: Any) -> bytes:
+        """Serialize a value into a framed, possibly compressed payload"""
+        body = json_dumps(value)
+        
+        if self.compress_threshold and len(body) >= self.compress_threshold:
+            if self.compression == 'zstd':
+                return ZSTD_HEADER + zstandard.ZstdCompressor(level=self.level).compress(body)
+            if self.compression == 'zlib':
+                return ZLIB_HEADER + zlib.compress(body, self.level)
+        
+        return RAW_HEADER + body
+    
+    def loads(self, data: Any) -> Any:
+        """Deserialize a payload written by dumps (or legacy plain JSON)"""
+        if isinstance(data, str):
+            data = data.encode()
+        
+        header, body = data[:1], data[1:]
+        if header == RAW_HEADER:
+            return json_loads(body)
+        if header == ZLIB_HEADER:
+            return json_loads(zlib.decompress(body))
+        if header == ZSTD_HEADER:
+            return json_loads(zstandard.ZstdDecompressor().decompress(body))
+        
+        # Values written before framing was introduced
+        return json_loads(data)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson when it is installed"""
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if not ORJSON_AVAILABLE:
+            kwargs.setdefault('default', encode_default)
+            return super().dumps(obj, **kwargs)
+        
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=encode_default, option=option).decode()
+    
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        if not ORJSON_AVAILABLE:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
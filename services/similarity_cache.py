@@ -0,0 +1,388 @@
+import os
+import re
+import time
+import uuid
+import random
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from config import Config
+from services.serialization_service import json_dumps, json_loads
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Grammar and request words (and contraction tails) that change the phrasing of a question far more
+# often than its meaning. Question words stay: "when was X born" and "where was X born" differ.
+STOPWORDS = frozenset("""
+a an the is are was were be been being am do does did doing have has had i me my we our you your
+he she it its they them their this that these those of to in on at by for with about from as into
+can could would should will shall may might must please tell explain there here so just also some
+any and or but if then than too very
+s t d ll m re ve
+""".split())
+
+_WORDS = re.compile(r'\w+')
+_PRIME = (1 << 61) - 1  # Mersenne prime for the (a*x + b) mod p permutations
+_SEED = 0x5eed  # fixed so every worker computes the same signatures
+
+# Entries and removals are numbered from one per-model counter, so a worker
+# can ask for exactly the changes after the last number it has seen.
+# KEYS = entries hash, added zset, removed zset, sequence counter
+_PERSIST_SCRIPT = """
+local seq = redis.call('INCR', KEYS[4])
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], seq, ARGV[1])
+for i = 1, 4 do redis.call('EXPIRE', KEYS[i], ARGV[3]) end
+return seq
+"""
+
+_FORGET_SCRIPT = """
+local seq = redis.call('INCR', KEYS[4])
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZADD', KEYS[3], seq, ARGV[1])
+redis.call('ZREMRANGEBYRANK', KEYS[3], 0, -tonumber(ARGV[2]) - 1)
+for i = 1, 4 do redis.call('EXPIRE', KEYS[i], ARGV[3]) end
+return seq
+"""
+
+def _hash64(value: str) -> int:
+    """Stable 64-bit hash (Python's str hash is salted per process)"""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'little')
+
+def content_words(text: str) -> List[str]:
+    """Lowercased words of a text without stopwords"""
+    return [word for word in _WORDS.findall(text.lower()) if word not in STOPWORDS]
+
+def jaccard(a: FrozenSet[int], b: FrozenSet[int]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+class CacheEntry:
+    """A cached response and the shingles of the prompt that produced it"""
+    
+    __slots__ = ('id', 'shingles', 'signature', 'response', 'expires')
+    
+    def __init__(self, entry_id: str, shingles: FrozenSet[int], signature: Tuple[int, ...],
+                 response: str, expires: float):
+        self.id = entry_id
+        self.shingles = shingles
+        self.signature = signature
+        self.response = response
+        self.expires = expires
+    
+    def to_json(self) -> bytes:
+        return json_dumps({
+            'shingles': sorted(self.shingles),
+            'signature': list(self.signature),
+            'response': self.response,
+            'expires': self.expires
+        })
+    
+    @classmethod
+    def from_json(cls, entry_id: str, raw: bytes) -> "CacheEntry":
+        data = json_loads(raw)
+        return cls(entry_id, frozenset(data['shingles']), tuple(data['signature']), data['response'], data['expires'])
+
+class ModelIndex:
+    """LSH buckets and entries for one model"""
+    
+    def __init__(self, bands: int):
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.buckets: List[Dict[Tuple[int, ...], set]] = [{} for _ in range(bands)]
+        self.synced_at = 0.0
+        self.synced_seq = 0  # last Redis change number merged into this index
+
+class SimilarityCache:
+    """Opt-in cache that answers paraphrased prompts with an earlier response
+    
+    Prompts are reduced to content words, shingled into unigrams and bigrams,
+    and summarized by a MinHash signature. Signatures are split into bands for
+    an LSH table, so a lookup only examines entries that share at least one
+    band, then confirms with the exact Jaccard similarity of the shingle sets
+    against the model's threshold. Indexes are per model and in memory; with
+    Redis configured, entries and removals are also logged there and merged
+    into other workers' indexes periodically.
+    
+    A sample of hits is audited: the request goes upstream as if it had
+    missed, and an entry whose answer disagrees with the fresh one is counted
+    as a false hit and dropped.
+    """
+    
+    def __init__(self):
+        self.enabled = Config.SIMILARITY_CACHE_ENABLED
+        self.num_perm = Config.SIMILARITY_CACHE_PERMUTATIONS
+        self.bands = Config.SIMILARITY_CACHE_BANDS
+        self.rows = self.num_perm // self.bands
+        self.default_threshold = Config.SIMILARITY_CACHE_THRESHOLD
+        self.thresholds = Config.SIMILARITY_CACHE_MODEL_THRESHOLDS
+        self.timeout = Config.SIMILARITY_CACHE_TIMEOUT
+        self.max_entries = Config.SIMILARITY_CACHE_MAX_ENTRIES
+        self.min_shingles = Config.SIMILARITY_CACHE_MIN_SHINGLES
+        self.audit_rate = Config.SIMILARITY_CACHE_AUDIT_RATE
+        self.audit_min_agreement = Config.SIMILARITY_CACHE_AUDIT_MIN_AGREEMENT
+        self.sync_interval = Config.SIMILARITY_CACHE_SYNC_INTERVAL
+        self.redis_url = Config.CACHE_REDIS_URL
+        
+        rng = random.Random(_SEED)
+        self._permutations = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(self.num_perm)]
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, ModelIndex] = {}
+        self._pid = None
+        self._redis = None
+        self._persist_script = None
+        self._forget_script = None
+        self.expiry_batch = 100  # oldest Redis entries checked for expiry on each sync
+        self.stats = {
+            'lookups': 0, 'hits': 0, 'misses': 0, 'skipped': 0, 'stores': 0, 'expired': 0,
+            'candidates': 0, 'rejected_candidates': 0, 'audits': 0, 'false_hits': 0
+        }
+    
+    def shingles(self, text: str) -> FrozenSet[int]:
+        """Hashed unigrams and bigrams of a text's content words"""
+        words = content_words(text)
+        grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        return frozenset(_hash64(gram) for gram in grams)
+    
+    def signature(self, shingles: FrozenSet[int]) -> Tuple[int, ...]:
+        """MinHash signature: the minimum of each permutation over the shingles"""
+        return tuple(min((a * x + b) % _PRIME for x in shingles) for a, b in self._permutations)
+    
+    def _band_keys(self, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+    
+    def threshold_for(self, model: str) -> float:
+        return self.thresholds.get(model, self.default_threshold)
+    
+    def _index(self, model: str) -> ModelIndex:
+        """Index for a model; this and the other index helpers run under self._lock"""
+        index = self._indexes.get(model)
+        if index is None:
+            index = self._indexes[model] = ModelIndex(self.bands)
+        return index
+    
+    def _add(self, index: ModelIndex, entry: CacheEntry):
+        if entry.id in index.entries:
+            return
+        index.entries[entry.id] = entry
+        for band, key in self._band_keys(entry.signature):
+            index.buckets[band].setdefault(key, set()).add(entry.id)
+        
+        while len(index.entries) > self.max_entries:
+            _, oldest = index.entries.popitem(last=False)
+            self._unlink(index, oldest)
+    
+    def _remove(self, index: ModelIndex, entry_id: str):
+        entry = index.entries.pop(entry_id, None)
+        if entry is not None:
+            self._unlink(index, entry)
+    
+    def _unlink(self, index: ModelIndex, entry: CacheEntry):
+        for band, key in self._band_keys(entry.signature):
+            bucket = index.buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(entry.id)
+                if not bucket:
+                    del index.buckets[band][key]
+    
+    def _redis_client(self):
+        """Redis client for this process, or None when entries stay in this worker"""
+        if not (REDIS_AVAILABLE and self.redis_url):
+            return None
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            try:
+                self._redis = redis.from_url(self.redis_url, decode_responses=False)
+                self._persist_script = self._redis.register_script(_PERSIST_SCRIPT)
+                self._forget_script = self._redis.register_script(_FORGET_SCRIPT)
+            except Exception as e:
+                logging.warning(f"Similarity cache limited to this worker: {e}")
+                self._redis = None
+        return self._redis
+    
+    def _redis_keys(self, model: str) -> List[str]:
+        """Entries hash, added and removed change logs, and the change counter"""
+        base = f"cyberchat:simcache:{model}"
+        return [base, f"{base}:added", f"{base}:removed", f"{base}:seq"]
+    
+    def _sync(self, model: str):
+        """Merge entries added and removed by other workers since the last sync
+        
+        Redis is read without holding self._lock; only the merge takes it.
+        """
+        client = self._redis_client()
+        if client is None:
+            return
+        
+        now = time.time()
+        with self._lock:
+            index = self._index(model)
+            if now - index.synced_at < self.sync_interval:
+                return
+            index.synced_at = now
+            cursor = index.synced_seq
+        
+        entries_key, added_key, removed_key, _ = self._redis_keys(model)
+        try:
+            # One MULTI, so additions and removals are read at the same change number
+            pipe = client.pipeline(transaction=True)
+            pipe.zrevrangebyscore(added_key, '+inf', f'({cursor}', start=0, num=self.max_entries, withscores=True)
+            pipe.zrangebyscore(removed_key, f'({cursor}', '+inf', withscores=True)
+            pipe.zrange(added_key, 0, self.expiry_batch - 1)
+            added, removed, oldest = pipe.execute()
+            
+            ids = [raw_id for raw_id, _ in added]
+            raw_entries = client.hmget(entries_key, ids + oldest) if ids or oldest else []
+        except Exception as e:
+            logging.warning(f"Similarity cache sync error: {e}")
+            return
+        
+        # Oldest entries expire first, so checking a few of them each sync keeps Redis trimmed
+        new_ids = set(ids)
+        fresh = []
+        expired = []
+        for raw_id, raw in zip(ids + oldest, raw_entries):
+            if raw is None:
+                continue
+            entry = CacheEntry.from_json(raw_id.decode(), raw)
+            if entry.expires <= now:
+                expired.append(raw_id)
+            elif raw_id in new_ids:
+                fresh.append(entry)
+        
+        with self._lock:
+            index = self._index(model)
+            for entry in fresh:
+                self._add(index, entry)
+            for raw_id, _ in removed:
+                self._remove(index, raw_id.decode())
+            scores = [score for _, score in added] + [score for _, score in removed]
+            index.synced_seq = max([index.synced_seq] + [int(score) for score in scores])
+        
+        if expired:
+            try:
+                pipe = client.pipeline(transaction=False)
+                pipe.hdel(entries_key, *expired)
+                pipe.zrem(added_key, *expired)
+                pipe.execute()
+            except Exception as e:
+                logging.warning(f"Similarity cache cleanup error: {e}")
+    
+    def _persist(self, model: str, entry: CacheEntry):
+        client = self._redis_client()
+        if client is None:
+            return
+        try:
+            self._persist_script(keys=self._redis_keys(model), args=[entry.id, entry.to_json(), self.timeout])
+        except Exception as e:
+            logging.warning(f"Similarity cache write error: {e}")
+    
+    def _forget(self, model: str, entry_id: str):
+        """Delete an entry and leave a tombstone so other workers drop it too"""
+        client = self._redis_client()
+        if client is None:
+            return
+        try:
+            self._forget_script(keys=self._redis_keys(model), args=[entry_id, self.max_entries, self.timeout])
+        except Exception as e:
+            logging.warning(f"Similarity cache delete error: {e}")
+    
+    def lookup(self, model: str, prompt: str) -> Optional[CacheEntry]:
+        """Most similar live entry for a paraphrase of prompt, or None"""
+        if not self.enabled:
+            return None
+        
+        shingles = self.shingles(prompt)
+        if len(shingles) < self.min_shingles:
+            with self._lock:
+                self.stats['skipped'] += 1
+            return None
+        
+        signature = self.signature(shingles)
+        threshold = self.threshold_for(model)
+        self._sync(model)
+        now = time.time()
+        
+        with self._lock:
+            self.stats['lookups'] += 1
+            index = self._index(model)
+            
+            candidate_ids = set()
+            for band, key in self._band_keys(signature):
+                candidate_ids.update(index.buckets[band].get(key, ()))
+            
+            best, best_score = None, 0.0
+            for entry_id in candidate_ids:
+                entry = index.entries[entry_id]
+                if entry.expires <= now:
+                    self._remove(index, entry_id)
+                    self.stats['expired'] += 1
+                    continue
+                
+                # The LSH band match is only a hint; confirm on the exact shingle sets
+                self.stats['candidates'] += 1
+                score = jaccard(shingles, entry.shingles)
+                if score < threshold:
+                    self.stats['rejected_candidates'] += 1
+                elif score > best_score:
+                    best, best_score = entry, score
+            
+            self.stats['hits' if best else 'misses'] += 1
+        return best
+    
+    def store(self, model: str, prompt: str, response: str):
+        """Cache a response for prompts similar to this one"""
+        if not self.enabled:
+            return
+        
+        shingles = self.shingles(prompt)
+        if len(shingles) < self.min_shingles:
+            return
+        
+        entry = CacheEntry(uuid.uuid4().hex, shingles, self.signature(shingles), response, time.time() + self.timeout)
+        with self._lock:
+            self._add(self._index(model), entry)
+            self.stats['stores'] += 1
+        self._persist(model, entry)
+    
+    def should_audit(self) -> bool:
+        """Whether to send this hit upstream anyway and compare the answers"""
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+    
+    def audit(self, model: str, entry: CacheEntry, fresh_response: str) -> bool:
+        """Compare a cached answer with a fresh one; disagreeing entries are dropped"""
+        cached_words = frozenset(content_words(entry.response))
+        fresh_words = frozenset(content_words(fresh_response))
+        agrees = jaccard(cached_words, fresh_words) >= self.audit_min_agreement
+        
+        with self._lock:
+            self.stats['audits'] += 1
+            if agrees:
+                return True
+            self.stats['false_hits'] += 1
+            self._remove(self._index(model), entry.id)
+        
+        logging.info(f"Similarity cache false hit for {model}, dropping entry {entry.id}")
+        self._forget(model, entry.id)
+        return False
+    
+    def get_stats(self) -> Dict[str, object]:
+        """Hit rate, audit results and index sizes"""
+        with self._lock:
+            sizes = {model: len(index.entries) for model, index in self._indexes.items()}
+            stats = dict(self.stats)
+        answered = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / answered, 4) if answered else 0.0
+        stats['false_hit_rate'] = round(stats['false_hits'] / stats['audits'], 4) if stats['audits'] else 0.0
+        return {**stats, 'enabled': self.enabled, 'entries': sizes}
+
+# Process-wide cache shared by all AIService instances
+similarity_cache = SimilarityCache()
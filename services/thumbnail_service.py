@@ -0,0 +1,94 @@
+import os
+import logging
+import tempfile
+from typing import BinaryIO, List, Optional
+from PIL import Image, ImageOps
+from config import Config
+
+class ThumbnailService:
+    """WebP previews of uploaded images at a few fixed widths
+    
+    Thumbnails are named by the source blob's digest and width, so each one is
+    rendered once and never changes. Decoding uses JPEG draft mode and integer
+    reduce() to avoid materialising full-resolution pixels before the resize.
+    """
+    
+    def __init__(self, root: Optional[str] = None, widths=None, quality: Optional[int] = None):
+        self.root = os.path.abspath(root or Config.THUMBNAIL_DIR)
+        self.widths = tuple(sorted(widths or Config.THUMBNAIL_WIDTHS))
+        self.quality = quality if quality is not None else Config.THUMBNAIL_QUALITY
+    
+    def _path(self, digest: str, width: int) -> str:
+        if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+            raise ValueError(f"Invalid blob digest: {digest[:80]}")
+        if width not in self.widths:
+            raise ValueError(f"Unsupported thumbnail width: {width}")
+        return os.path.join(self.root, digest[:2], f"{digest}-{width}.webp")
+    
+    def local_path(self, digest: str, width: int) -> Optional[str]:
+        """Path of a generated thumbnail, or None"""
+        path = self._path(digest, width)
+        return path if os.path.exists(path) else None
+    
+    def generate(self, digest: str, source: BinaryIO) -> List[int]:
+        """Render every missing width for an image blob and return the widths written"""
+        missing = [width for width in self.widths if not os.path.exists(self._path(digest, width))]
+        if not missing:
+            return []
+        
+        with Image.open(source) as image:
+            # JPEG decodes at 1/2, 1/4 or 1/8 scale as long as the largest thumbnail still fits
+            largest = max(missing)
+            if image.width > largest:
+                image.draft('RGB', (largest, max(1, image.height * largest // image.width)))
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+            
+            for width in sorted(missing, reverse=True):
+                self._write(self._path(digest, width), self._resize(image, width))
+        return missing
+    
+    def _resize(self, image: Image.Image, width: int) -> Image.Image:
+        """Scale to the target width; never upscales"""
+        if image.width <= width:
+            return image
+        
+        # Cheap box reduce down to about twice the target, then a Lanczos pass for quality
+        factor = image.width // (width * 2)
+        if factor >= 2:
+            image = image.reduce(factor)
+        height = max(1, round(image.height * width / image.width))
+        return image.resize((width, height), Image.LANCZOS)
+    
+    def _write(self, path: str, image: Image.Image):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                # No exif/icc arguments: metadata from the upload is not carried over
+                image.save(f, 'WEBP', quality=self.quality, method=4)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def ensure(self, digest: str, width: int, blob_store) -> Optional[str]:
+        """Path of a thumbnail, rendering it from the stored blob if it is missing"""
+        path = self.local_path(digest, width)
+        if path:
+            return path
+        
+        try:
+            with blob_store.open(digest) as source:
+                self.generate(digest, source)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f"Thumbnail generation error for {digest[:12]}: {e}")
+            return None
+        return self.local_path(digest, width)
+
+# Process-wide thumbnail renderer; output is shared through the filesystem
+thumbnail_service = ThumbnailService()
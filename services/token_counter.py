@@ -0,0 +1,134 @@
+import logging
+import threading
+from typing import Dict, List, Optional
+from config import Config
+from services.model_catalog import model_catalog
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Role/separator tokens each chat message costs on top of its text
+MESSAGE_OVERHEAD = 4
+
+# tiktoken encodings for model families that publish theirs; other families use the heuristic
+FAMILY_ENCODINGS = {
+    'openai/gpt-4o': 'o200k_base',
+    'openai/gpt-4': 'cl100k_base',
+    'openai/gpt-3.5': 'cl100k_base'
+}
+
+def estimate_tokens(text: str) -> int:
+    """Fast, slightly pessimistic token estimate without a tokenizer
+    
+    English text runs about four characters per token. Non-ASCII characters
+    tokenize much worse (CJK is roughly one token per character), so each
+    extra UTF-8 byte is charged half a token. Both lengths are computed in C.
+    """
+    if not text:
+        return 0
+    if text.isascii():
+        return (len(text) + 3) // 4
+    extra = len(text.encode('utf-8')) - len(text)
+    return (len(text) + 3) // 4 + (extra + 1) // 2
+
+class TokenCounter:
+    """Token counting and budgeting per model
+    
+    Models whose family has a known tiktoken encoding are counted exactly once
+    the encoding is loaded; everything else (and everything, when tiktoken is
+    not installed or its encoding files cannot be fetched) uses estimate_tokens.
+    Encoders are cached per encoding name for the life of the process.
+    """
+    
+    def __init__(self):
+        self.default_context_limit = Config.DEFAULT_CONTEXT_LIMIT
+        self.context_limits = Config.MODEL_CONTEXT_LIMITS
+        self.max_output_tokens = Config.CHAT_MAX_OUTPUT_TOKENS
+        self.min_output_tokens = Config.CHAT_MIN_OUTPUT_TOKENS
+        self._lock = threading.Lock()
+        self._encoders = {}
+        self._family_cache = {}
+    
+    def _encoding_name(self, model: Optional[str]) -> Optional[str]:
+        if not model:
+            return None
+        name = self._family_cache.get(model, False)
+        if name is False:
+            name = next((encoding for prefix, encoding in FAMILY_ENCODINGS.items() if model.startswith(prefix)), None)
+            if len(self._family_cache) >= 1024:
+                # Model ids come from requests; keep the lookup cache bounded
+                self._family_cache.clear()
+            self._family_cache[model] = name
+        return name
+    
+    def _encoder(self, model: Optional[str]):
+        """Cached tiktoken encoder for a model's family, or None for the heuristic"""
+        if not TIKTOKEN_AVAILABLE:
+            return None
+        name = self._encoding_name(model)
+        if name is None:
+            return None
+        
+        encoder = self._encoders.get(name, False)
+        if encoder is not False:
+            return encoder
+        
+        with self._lock:
+            if name not in self._encoders:
+                try:
+                    self._encoders[name] = tiktoken.get_encoding(name)
+                except Exception as e:
+                    # First use downloads the BPE file; stay on the heuristic if that fails
+                    logging.warning(f"Could not load tiktoken encoding {name}: {e}")
+                    self._encoders[name] = None
+            return self._encoders[name]
+    
+    def count(self, text: str, model: Optional[str] = None) -> int:
+        """Tokens in a piece of text for a model"""
+        if not text:
+            return 0
+        encoder = self._encoder(model)
+        if encoder is None:
+            return estimate_tokens(text)
+        return len(encoder.encode_ordinary(text))
+    
+    def count_messages(self, messages: List[Dict[str, str]], model: Optional[str] = None) -> int:
+        """Tokens in a chat message list, including per-message overhead"""
+        return sum(self.count(message.get('content') or '', model) + MESSAGE_OVERHEAD for message in messages) + 2
+    
+    def truncate(self, text: str, max_tokens: int, model: Optional[str] = None) -> str:
+        """Cut text to at most max_tokens tokens"""
+        if max_tokens <= 0:
+            return ''
+        encoder = self._encoder(model)
+        if encoder is not None:
+            tokens = encoder.encode_ordinary(text)
+            return text if len(tokens) <= max_tokens else encoder.decode(tokens[:max_tokens])
+        
+        # Heuristic: proportional cut, then trim until the estimate fits
+        total = estimate_tokens(text)
+        if total <= max_tokens:
+            return text
+        end = len(text) * max_tokens // total
+        while end > 0 and estimate_tokens(text[:end]) > max_tokens:
+            end -= max(1, end // 50)
+        return text[:max(end, 0)]
+    
+    def context_limit(self, model: Optional[str]) -> int:
+        """Context window of a model, in tokens: the catalog's figure, else the configured one"""
+        return model_catalog.context_length(model) or self.context_limits.get(model, self.default_context_limit)
+    
+    def output_budget(self, model: Optional[str], prompt_tokens: int) -> int:
+        """max_tokens for a completion: the configured cap, shrunk to what is left of the window"""
+        available = self.context_limit(model) - prompt_tokens
+        return max(self.min_output_tokens, min(self.max_output_tokens, available))
+    
+    def prompt_budget(self, model: Optional[str]) -> int:
+        """Tokens a prompt may use while leaving room for a full-size reply"""
+        return self.context_limit(model) - self.max_output_tokens
+
+# Shared counter; encoders are loaded lazily and cached
+token_counter = TokenCounter()
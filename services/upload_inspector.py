@@ -0,0 +1,118 @@
+import hashlib
+import logging
+import tempfile
+from typing import BinaryIO
+import magic
+from werkzeug.datastructures import FileStorage
+from config import Config
+from services.security_service import SecurityService
+from services.validation_service import ValidationService
+
+class UploadInspection:
+    """Outcome of one pass over an upload, with the bytes spooled for later processing"""
+    
+    def __init__(self, filename: str, extension: str):
+        self.filename = filename
+        self.extension = extension
+        self.size = 0
+        self.sha256 = None
+        self.mime_type = None
+        self.error = None
+        self.spool = None
+    
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+    
+    def read(self) -> bytes:
+        """Read the spooled bytes back"""
+        self.spool.seek(0)
+        return self.spool.read()
+    
+    def stream(self) -> BinaryIO:
+        """The spooled bytes as a file object positioned at the start"""
+        self.spool.seek(0)
+        return self.spool
+    
+    def close(self):
+        """Release the spool (and its temp file, if it went to disk)"""
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+
+class UploadInspector:
+    """Size, sniff, hash and scan an upload in a single chunked read"""
+    
+    def __init__(self):
+        self.chunk_size = Config.UPLOAD_CHUNK_SIZE
+        self.spool_memory = Config.UPLOAD_SPOOL_MEMORY
+        self.security_service = SecurityService()
+        self.validation_service = ValidationService()
+    
+    def inspect(self, file: FileStorage, allowed_extensions: set, max_size: int) -> UploadInspection:
+        """Inspect an upload; check .ok/.error and close() the result when done"""
+        if not file or not file.filename:
+            inspection = UploadInspection('', '')
+            inspection.error = 'No file provided'
+            return inspection
+        
+        filename = file.filename
+        extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        inspection = UploadInspection(self.validation_service.sanitize_filename(filename), extension)
+        
+        if not extension:
+            inspection.error = 'File has no extension'
+            return inspection
+        if extension not in allowed_extensions:
+            inspection.error = f'File type not allowed. Allowed: {", ".join(allowed_extensions)}'
+            return inspection
+        
+        # Small uploads stay in memory, larger ones roll over to a temp file
+        inspection.spool = tempfile.SpooledTemporaryFile(max_size=self.spool_memory)
+        try:
+            self._read(file.stream, inspection, max_size)
+        except Exception as e:
+            logging.error(f"Upload inspection error: {e}")
+            inspection.error = f'Error processing file: {str(e)}'
+        
+        if not inspection.ok:
+            inspection.close()
+        return inspection
+    
+    def _read(self, stream: BinaryIO, inspection: UploadInspection, max_size: int):
+        digest = hashlib.sha256()
+        scan = self.security_service.scanner.stream()
+        
+        while True:
+            chunk = stream.read(self.chunk_size)
+            if not chunk:
+                break
+            
+            if inspection.size == 0:
+                inspection.mime_type = magic.from_buffer(chunk[:2048], mime=True)
+                if not self.security_service.signature_matches(inspection.filename, inspection.mime_type):
+                    logging.warning(f"File signature validation failed for {inspection.filename}")
+                    inspection.error = 'File signature does not match extension'
+                    return
+            
+            inspection.size += len(chunk)
+            if inspection.size > max_size:
+                inspection.error = f'File too large (max {max_size // (1024*1024)}MB)'
+                return
+            
+            digest.update(chunk)
+            inspection.spool.write(chunk)
+            
+            if scan.feed(chunk):
+                logging.warning(f"Malicious content detected in {inspection.filename}")
+                inspection.error = 'File contains potentially malicious content'
+                return
+        
+        if inspection.size == 0:
+            inspection.error = 'File is empty'
+            return
+        
+        inspection.sha256 = digest.hexdigest()
+
+# Shared inspector; holds no per-upload state
+upload_inspector = UploadInspector()
@@ -0,0 +1,168 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+import requests
+from requests.structures import CaseInsensitiveDict
+from config import Config
+from services.http_service import http_service
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+class GatewayResponse:
+    """Fully read upstream response with the parts of requests.Response callers use"""
+    
+    def __init__(self, status_code: int, headers: Dict[str, str], content: bytes, encoding: Optional[str] = None):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+    
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors='replace')
+    
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+class UpstreamGateway:
+    """Multiplex upstream HTTP calls on one asyncio event loop per worker
+    
+    The loop runs in a daemon thread, so any number of request threads can wait
+    on in-flight AI and search calls without each holding a socket-bound worker.
+    Uses aiohttp when installed; otherwise calls run on the pooled requests
+    transport in a bounded executor with the same interface.
+    """
+    
+    def __init__(self, host_settings: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.host_settings = host_settings if host_settings is not None else Config.HTTP_POOL_SETTINGS
+        self.default_timeout = (Config.HTTP_CONNECT_TIMEOUT, Config.API_TIMEOUT)
+        self.total_timeout = Config.API_TIMEOUT
+        self.max_in_flight = Config.GATEWAY_MAX_IN_FLIGHT
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._sessions = {}
+        self._executor = None
+        self.stats = {'requests': 0, 'in_flight': 0, 'errors': 0}
+    
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the event loop thread, once per process"""
+        with self._lock:
+            # Loops and sockets do not survive a gunicorn fork
+            pid = os.getpid()
+            if self._pid != pid or self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._sessions = {}
+                self._executor = None
+                self._pid = pid
+                
+                thread = threading.Thread(target=self._run_loop, args=(self._loop,),
+                                          name='upstream-gateway', daemon=True)
+                thread.start()
+                logging.info(f"Upstream gateway started ({'aiohttp' if AIOHTTP_AVAILABLE else 'executor'} transport)")
+            
+            return self._loop
+    
+    def _run_loop(self, loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+    
+    def _settings_for(self, host: str) -> Dict[str, Any]:
+        """Get pool settings for a host, falling back to defaults"""
+        return self.host_settings.get(host, {})
+    
+    def _session_for(self, host: str) -> "aiohttp.ClientSession":
+        """Get or create the aiohttp session for a host (runs on the loop)"""
+        session = self._sessions.get(host)
+        if session is None or session.closed:
+            settings = self._settings_for(host)
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=30)
+            timeout = aiohttp.ClientTimeout(
+                total=self.total_timeout,
+                sock_connect=settings.get('connect_timeout', self.default_timeout[0]),
+                sock_read=settings.get('read_timeout', self.default_timeout[1])
+            )
+            session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._sessions[host] = session
+        return session
+    
+    async def fetch(self, method: str, url: str, **kwargs) -> GatewayResponse:
+        """Send a request and read the whole body; call from the gateway loop or an ASGI app"""
+        self.stats['requests'] += 1
+        self.stats['in_flight'] += 1
+        try:
+            if AIOHTTP_AVAILABLE:
+                return await self._fetch_aiohttp(method, url, **kwargs)
+            return await self._fetch_executor(method, url, **kwargs)
+        except Exception:
+            self.stats['errors'] += 1
+            raise
+        finally:
+            self.stats['in_flight'] -= 1
+    
+    async def _fetch_aiohttp(self, method: str, url: str, **kwargs) -> GatewayResponse:
+        host = urlsplit(url).hostname or ''
+        session = self._session_for(host)
+        
+        try:
+            async with session.request(method, url, headers=kwargs.get('headers'), params=kwargs.get('params'),
+                                       json=kwargs.get('json'), data=kwargs.get('data')) as response:
+                content = await response.read()
+                return GatewayResponse(response.status, dict(response.headers), content, response.charset)
+        except asyncio.TimeoutError as e:
+            # Keep the exception types callers already handle
+            raise requests.exceptions.Timeout(str(e) or f"Upstream timeout for {host}") from e
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+    
+    async def _fetch_executor(self, method: str, url: str, **kwargs) -> GatewayResponse:
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                                                   thread_name_prefix='upstream')
+        
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(self._executor, lambda: http_service.request(method, url, **kwargs))
+        return GatewayResponse(response.status_code, dict(response.headers), response.content, response.encoding)
+    
+    def submit(self, method: str, url: str, **kwargs) -> concurrent.futures.Future:
+        """Schedule a request on the gateway loop and return a future for its response"""
+        return asyncio.run_coroutine_threadsafe(self.fetch(method, url, **kwargs), self._ensure_loop())
+    
+    def request(self, method: str, url: str, **kwargs) -> GatewayResponse:
+        """Send a request through the gateway and wait for the response
+        
+        The wait is bounded even if the transport's own timeouts do not fire,
+        e.g. an upstream trickling bytes on the executor transport.
+        """
+        future = self.submit(method, url, **kwargs)
+        try:
+            return future.result(timeout=self.total_timeout + self.default_timeout[0])
+        except concurrent.futures.TimeoutError as e:
+            future.cancel()
+            # Name only the host; some URLs carry API keys in the query string
+            host = urlsplit(url).hostname or ''
+            raise requests.exceptions.Timeout(f"Upstream request to {host} exceeded {self.total_timeout}s") from e
+    
+    def get(self, url: str, **kwargs) -> GatewayResponse:
+        """Send a GET through the gateway"""
+        return self.request('GET', url, **kwargs)
+    
+    def post(self, url: str, **kwargs) -> GatewayResponse:
+        """Send a POST through the gateway"""
+        return self.request('POST', url, **kwargs)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get request counters and the active transport"""
+        return {'transport': 'aiohttp' if AIOHTTP_AVAILABLE else 'executor', **self.stats}
+
+# Process-wide gateway, started lazily in each forked worker
+upstream_gateway = UpstreamGateway()
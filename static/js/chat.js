@@ -15,7 +15,7 @@ class ChatInterface {
         this.initializeEventListeners();
         this.loadChatHistory();
         this.updateMessageCount();
-        this.loadModelPreference();
+        this.loadModels().then(() => this.loadModelPreference());
     }
     
     initializeEventListeners() {
@@ -64,10 +64,11 @@ class ChatInterface {
         this.showTypingIndicator();
         
         try {
-            const response = await fetch('/api/send_message', {
+            const response = await fetch('/api/send_message_stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream'
                 },
                 body: JSON.stringify({ 
                     message: message,
@@ -75,13 +76,10 @@ class ChatInterface {
                 })
             });
             
-            const data = await response.json();
-            
-            if (response.ok) {
-                this.addMessage('assistant', data.response);
-                this.messagesRemaining = data.messages_remaining;
-                this.updateMessageCount();
+            if (response.ok && response.body) {
+                await this.consumeMessageStream(response);
             } else {
+                const data = await response.json();
                 this.addMessage('assistant', `❌ Error: ${data.error}`);
                 if (response.status === 429) {
                     this.showMessageLimitWarning();
@@ -97,6 +95,71 @@ class ChatInterface {
         }
     }
     
+    async consumeMessageStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let content = '';
+        let messageContent = null;
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            
+            // SSE frames are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                const event = this.parseSSEFrame(frame);
+                if (!event) continue;
+                
+                if (event.type === 'done') {
+                    this.messagesRemaining = event.data.messages_remaining;
+                    this.updateMessageCount();
+                } else if (event.data.delta) {
+                    if (!messageContent) {
+                        // First token arrived, swap the typing indicator for the message
+                        this.hideTypingIndicator();
+                        messageContent = this.addMessage('assistant', '');
+                    }
+                    content += event.data.delta;
+                    this.renderMessageContent(messageContent, content);
+                    this.scrollToBottom();
+                }
+            }
+        }
+        
+        if (!messageContent) {
+            this.addMessage('assistant', '❌ Empty response from AI service.');
+        }
+    }
+    
+    parseSSEFrame(frame) {
+        let type = 'message';
+        const dataLines = [];
+        
+        frame.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                type = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        });
+        
+        if (dataLines.length === 0) return null;
+        
+        try {
+            return { type: type, data: JSON.parse(dataLines.join('\n')) };
+        } catch (error) {
+            console.error('Error parsing stream event:', error);
+            return null;
+        }
+    }
+    
     async performSearch() {
         if (!this.messageInput || !this.searchBtn) return;
         
@@ -165,14 +228,10 @@ class ChatInterface {
             messageContent.appendChild(filePreview);
         }
         
-        // Convert markdown to HTML if marked is available
-        let htmlContent;
-        if (typeof marked !== 'undefined') {
-            htmlContent = marked.parse(content);
-        } else {
-            htmlContent = content.replace(/\n/g, '<br>');
-        }
-        messageContent.innerHTML += htmlContent;
+        const textContent = document.createElement('div');
+        textContent.className = 'message-text';
+        this.renderMessageContent(textContent, content);
+        messageContent.appendChild(textContent);
         
         const messageTime = document.createElement('div');
         messageTime.className = 'message-timestamp';
@@ -183,15 +242,29 @@ class ChatInterface {
         
         this.messagesContainer.appendChild(messageDiv);
         this.scrollToBottom();
+        
+        return textContent;
+    }
+    
+    renderMessageContent(element, content) {
+        // Convert markdown to HTML if marked is available
+        if (typeof marked !== 'undefined') {
+            element.innerHTML = marked.parse(content);
+        } else {
+            element.innerHTML = content.replace(/\n/g, '<br>');
+        }
     }
     
     createFilePreview(fileData) {
         const preview = document.createElement('div');
         preview.className = 'file-preview';
         
-        if (fileData.type === 'image' && fileData.preview_url) {
+        // Prefer the small WebP thumbnail; older messages embed a data URL or only the file
+        const imageUrl = fileData.thumbnail_url || fileData.preview_url || fileData.url;
+        if (fileData.type === 'image' && imageUrl) {
             const img = document.createElement('img');
-            img.src = fileData.preview_url;
+            img.src = imageUrl;
+            img.loading = 'lazy';
             img.alt = fileData.filename;
             preview.appendChild(img);
         }
@@ -359,6 +432,51 @@ class ChatInterface {
         }, 5000);
     }
     
+    async loadModels() {
+        if (!this.modelSelect) return;
+        
+        try {
+            // The server sends an ETag, so repeat loads are usually a 304 from the browser cache
+            const response = await fetch('/api/models');
+            if (!response.ok) return;
+            const data = await response.json();
+            if (!data.models || data.models.length === 0) return;
+            
+            // Group by provider, the part of the id before the slash
+            const groups = new Map();
+            for (const model of data.models) {
+                const provider = model.id.split('/')[0];
+                if (!groups.has(provider)) groups.set(provider, []);
+                groups.get(provider).push(model);
+            }
+            
+            const fragment = document.createDocumentFragment();
+            for (const provider of [...groups.keys()].sort()) {
+                const group = document.createElement('optgroup');
+                group.label = provider;
+                for (const model of groups.get(provider)) {
+                    const option = document.createElement('option');
+                    option.value = model.id;
+                    option.textContent = model.name;
+                    if (model.context_length) {
+                        option.title = `${model.context_length.toLocaleString()} token context`;
+                    }
+                    group.appendChild(option);
+                }
+                fragment.appendChild(group);
+            }
+            
+            const selected = this.modelSelect.value || data.default;
+            this.modelSelect.replaceChildren(fragment);
+            this.modelSelect.value = selected;
+            if (!this.modelSelect.value) {
+                this.modelSelect.value = data.default;
+            }
+        } catch (error) {
+            console.error('Error loading models:', error);
+        }
+    }
+    
     async loadModelPreference() {
         try {
             const response = await fetch('/api/get_model_preference');
@@ -8,6 +8,10 @@ class FileUploadManager {
         
         this.allowedTypes = ['text/plain', 'application/pdf', 'image/jpeg', 'image/jpg', 'image/png'];
         this.maxFileSize = 10 * 1024 * 1024; // 10MB
+        this.pollInterval = 500; // ms
+        this.maxPollInterval = 3000; // ms
+        this.maxPollTime = 5 * 60 * 1000; // ms before giving up on a job
+        this.maxNotFoundPolls = 5; // a new job may not be visible to every worker yet
         
         this.initializeEventListeners();
     }
@@ -128,9 +132,18 @@ class FileUploadManager {
             const data = await response.json();
             
             if (response.ok) {
-                // Add AI response to chat
-                this.addAIResponse(data.response, data.file_info);
                 this.updateMessageCount(data.messages_remaining);
+                
+                // Processing continues in the background; poll until it finishes
+                const job = await this.waitForJob(data.status_url);
+                if (job.status === 'done') {
+                    this.addAIResponse(job.result.response, job.result.file_info);
+                } else {
+                    this.addErrorMessage(`❌ Upload Error: ${job.error}`);
+                }
+                if (job.messages_remaining !== undefined) {
+                    this.updateMessageCount(job.messages_remaining);
+                }
             } else {
                 this.addErrorMessage(`❌ Upload Error: ${data.error}`);
                 if (response.status === 429) {
@@ -146,6 +159,42 @@ class FileUploadManager {
         }
     }
     
+    async waitForJob(statusUrl) {
+        const deadline = Date.now() + this.maxPollTime;
+        let delay = this.pollInterval;
+        let notFound = 0;
+        
+        while (Date.now() < deadline) {
+            await new Promise(resolve => setTimeout(resolve, delay));
+            // Back off gently for long-running jobs such as large PDFs
+            delay = Math.min(delay * 1.5, this.maxPollInterval);
+            
+            const response = await fetch(statusUrl);
+            const job = await response.json().catch(() => ({}));
+            
+            if (response.status === 404 && ++notFound < this.maxNotFoundPolls) {
+                continue;
+            }
+            if (!response.ok) {
+                return { status: 'failed', error: job.error || 'Upload status unavailable' };
+            }
+            
+            notFound = 0;
+            this.setUploadProgress(job.progress);
+            if (job.status === 'done' || job.status === 'failed') {
+                return job;
+            }
+        }
+        
+        return { status: 'failed', error: 'Upload is taking too long. Please check back later.' };
+    }
+    
+    setUploadProgress(progress) {
+        if (this.fileUploadBtn && progress !== undefined) {
+            this.fileUploadBtn.title = `Processing... ${progress}%`;
+        }
+    }
+    
     validateFile(file) {
         // Check file type
         if (!this.allowedTypes.includes(file.type)) {
@@ -317,6 +366,7 @@ class FileUploadManager {
     setUploadState(isUploading) {
         if (this.fileUploadBtn) {
             this.fileUploadBtn.disabled = isUploading;
+            this.fileUploadBtn.title = 'Upload File';
             this.fileUploadBtn.innerHTML = isUploading 
                 ? '<i class="fas fa-spinner fa-spin"></i>' 
                 : '<i class="fas fa-paperclip"></i>';
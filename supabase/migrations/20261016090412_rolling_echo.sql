@@ -0,0 +1,55 @@
+/*
+  # Conversation summaries
+
+  1. New Tables
+    - `conversation_summaries` - Rolling summary of chat turns that no longer fit
+      the per-model context budget, one row per user or anonymous session
+      - `summarized_through_id` is the last `chat_messages.id` folded in, so each
+        update only summarizes newer turns
+
+  2. Security
+    - Enable RLS with the same ownership rules as `chat_messages`
+
+  3. Performance
+    - Unique lookups by user and by anonymous session
+*/
+
+CREATE TABLE IF NOT EXISTS conversation_summaries (
+  id serial PRIMARY KEY,
+  user_id text UNIQUE REFERENCES users(id) ON DELETE CASCADE,
+  session_id text,
+  summary text NOT NULL DEFAULT '',
+  summarized_through_id integer NOT NULL DEFAULT 0,
+  message_count integer NOT NULL DEFAULT 0,
+  created_at timestamptz DEFAULT now(),
+  updated_at timestamptz DEFAULT now()
+);
+
+ALTER TABLE conversation_summaries ENABLE ROW LEVEL SECURITY;
+
+-- RLS Policies for conversation_summaries table
+CREATE POLICY "Users can manage own conversation summary"
+  ON conversation_summaries
+  FOR ALL
+  TO authenticated
+  USING (auth.uid()::text = user_id);
+
+CREATE POLICY "Anonymous users can manage session conversation summary"
+  ON conversation_summaries
+  FOR ALL
+  TO anon
+  USING (user_id IS NULL);
+
+-- One summary per anonymous session
+CREATE UNIQUE INDEX IF NOT EXISTS idx_conversation_summaries_session
+  ON conversation_summaries(session_id)
+  WHERE user_id IS NULL;
+
+-- Context builder reads unsummarized turns newest first by id
+CREATE INDEX IF NOT EXISTS idx_chat_messages_user_id_id ON chat_messages(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id_id ON chat_messages(session_id, id);
+
+CREATE TRIGGER update_conversation_summaries_updated_at
+    BEFORE UPDATE ON conversation_summaries
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# app.py builds the application at import time; give it a throwaway database
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'cyberchat-test.db'))
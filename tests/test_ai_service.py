@@ -0,0 +1,52 @@
+import pytest
+
+from services import ai_service as ai_module
+from services.ai_service import AIService
+from services.content_store import ContentStore
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    store = ContentStore(root=str(tmp_path))
+    monkeypatch.setattr(ai_module, 'content_store', store)
+    service = AIService()
+    monkeypatch.setattr(service, '_resolve_model', lambda user_context, model=None: 'test/model')
+    monkeypatch.setattr(service, 'get_chat_response', lambda prompt, user_context, model: 'It shows a cat.')
+    service.store = store
+    return service
+
+
+def image_upload():
+    return {'type': 'image', 'filename': 'cat.png', 'content': 'aW1hZ2U=', 'sha256': 'abc123'}
+
+
+def test_image_summary_is_reused(service, monkeypatch):
+    calls = []
+    monkeypatch.setattr(service, 'describe_image', lambda *args: calls.append(1) or 'A cat on a sofa.')
+
+    assert service.process_file_content(image_upload(), 'user') == 'It shows a cat.'
+    assert service.process_file_content(image_upload(), 'user') == 'It shows a cat.'
+    assert len(calls) == 1
+
+
+def test_summary_of_failed_description_is_not_cached(service, monkeypatch):
+    calls = []
+    monkeypatch.setattr(service, 'describe_image', lambda *args: calls.append(1) or 'Error describing image.')
+
+    service.process_file_content(image_upload(), 'user')
+    service.process_file_content(image_upload(), 'user')
+
+    # Both the description and the summary built on it are retried
+    assert len(calls) == 2
+    assert service.store.get('summary:test/model', 'abc123') is None
+    assert service.store.get('describe', 'abc123') is None
+
+
+def test_coalesced_follower_does_not_take_a_key(monkeypatch):
+    acquired = []
+    monkeypatch.setattr(ai_module.key_registry, 'acquire', lambda service: acquired.append(service))
+    # Another caller's completion is handed over without compute() running
+    monkeypatch.setattr(ai_module.request_coalescer, 'run', lambda key, compute, shareable: 'Shared answer')
+
+    assert AIService().get_chat_response('hello', 'user', 'test/model') == 'Shared answer'
+    assert acquired == []
@@ -0,0 +1,56 @@
+import io
+import os
+import hashlib
+
+import pytest
+
+from services.blob_store import BlobStore, LocalBlobStore
+
+
+class FailingStream(io.RawIOBase):
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        raise OSError('disk full')
+
+
+def digest_of(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        BlobStore()
+
+
+def test_put_open_delete(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    digest = digest_of(b'hello')
+
+    assert store.put(digest, io.BytesIO(b'hello')) == digest
+    assert store.exists(digest)
+    with store.open(digest) as f:
+        assert f.read() == b'hello'
+    assert store.local_path(digest).startswith(str(tmp_path))
+    assert store.delete(digest)
+    assert not store.exists(digest)
+    assert store.local_path(digest) is None
+
+
+def test_failed_put_leaves_nothing_behind(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    digest = digest_of(b'hello')
+
+    with pytest.raises(OSError):
+        store.put(digest, FailingStream())
+
+    assert not store.exists(digest)
+    assert os.listdir(os.path.join(str(tmp_path), digest[:2])) == []
+
+
+def test_rejects_invalid_digests(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+
+    with pytest.raises(ValueError):
+        store.exists('../etc/passwd')
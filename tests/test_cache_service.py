@@ -0,0 +1,52 @@
+import pytest
+from flask import Flask
+
+from services.cache_service import CacheService
+
+
+@pytest.fixture
+def cache():
+    app = Flask(__name__)
+    with app.app_context():
+        yield CacheService()
+
+
+def test_get_or_compute_caches_value(cache):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return ['message']
+
+    assert cache.get_or_compute('history', compute) == ['message']
+    assert cache.get_or_compute('history', compute) == ['message']
+    assert len(calls) == 1
+
+
+def test_delete_during_recompute_is_not_overwritten(cache):
+    def compute():
+        # A new message lands while the old history is still being read
+        cache.delete('history')
+        return ['old']
+
+    assert cache.get_or_compute('history', compute) == ['old']
+    assert cache.get('history') is None
+    assert cache.get_stats()['stampede']['discarded'] == 1
+
+
+def test_tag_invalidation_during_recompute_is_not_overwritten(cache):
+    def compute():
+        cache.invalidate_tag('user:1')
+        return ['old']
+
+    cache.get_or_compute('history', compute, tags=['user:1'])
+
+    assert cache.get('history') is None
+
+
+def test_recompute_after_delete_is_stored(cache):
+    cache.get_or_compute('history', lambda: ['old'])
+    cache.delete('history')
+
+    assert cache.get_or_compute('history', lambda: ['new']) == ['new']
+    assert cache.get_or_compute('history', lambda: ['unused']) == ['new']
@@ -0,0 +1,130 @@
+import pytest
+
+from app import app, db
+from models import ChatMessage, ConversationSummary
+from services import context_builder as context_module
+from services.ai_service import SYSTEM_PROMPT
+from services.context_builder import ContextBuilder
+from services.token_counter import token_counter, MESSAGE_OVERHEAD
+
+SESSION = 'context-session'
+
+
+class RecordingJobs:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, owner, fn, *args, **kwargs):
+        self.submitted.append(args)
+
+
+@pytest.fixture
+def ctx():
+    with app.test_request_context():
+        yield
+        ChatMessage.query.filter_by(session_id=SESSION).delete()
+        ConversationSummary.query.filter_by(session_id=SESSION).delete()
+        db.session.commit()
+
+
+@pytest.fixture
+def builder(ctx):
+    builder = ContextBuilder(RecordingJobs())
+    builder.summary_batch = 2
+    return builder
+
+
+def add_turns(count):
+    rows = []
+    for n in range(count):
+        row = ChatMessage(session_id=SESSION, message_type='user' if n % 2 == 0 else 'assistant',
+                          content=f"turn {n} " + "words " * 50)
+        db.session.add(row)
+        rows.append(row)
+    db.session.commit()
+    return rows
+
+
+def fits(message, rows, summary=None):
+    """Budget that leaves room for exactly these rows"""
+    budget = token_counter.count(SYSTEM_PROMPT) + token_counter.count(message) + 2 * MESSAGE_OVERHEAD
+    if summary:
+        budget += token_counter.count(f"Summary of the earlier conversation:\n{summary}") + MESSAGE_OVERHEAD
+    return budget + sum(token_counter.count(row.content) + MESSAGE_OVERHEAD for row in rows)
+
+
+def reply(monkeypatch, text, during=None):
+    def get_chat_response(self, prompt, user_context, model):
+        if during:
+            during()
+        return text
+
+    monkeypatch.setattr(context_module.AIService, 'get_chat_response', get_chat_response)
+
+
+def test_build_keeps_newest_turns_within_budget(builder):
+    rows = add_turns(6)
+    builder.default_budget = fits('next', rows[-3:])
+
+    history = builder.build(None, SESSION, None, 'next')
+
+    assert [turn['content'] for turn in history] == [row.content for row in rows[-3:]]
+    # The three turns that overflowed are queued for folding, up to the oldest one kept
+    assert builder.job_service.submitted == [(None, SESSION, rows[3].id)]
+
+
+def test_build_prefixes_summary_and_skips_folded_turns(builder):
+    rows = add_turns(4)
+    db.session.add(ConversationSummary(session_id=SESSION, summary='Earlier: hello',
+                                       summarized_through_id=rows[1].id))
+    db.session.commit()
+    builder.default_budget = fits('next', rows, summary='Earlier: hello')
+
+    history = builder.build(None, SESSION, None, 'next')
+
+    assert history[0] == {'role': 'system', 'content': "Summary of the earlier conversation:\nEarlier: hello"}
+    assert [turn['content'] for turn in history[1:]] == [row.content for row in rows[2:]]
+    assert builder.job_service.submitted == []
+
+
+def test_fold_creates_then_advances_summary(builder, monkeypatch):
+    rows = add_turns(6)
+    reply(monkeypatch, 'Summary one')
+
+    assert builder.fold(None, SESSION, rows[3].id) == {'summarized_through_id': rows[2].id}
+
+    reply(monkeypatch, 'Summary two')
+    assert builder.fold(None, SESSION, rows[5].id) == {'summarized_through_id': rows[4].id}
+    summary = ConversationSummary.query.filter_by(session_id=SESSION).one()
+    assert (summary.summary, summary.summarized_through_id, summary.message_count) == ('Summary two', rows[4].id, 5)
+
+
+def test_fold_does_not_overwrite_a_newer_watermark(builder, monkeypatch):
+    rows = add_turns(6)
+    db.session.add(ConversationSummary(session_id=SESSION, summary='Old', summarized_through_id=rows[0].id))
+    db.session.commit()
+
+    def other_worker_folds():
+        ConversationSummary.query.filter_by(session_id=SESSION).update({'summarized_through_id': rows[3].id})
+        db.session.commit()
+
+    reply(monkeypatch, 'Stale', during=other_worker_folds)
+
+    assert builder.fold(None, SESSION, rows[4].id) == {'summarized_through_id': rows[0].id}
+    summary = ConversationSummary.query.filter_by(session_id=SESSION).one()
+    assert (summary.summary, summary.summarized_through_id) == ('Old', rows[3].id)
+
+
+def test_fold_racing_clear_does_not_restore_summary(builder, monkeypatch):
+    rows = add_turns(4)
+
+    def clear_chat():
+        ChatMessage.query.filter_by(session_id=SESSION).delete()
+        builder.clear(None, SESSION)
+        db.session.commit()
+
+    reply(monkeypatch, 'Summary of a cleared chat', during=clear_chat)
+
+    builder.fold(None, SESSION, rows[3].id)
+
+    assert ConversationSummary.query.filter_by(session_id=SESSION).count() == 0
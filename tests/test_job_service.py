@@ -0,0 +1,80 @@
+import os
+import time
+import threading
+
+import pytest
+from flask import Flask
+
+from services.cache_service import CacheService
+from services.job_service import JobFailed, JobService
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['JOB_STATUS_DIR'] = str(tmp_path)
+    with app.app_context():
+        yield app
+
+
+def worker():
+    """One gunicorn worker: its own in-memory cache and job pool"""
+    return JobService(CacheService())
+
+
+def wait(service, job_id):
+    for _ in range(100):
+        job = service.get(job_id)
+        if job and job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError('job did not finish')
+
+
+def test_status_is_visible_to_other_workers_without_redis(app):
+    runner, poller = worker(), worker()
+    release = threading.Event()
+
+    def job(job_id):
+        release.wait(5)
+        return {'response': 'ok'}
+
+    job_id = runner.submit('owner-1', job, filename='notes.txt')
+
+    assert poller.get(job_id, owner='owner-1')['status'] == 'queued'
+    assert poller.get(job_id, owner='owner-2') is None
+
+    release.set()
+    job = wait(poller, job_id)
+    assert job['status'] == 'done'
+    assert job['result'] == {'response': 'ok'}
+    assert job['filename'] == 'notes.txt'
+
+
+def test_failed_job_reports_error_fields(app):
+    service = worker()
+
+    def job(job_id):
+        raise JobFailed('Rejected', messages_remaining=3)
+
+    job_id = service.submit('owner-1', job)
+    job = wait(service, job_id)
+
+    assert job['status'] == 'failed'
+    assert job['error'] == 'Rejected'
+    assert job['messages_remaining'] == 3
+
+
+def test_unknown_and_malformed_job_ids(app):
+    service = worker()
+
+    assert service.get('0' * 32) is None
+    assert service.get('../' + os.path.basename(app.config['JOB_STATUS_DIR'])) is None
+
+
+def test_expired_status_is_not_returned(app):
+    service = worker()
+    service.status_timeout = -1
+    job_id = service.submit('owner-1', lambda job_id: {})
+
+    assert service.get(job_id) is None
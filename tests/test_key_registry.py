@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+pytest.importorskip('requests')
+
+from services.key_registry import KeyHealthRegistry, KeyState
+
+
+def make_registry(*keys):
+    registry = KeyHealthRegistry()
+    registry._ensure_loaded = lambda: None
+    registry._keys = {'openrouter': list(keys)}
+    return registry
+
+
+def open_key(key_id=1):
+    key = KeyState(key_id, 'openrouter', f'key-{key_id}', f'secret-{key_id}')
+    key.state = KeyState.OPEN
+    key.open_until = time.time() - 1
+    return key
+
+
+def test_half_open_key_admits_one_trial():
+    key = open_key()
+    registry = make_registry(key)
+
+    assert registry.acquire('openrouter') is key
+    assert key.state == KeyState.HALF_OPEN
+    assert registry.acquire('openrouter') is None
+
+
+def test_successful_trial_closes_breaker():
+    key = open_key()
+    registry = make_registry(key)
+
+    registry.acquire('openrouter')
+    registry.report(key, 200)
+
+    assert key.state == KeyState.CLOSED
+    assert registry.acquire('openrouter') is key
+    assert registry.acquire('openrouter') is key
+
+
+def test_failed_trial_reopens_breaker():
+    key = open_key()
+    registry = make_registry(key)
+
+    registry.acquire('openrouter')
+    registry.report(key, 503)
+
+    assert key.state == KeyState.OPEN
+    assert registry.acquire('openrouter') is None
+
+
+def test_stale_trial_is_replaced():
+    key = open_key()
+    registry = make_registry(key)
+    registry.trial_timeout = 0
+
+    assert registry.acquire('openrouter') is key
+    assert registry.acquire('openrouter') is key
+
+
+def test_report_wakes_worker_only_on_state_change():
+    key = KeyState(1, 'openrouter', 'key-1', 'secret-1')
+    registry = make_registry(key)
+
+    registry.report(key, 200)
+    assert not registry._wakeup.is_set()
+
+    registry.report(key, 429)
+    assert registry._wakeup.is_set()
@@ -0,0 +1,50 @@
+import pytest
+
+from services import malware_scanner
+from services.malware_scanner import PatternScanner, default_scanner
+
+
+def feed_all(chunks, scanner=default_scanner):
+    scan = scanner.stream()
+    for chunk in chunks:
+        if scan.feed(chunk):
+            break
+    return scan.matched
+
+
+def test_finds_pattern_case_insensitively():
+    assert default_scanner.find(b'hello <SCRIPT>alert(1)</script>') == b'<script'
+    assert default_scanner.find(b'plain text') is None
+
+
+@pytest.mark.parametrize('size', [1, 2, 3])
+def test_finds_pattern_split_across_small_chunks(size):
+    data = b'xx<script>'
+    chunks = [data[i:i + size] for i in range(0, len(data), size)]
+
+    assert feed_all(chunks) == b'<script'
+
+
+def test_finds_pattern_split_across_uneven_chunks():
+    assert feed_all([b'xx<s', b'cr', b'ipt>']) == b'<script'
+    assert feed_all([b'document', b'.', b'coo', b'kie']) == b'document.cookie'
+
+
+def test_small_chunks_without_pattern_do_not_match():
+    data = b'<scrip t> java script : eval ('
+    assert feed_all([data[i:i + 2] for i in range(0, len(data), 2)]) is None
+
+
+def test_finds_pattern_across_window_boundary(monkeypatch):
+    monkeypatch.setattr(malware_scanner, 'WINDOW_SIZE', 8)
+    data = b'aaaaaa<script>bbbbbbbb'
+
+    assert default_scanner.find(data) == b'<script'
+
+
+def test_custom_patterns():
+    scanner = default_scanner.with_patterns([b'RM -RF'])
+
+    assert feed_all([b'sudo r', b'm -', b'rf /'], scanner) == b'rm -rf'
+    with pytest.raises(ValueError):
+        PatternScanner([])
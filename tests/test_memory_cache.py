@@ -0,0 +1,62 @@
+import time
+
+from services.memory_cache import MemoryCache
+
+
+def test_get_returns_stored_value():
+    cache = MemoryCache()
+    cache.set('a', {'x': 1})
+
+    assert cache.get('a') == {'x': 1}
+    assert cache.get('missing') is None
+    assert cache.get_stats()['hits'] == 1
+    assert cache.get_stats()['misses'] == 1
+
+
+def test_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_expired_entries_are_not_returned(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    cache = MemoryCache(default_timeout=10)
+    cache.set('short', 1)
+    cache.set('forever', 2, timeout=0)
+
+    now[0] += 11
+
+    assert cache.get('short') is None
+    assert cache.get('forever') == 2
+    assert cache.get_stats()['expirations'] == 1
+
+
+def test_delete_tag_removes_tagged_keys_only():
+    cache = MemoryCache()
+    cache.set('a', 1, tags=['user:1'])
+    cache.set('b', 2, tags=['user:1', 'chat'])
+    cache.set('c', 3, tags=['chat'])
+
+    assert sorted(cache.delete_tag('user:1')) == ['a', 'b']
+    assert cache.get('a') is None
+    assert cache.get('c') == 3
+    assert cache.delete_tag('chat') == ['c']
+    assert cache.get_stats()['tags'] == 0
+
+
+def test_overwrite_drops_old_tags():
+    cache = MemoryCache()
+    cache.set('a', 1, tags=['old'])
+    cache.set('a', 2, tags=['new'])
+
+    assert cache.delete_tag('old') == []
+    assert cache.get('a') == 2
@@ -0,0 +1,52 @@
+import pytest
+
+from services import model_catalog as catalog_module
+from services.model_catalog import ModelCatalog
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+@pytest.fixture
+def catalog():
+    catalog = ModelCatalog()
+    # No refresh thread; tests swap snapshots in by hand
+    catalog._ensure_started = lambda: None
+    return catalog
+
+
+@pytest.mark.parametrize('model', [['openai/gpt-4'], {'id': 'openai/gpt-4'}, 42, None, ''])
+def test_non_string_model_ids_are_invalid(catalog, model):
+    assert catalog.is_valid(model) is False
+
+
+def test_fallback_and_default_models_are_valid(catalog):
+    assert catalog.is_valid('openai/gpt-4')
+    assert catalog.is_valid(catalog.default_model)
+    assert not catalog.is_valid('nobody/unknown-model')
+
+
+def test_refresh_swaps_in_fetched_models(catalog, monkeypatch):
+    data = {'data': [{'id': 'new/model', 'name': 'New', 'context_length': 9000, 'pricing': {'prompt': '0.1'}}]}
+    monkeypatch.setattr(catalog_module.http_service, 'get', lambda url, timeout=None: FakeResponse(200, data))
+    _, old_etag = catalog.listing()
+
+    assert catalog.refresh()
+    assert catalog.is_valid('new/model')
+    assert not catalog.is_valid('openai/gpt-4')
+    assert catalog.context_length('new/model') == 9000
+    assert catalog.listing()[1] != old_etag
+
+
+def test_failed_refresh_keeps_snapshot(catalog, monkeypatch):
+    monkeypatch.setattr(catalog_module.http_service, 'get', lambda url, timeout=None: FakeResponse(503))
+
+    assert not catalog.refresh()
+    assert catalog.is_valid('openai/gpt-4')
+    assert catalog.get_stats()['failures'] == 1
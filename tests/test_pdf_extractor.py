@@ -0,0 +1,116 @@
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+from services import pdf_extractor as pdf_module
+from services.pdf_extractor import TRUNCATION_MARKER, PDFExtractor, ShardTask, extract_page_range
+
+
+def make_pdf(pages, hang_page=None):
+    """Minimal PDF with one line of text per page; hang_page reads HANG instead"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{4 + 2 * n} 0 R" for n in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for n in range(pages):
+        label = "HANG" if n == hang_page else f"Page {n}"
+        stream = f"BT /F1 12 Tf 72 720 Td ({label}) Tj ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * n} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def hanging_extract(source, start, stop):
+    """Pool-side extraction that never returns for a HANG page"""
+    texts = extract_page_range(source, start, stop)
+    if any(text and text.strip() == "HANG" for text in texts):
+        time.sleep(60)
+    return texts
+
+
+@pytest.fixture
+def extractor():
+    extractor = PDFExtractor()
+    extractor.max_workers = 2
+    extractor.pages_per_shard = 2
+    yield extractor
+    if extractor._pool is not None:
+        extractor._pool.shutdown(cancel_futures=True)
+
+
+def test_sharded_extraction_keeps_page_order(extractor, monkeypatch):
+    paths = []
+    mkstemp = tempfile.mkstemp
+
+    def recording_mkstemp(*args, **kwargs):
+        fd, path = mkstemp(*args, **kwargs)
+        paths.append(path)
+        return fd, path
+
+    monkeypatch.setattr(pdf_module.tempfile, 'mkstemp', recording_mkstemp)
+
+    text = extractor.extract_text(make_pdf(7), 7, 100000)
+
+    assert text.split("\n")[:7] == [f"Page {n}" for n in range(7)]
+    # Shards read one temp copy of the document, removed afterwards
+    assert len(paths) == 1
+    assert not os.path.exists(paths[0])
+
+
+def test_text_limit_truncates(extractor):
+    text = extractor.extract_text(make_pdf(7), 7, 10)
+
+    assert text.startswith("Page 0\nPage 1\n")
+    assert text.endswith(TRUNCATION_MARKER)
+
+
+def test_deadlines_scale_with_pages_per_wave(extractor, monkeypatch):
+    class FakePool:
+        def submit(self, fn, *args):
+            return None
+
+    monkeypatch.setattr(pdf_module.time, 'monotonic', lambda: 100.0)
+    monkeypatch.setattr(extractor, '_pool_for_process', lambda: FakePool())
+    extractor.page_timeout = 5
+    tasks = [ShardTask(start, start + 2) for start in range(0, 10, 2)]
+
+    extractor._submit(tasks, 'doc.pdf')
+
+    assert [task.deadline for task in tasks] == [110.0, 110.0, 120.0, 120.0, 130.0]
+
+
+def test_hung_page_spares_concurrent_upload(extractor):
+    # One upload's hung page recycles the shared pool under the other upload's shards
+    extractor.extract_fn = hanging_extract
+    extractor.page_timeout = 1
+    results = {}
+
+    def upload(name, content):
+        results[name] = extractor.extract_text(content, 8, 100000)
+
+    threads = [
+        threading.Thread(target=upload, args=('hung', make_pdf(8, hang_page=5))),
+        threading.Thread(target=upload, args=('clean', make_pdf(8))),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+
+    assert results['clean'].split("\n")[:8] == [f"Page {n}" for n in range(8)]
+    # Only the page that hangs is lost, not the rest of its shard
+    assert results['hung'].split("\n")[:7] == [f"Page {n}" for n in range(8) if n != 5]
+    assert "HANG" not in results['hung']
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+
+from app import app, db
+from models import User
+from services.cache_service import CacheService
+from services.quota_service import QuotaService
+
+
+class Anonymous:
+    is_authenticated = False
+
+
+@pytest.fixture
+def ctx():
+    with app.test_request_context():
+        yield
+
+
+@pytest.fixture
+def quota(ctx):
+    return QuotaService(CacheService())
+
+
+@pytest.fixture
+def user(ctx):
+    user = User(id='quota-user', daily_message_limit=2, messages_used_today=0,
+                last_message_date=datetime.utcnow().date())
+    db.session.merge(user)
+    db.session.commit()
+    yield db.session.get(User, 'quota-user')
+    User.query.filter_by(id='quota-user').delete()
+    db.session.commit()
+
+
+def test_anonymous_quota_is_enforced(quota):
+    quota.anonymous_limit = 2
+
+    assert quota.consume(Anonymous(), 'session-1') == (True, 1)
+    assert quota.consume(Anonymous(), 'session-1') == (True, 0)
+    assert quota.consume(Anonymous(), 'session-1') == (False, 0)
+
+
+def test_user_quota_is_enforced(quota, user):
+    assert quota.consume(user, None) == (True, 1)
+    assert quota.consume(user, None) == (True, 0)
+    assert quota.consume(user, None)[0] is False
+
+
+def test_redis_outage_does_not_exhaust_anonymous_quota(quota):
+    def unavailable(**kwargs):
+        raise ConnectionError('redis down')
+
+    quota._consume_script = unavailable
+
+    allowed, remaining = quota.consume(Anonymous(), 'session-2')
+    assert allowed is True
+    assert remaining == quota.anonymous_limit
+
+
+def test_database_outage_does_not_exhaust_user_quota(quota, user, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise ConnectionError('database down')
+
+    monkeypatch.setattr(db.session, 'execute', unavailable)
+
+    allowed, remaining = quota.consume(user, None)
+    assert allowed is True
+    assert remaining == 2
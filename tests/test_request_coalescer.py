@@ -0,0 +1,100 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.request_coalescer import RequestCoalescer
+
+
+def is_ok(result):
+    return not result.startswith('❌')
+
+
+@pytest.fixture
+def coalescer():
+    coalescer = RequestCoalescer()
+    coalescer.enabled = True
+    coalescer.redis_url = None
+    coalescer.wait_timeout = 5
+    return coalescer
+
+
+def run_with_waiter(coalescer, leader_result, waiter_result='waiter'):
+    """Start a leader that blocks, then a waiter for the same key; returns both results"""
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def leader_compute():
+        calls.append('leader')
+        started.set()
+        release.wait(5)
+        if isinstance(leader_result, Exception):
+            raise leader_result
+        return leader_result
+
+    def waiter_compute():
+        calls.append('waiter')
+        return waiter_result
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(coalescer.run, 'k', leader_compute, is_ok)
+        started.wait(5)
+        waiter = pool.submit(coalescer.run, 'k', waiter_compute, is_ok)
+        # Let the waiter reach the shared future before the leader finishes
+        time.sleep(0.1)
+        release.set()
+        return leader, waiter, calls
+
+
+def test_key_ignores_whitespace(coalescer):
+    a = coalescer.key('m', [{'role': 'user', 'content': 'hello   world'}], 0.7, 100)
+    b = coalescer.key('m', [{'role': 'User', 'content': ' hello world '}], 0.7, 100)
+    c = coalescer.key('m', [{'role': 'user', 'content': 'hello world'}], 0.5, 100)
+
+    assert a == b
+    assert a != c
+
+
+def test_waiter_shares_successful_result(coalescer):
+    leader, waiter, calls = run_with_waiter(coalescer, 'answer')
+
+    assert leader.result() == 'answer'
+    assert waiter.result() == 'answer'
+    assert calls == ['leader']
+    assert coalescer.get_stats()['coalesced'] == 1
+
+
+def test_waiter_stops_following_slow_leader(coalescer):
+    coalescer.wait_timeout = 0.05
+
+    leader, waiter, calls = run_with_waiter(coalescer, 'answer')
+
+    assert waiter.result() == 'waiter'
+    assert leader.result() == 'answer'
+    assert calls == ['leader', 'waiter']
+    assert coalescer.get_stats()['fallbacks'] == 1
+
+
+def test_waiter_does_not_receive_leader_error(coalescer):
+    leader, waiter, calls = run_with_waiter(coalescer, '❌ Rate limit exceeded')
+
+    assert leader.result() == '❌ Rate limit exceeded'
+    assert waiter.result() == 'waiter'
+    assert calls == ['leader', 'waiter']
+    assert coalescer.get_stats()['fallbacks'] == 1
+
+
+def test_waiter_does_not_receive_leader_exception(coalescer):
+    leader, waiter, calls = run_with_waiter(coalescer, RuntimeError('boom'))
+
+    with pytest.raises(RuntimeError):
+        leader.result()
+    assert waiter.result() == 'waiter'
+
+
+def test_sequential_calls_are_not_merged(coalescer):
+    assert coalescer.run('k', lambda: 'first', is_ok) == 'first'
+    assert coalescer.run('k', lambda: 'second', is_ok) == 'second'
+    assert coalescer.get_stats()['inflight'] == 0
@@ -0,0 +1,62 @@
+import pytest
+from flask import Flask
+
+from services import search_service as search_module
+from services.cache_service import CacheService
+from services.search_service import SearchService
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+@pytest.fixture
+def search(monkeypatch):
+    calls = []
+    payload = {'Abstract': 'yes', 'AbstractText': 'Tor is an anonymity network.'}
+
+    def get(url, params=None, **kwargs):
+        calls.append(params['q'])
+        return FakeResponse(payload)
+
+    monkeypatch.setattr(search_module.upstream_gateway, 'get', get)
+    app = Flask(__name__)
+    with app.app_context():
+        service = SearchService(CacheService())
+        service.calls = calls
+        service.payload = payload
+        yield service
+
+
+def test_cached_results_echo_each_callers_query(search):
+    first = search.search('What is TOR')
+    second = search.search('what  is tor')
+
+    assert 'Search Results for: What is TOR' in first
+    assert 'Search Results for: what  is tor' in second
+    assert 'Tor is an anonymity network.' in second
+    assert search.calls == ['What is TOR']
+
+
+def test_no_results_are_negative_cached(search):
+    search.payload.clear()
+
+    assert "couldn't find specific results" in search.search('nothing here')
+    assert "couldn't find specific results" in search.search('Nothing Here')
+    assert search.calls == ['nothing here']
+
+
+def test_waiter_reuses_negative_result(search):
+    search.payload.clear()
+    search.search('nothing here')
+
+    # A caller that waited on the leader recomputes through _compute
+    with pytest.raises(search_module.NoSearchResults):
+        search._compute(search.cache_key('nothing here'), 'nothing here')
+    assert search.calls == ['nothing here']
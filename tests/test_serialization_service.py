@@ -0,0 +1,49 @@
+import json
+from datetime import datetime
+
+from services.serialization_service import (
+    RAW_HEADER,
+    ZLIB_HEADER,
+    SerializationService,
+    json_dumps,
+    json_loads,
+)
+
+
+class Row:
+    def to_dict(self):
+        return {'id': 7, 'name': 'row'}
+
+
+def test_small_values_are_stored_uncompressed():
+    codec = SerializationService(compress_threshold=1024)
+    payload = codec.dumps({'a': 1})
+
+    assert payload.startswith(RAW_HEADER)
+    assert codec.loads(payload) == {'a': 1}
+
+
+def test_large_values_round_trip_through_zlib():
+    codec = SerializationService(compress_threshold=64, compression='zlib')
+    value = {'messages': ['hello world'] * 100}
+    payload = codec.dumps(value)
+
+    assert payload.startswith(ZLIB_HEADER)
+    assert len(payload) < len(json_dumps(value))
+    assert codec.loads(payload) == value
+
+
+def test_unframed_legacy_json_is_still_readable():
+    codec = SerializationService()
+
+    assert codec.loads(json.dumps({'legacy': True})) == {'legacy': True}
+
+
+def test_json_dumps_encodes_models_and_datetimes():
+    value = {'row': Row(), 'at': datetime(2024, 1, 2, 3, 4, 5), 'tags': {'x'}}
+
+    assert json_loads(json_dumps(value)) == {
+        'row': {'id': 7, 'name': 'row'},
+        'at': '2024-01-02T03:04:05',
+        'tags': ['x'],
+    }
@@ -0,0 +1,128 @@
+import pytest
+
+from services import similarity_cache as similarity_module
+from services.similarity_cache import SimilarityCache, content_words
+
+MODEL = 'openai/gpt-3.5-turbo'
+PROMPT = 'How do I reset my router password?'
+PARAPHRASE = 'how can I reset the router password, please'
+
+
+def make_cache(**settings):
+    cache = SimilarityCache()
+    cache.enabled = True
+    cache.redis_url = None
+    cache.audit_rate = 0
+    for name, value in settings.items():
+        setattr(cache, name, value)
+    return cache
+
+
+def test_content_words_drop_stopwords():
+    assert content_words(PROMPT) == ['how', 'reset', 'router', 'password']
+
+
+def test_different_question_words_do_not_hit():
+    cache = make_cache()
+    cache.store(MODEL, 'When was Albert Einstein born?', 'March 14, 1879.')
+
+    assert cache.lookup(MODEL, 'Where was Albert Einstein born?') is None
+    assert cache.lookup(MODEL, 'Why was Albert Einstein born?') is None
+
+
+def test_paraphrase_hits_and_unrelated_prompt_misses():
+    cache = make_cache()
+    cache.store(MODEL, PROMPT, 'Hold the reset button for ten seconds.')
+
+    assert cache.lookup(MODEL, PARAPHRASE).response == 'Hold the reset button for ten seconds.'
+    assert cache.lookup(MODEL, 'Explain TCP congestion control windows') is None
+    assert cache.lookup('other/model', PARAPHRASE) is None
+
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['lookups']) == (1, 2, 3)
+
+
+def test_short_prompts_are_skipped():
+    cache = make_cache()
+    cache.store(MODEL, 'hi there', 'Hello!')
+
+    assert cache.lookup(MODEL, 'hi there') is None
+    assert cache.get_stats()['skipped'] == 1
+
+
+def test_failed_audit_drops_entry():
+    cache = make_cache()
+    cache.store(MODEL, PROMPT, 'Hold the reset button for ten seconds.')
+    entry = cache.lookup(MODEL, PARAPHRASE)
+
+    assert cache.audit(MODEL, entry, 'Hold the reset button for ten seconds, then log in.')
+    assert not cache.audit(MODEL, entry, 'Routers forward packets between networks.')
+    assert cache.lookup(MODEL, PARAPHRASE) is None
+    assert cache.get_stats()['false_hits'] == 1
+
+
+def test_max_entries_evicts_oldest():
+    cache = make_cache(max_entries=1)
+    cache.store(MODEL, PROMPT, 'first')
+    cache.store(MODEL, 'Which port does SSH listen on by default', 'second')
+
+    assert cache.lookup(MODEL, PARAPHRASE) is None
+    assert cache.get_stats()['entries'] == {MODEL: 1}
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    """Two workers' caches sharing one Redis"""
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(similarity_module, 'REDIS_AVAILABLE', True)
+    monkeypatch.setattr(similarity_module.redis, 'from_url',
+                        lambda url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs))
+
+    def worker(**settings):
+        return make_cache(redis_url='redis://shared', sync_interval=0, **settings)
+
+    return worker
+
+
+def test_entries_sync_to_other_workers(workers):
+    a, b = workers(), workers()
+    a.store(MODEL, PROMPT, 'Hold the reset button for ten seconds.')
+
+    assert b.lookup(MODEL, PARAPHRASE).response == 'Hold the reset button for ten seconds.'
+
+
+def test_audit_removal_syncs_to_other_workers(workers):
+    a, b = workers(), workers()
+    a.store(MODEL, PROMPT, 'Hold the reset button for ten seconds.')
+    entry = b.lookup(MODEL, PARAPHRASE)
+
+    assert not a.audit(MODEL, entry, 'Routers forward packets between networks.')
+    assert b.lookup(MODEL, PARAPHRASE) is None
+    assert b.get_stats()['entries'] == {MODEL: 0}
+
+
+def test_locally_evicted_entries_are_not_resynced(workers):
+    a, b = workers(), workers(max_entries=1)
+    a.store(MODEL, PROMPT, 'first')
+    a.store(MODEL, 'Which port does SSH listen on by default', 'second')
+
+    b.lookup(MODEL, 'Which port does SSH listen on by default')
+    synced = dict(b._indexes[MODEL].entries)
+    b.lookup(MODEL, 'Which port does SSH listen on by default')
+
+    assert b._indexes[MODEL].entries == synced
+    assert b.lookup(MODEL, PARAPHRASE) is None
+
+
+def test_expired_entries_are_cleaned_from_redis(workers, monkeypatch):
+    a, b = workers(), workers()
+    a.store(MODEL, PROMPT, 'stale')
+    later = similarity_module.time.time() + a.timeout + 1
+    monkeypatch.setattr(similarity_module.time, 'time', lambda: later)
+
+    assert b.lookup(MODEL, PARAPHRASE) is None
+    entries_key, added_key, _, _ = b._redis_keys(MODEL)
+    assert b._redis.hlen(entries_key) == 0
+    assert b._redis.zcard(added_key) == 0
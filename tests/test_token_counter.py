@@ -0,0 +1,57 @@
+import pytest
+
+from services import token_counter as token_module
+from services.token_counter import MESSAGE_OVERHEAD, TokenCounter, estimate_tokens
+
+# No published tokenizer, so counts use the heuristic and need no encoding download
+HEURISTIC_MODEL = 'anthropic/claude-3-haiku'
+
+
+@pytest.fixture
+def counter(monkeypatch):
+    monkeypatch.setattr(token_module.model_catalog, 'context_length', lambda model: None)
+    return TokenCounter()
+
+
+def test_estimate_tokens_ascii_and_non_ascii():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('abcd') == 1
+    assert estimate_tokens('abcde') == 2
+    # Three-byte CJK characters are charged well above the ASCII rate
+    assert estimate_tokens('漢字漢字') > estimate_tokens('abcd')
+
+
+def test_count_messages_adds_overhead(counter):
+    messages = [{'role': 'user', 'content': 'abcd'}, {'role': 'assistant', 'content': None}]
+
+    assert counter.count_messages(messages, HEURISTIC_MODEL) == 1 + 2 * MESSAGE_OVERHEAD + 2
+
+
+def test_truncate_fits_budget(counter):
+    text = 'word ' * 200
+
+    cut = counter.truncate(text, 10, HEURISTIC_MODEL)
+    assert counter.count(cut, HEURISTIC_MODEL) <= 10
+    assert text.startswith(cut)
+    assert counter.truncate('short', 10, HEURISTIC_MODEL) == 'short'
+    assert counter.truncate(text, 0, HEURISTIC_MODEL) == ''
+
+
+def test_budgets_follow_context_window(counter):
+    counter.context_limits = {'small/model': 2000}
+    counter.default_context_limit = 4096
+    counter.max_output_tokens = 1000
+    counter.min_output_tokens = 256
+
+    assert counter.context_limit('small/model') == 2000
+    assert counter.context_limit('unknown/model') == 4096
+    assert counter.prompt_budget('small/model') == 1000
+    assert counter.output_budget('small/model', 1500) == 500
+    assert counter.output_budget('small/model', 1900) == 256
+    assert counter.output_budget('unknown/model', 100) == 1000
+
+
+def test_family_encoding_lookup(counter):
+    assert counter._encoding_name('openai/gpt-4o-mini') == 'o200k_base'
+    assert counter._encoding_name('openai/gpt-4-turbo') == 'cl100k_base'
+    assert counter._encoding_name(HEURISTIC_MODEL) is None
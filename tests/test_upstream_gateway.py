@@ -0,0 +1,45 @@
+import time
+import asyncio
+
+import pytest
+import requests
+
+from services.upstream_gateway import GatewayResponse, UpstreamGateway
+
+
+def test_request_returns_response():
+    gateway = UpstreamGateway()
+
+    async def fetch(method, url, **kwargs):
+        return GatewayResponse(200, {'Content-Type': 'application/json'}, b'{"ok": true}')
+
+    gateway.fetch = fetch
+
+    response = gateway.get('https://example.com/')
+    assert response.status_code == 200
+    assert response.json() == {'ok': True}
+
+
+def test_request_wait_is_bounded_and_cancels_fetch():
+    gateway = UpstreamGateway()
+    gateway.total_timeout = 0.1
+    gateway.default_timeout = (0.1, 0.1)
+    cancelled = []
+
+    async def fetch(method, url, **kwargs):
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(url)
+            raise
+
+    gateway.fetch = fetch
+
+    with pytest.raises(requests.exceptions.Timeout):
+        gateway.get('https://example.com/slow?key=secret')
+
+    for _ in range(50):
+        if cancelled:
+            break
+        time.sleep(0.01)
+    assert cancelled == ['https://example.com/slow?key=secret']